@@ -0,0 +1,367 @@
+"""Storage backends, which persist `Database` contents"""
+
+# ©️ Dan Gazizullin, 2021-2023
+# This file is a part of Hikka Userbot
+# 🌐 https://github.com/hikariatama/Hikka
+# You can redistribute it and/or modify it under the terms of the GNU AGPLv3
+# 🔑 https://www.gnu.org/licenses/agpl-3.0.html
+# Netfoll Team modifided Hikka files for Netfoll
+# 🌐 https://github.com/MXRRI/Netfoll
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import typing
+
+try:
+    import redis
+except ImportError as e:
+    if "RAILWAY" in os.environ:
+        raise e
+
+logger = logging.getLogger(__name__)
+
+
+class StorageBackend:
+    """
+    Base class for database storage backends.
+    `prepare` is called on the event loop, so it sees consistent data,
+    while `write` is executed in a worker thread
+    """
+
+    # Whether owners should be loaded on first access rather than at startup
+    lazy = False
+    # Whether data is stored on remote endpoint
+    remote = False
+
+    def read(self) -> dict:
+        """Read the whole database"""
+        raise NotImplementedError
+
+    def read_owner(self, owner: str) -> typing.Optional[dict]:
+        """Read single owner of the database. Used by lazy backends"""
+        return None
+
+    def owners(self) -> typing.List[str]:
+        """List all stored owners. Used by lazy backends"""
+        return []
+
+    def subscribe(
+        self,
+        callback: typing.Callable[[str, typing.Optional[dict]], None],
+    ) -> bool:
+        """
+        Listen for changes, made by other processes
+        :param callback: Function, called from worker thread with changed
+                         owner and its new value (`None` if it was removed)
+        :return: `True` if backend supports it
+        """
+        return False
+
+    def prepare(
+        self,
+        db: dict,
+        keys: typing.Set[typing.Tuple[str, str]],
+        owners: typing.Set[str],
+        wipe: bool,
+    ) -> typing.Any:
+        """
+        Serialize changes of database
+        :param db: Database itself
+        :param keys: Changed `(owner, key)` pairs
+        :param owners: Owners, which must be rewritten completely
+        :param wipe: Whether the database was cleared
+        :return: Payload to pass to `write`
+        """
+        raise NotImplementedError
+
+    def write(self, payload: typing.Any):
+        """Write payload, previously returned by `prepare`"""
+        raise NotImplementedError
+
+
+class JSONFileBackend(StorageBackend):
+    """Stores the whole database in a single JSON file"""
+
+    def __init__(self, path: str):
+        self._path = path
+
+    def read(self) -> dict:
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            logger.warning("Database read failed! Creating new one...")
+            return {}
+
+    def prepare(self, db: dict, *_) -> str:
+        return json.dumps(db, ensure_ascii=True)
+
+    def write(self, payload: str):
+        # Write to temporary file and replace the original one atomically,
+        # so the database won't be corrupted if process dies mid-write
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, self._path)
+
+
+class RedisBackend(StorageBackend):
+    """
+    Stores each owner of the database in a separate Redis key, so only
+    changed owners are published. Optionally listens for keyspace
+    notifications to pick up changes, made by other processes
+    """
+
+    lazy = True
+    remote = True
+
+    def __init__(self, uri: str, tg_id: int):
+        self._redis = redis.Redis.from_url(uri)
+        self._legacy_key = str(tg_id)
+        self._prefix = f"netfoll:{tg_id}:"
+        # Hashes of values, last written or read by this process. Used to
+        # distinguish own changes from the foreign ones in notifications
+        self._known = {}
+        self._pubsub_thread = None
+
+    def _key(self, owner: str) -> str:
+        return f"{self._prefix}{owner}"
+
+    def _keys(self) -> typing.List[bytes]:
+        return list(self._redis.scan_iter(match=f"{self._prefix}*"))
+
+    def migrate(self) -> bool:
+        """
+        Import database, stored by older versions in a single key.
+        Imported key is renamed, so it won't be imported again
+        :return: `True` if data was imported
+        """
+        if self._keys() or not self._redis.exists(self._legacy_key):
+            return False
+
+        try:
+            data = json.loads(self._redis.get(self._legacy_key).decode())
+        except Exception:
+            logger.exception("Error reading redis database")
+            return False
+
+        self.write(self.prepare(data, set(), set(), True))
+        self._redis.rename(self._legacy_key, f"{self._legacy_key}:migrated")
+        logger.info("Migrated %s owners to per-owner Redis keys", len(data))
+        return True
+
+    def read(self) -> dict:
+        return {owner: self.read_owner(owner) for owner in self.owners()}
+
+    def read_owner(self, owner: str) -> typing.Optional[dict]:
+        value = self._redis.get(self._key(owner))
+        self._known[str(owner)] = hash(value)
+        return json.loads(value) if value is not None else None
+
+    def owners(self) -> typing.List[str]:
+        return [key.decode()[len(self._prefix) :] for key in self._keys()]
+
+    def prepare(
+        self,
+        db: dict,
+        keys: typing.Set[typing.Tuple[str, str]],
+        owners: typing.Set[str],
+        wipe: bool,
+    ) -> typing.Tuple[bool, typing.Dict[str, typing.Optional[str]]]:
+        changed = {owner for owner, _ in keys} | owners
+        if wipe:
+            changed |= set(db)
+
+        return wipe, {
+            str(owner): (
+                json.dumps(dict.get(db, owner), ensure_ascii=True)
+                if owner in db
+                else None
+            )
+            for owner in changed
+        }
+
+    def write(
+        self,
+        payload: typing.Tuple[bool, typing.Dict[str, typing.Optional[str]]],
+    ):
+        wipe, changes = payload
+        stale = (
+            [
+                key
+                for key in self._keys()
+                if key.decode()[len(self._prefix) :] not in changes
+            ]
+            if wipe
+            else []
+        )
+
+        for owner, value in changes.items():
+            self._known[owner] = hash(value.encode() if value is not None else None)
+
+        with self._redis.pipeline() as pipe:
+            if stale:
+                pipe.delete(*stale)
+
+            for owner, value in changes.items():
+                if value is None:
+                    pipe.delete(self._key(owner))
+                else:
+                    pipe.set(self._key(owner), value)
+
+            pipe.execute()
+
+    def subscribe(
+        self,
+        callback: typing.Callable[[str, typing.Optional[dict]], None],
+    ) -> bool:
+        # Enable keyspace notifications for string commands and deletions,
+        # keeping the flags, which are already set on the server
+        try:
+            flags = self._redis.config_get("notify-keyspace-events").get(
+                "notify-keyspace-events",
+                "",
+            )
+            if not {"K", "$", "g"} <= set(flags) and "A" not in flags:
+                self._redis.config_set(
+                    "notify-keyspace-events",
+                    "".join(set(flags) | {"K", "$", "g"}),
+                )
+        except redis.exceptions.ResponseError:
+            logger.warning(
+                "Can't enable keyspace notifications on Redis server, make sure"
+                " notify-keyspace-events contains K$g"
+            )
+
+        db = self._redis.connection_pool.connection_kwargs.get("db", 0)
+        channel = f"__keyspace@{db}__:{self._prefix}"
+
+        def handler(message: dict):
+            owner = message["channel"].decode()[len(channel) :]
+            value = self._redis.get(self._key(owner))
+            if self._known.get(owner) == hash(value):
+                return
+
+            self._known[owner] = hash(value)
+            try:
+                callback(owner, json.loads(value) if value is not None else None)
+            except Exception:
+                logger.exception("Can't process change of %s in Redis", owner)
+
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(**{f"{channel}*": handler})
+        self._pubsub_thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+        return True
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Stores each key of each owner in a separate row of SQLite database,
+    so a change of a single key rewrites only one row
+    """
+
+    lazy = True
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS data (owner TEXT NOT NULL, key TEXT NOT"
+            " NULL, value TEXT NOT NULL, PRIMARY KEY (owner, key)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def _select(self, query: str, *args) -> list:
+        with self._lock:
+            return self._conn.execute(query, args).fetchall()
+
+    def is_empty(self) -> bool:
+        return not self._select("SELECT 1 FROM data LIMIT 1")
+
+    def migrate(self, json_path: str) -> bool:
+        """
+        Import data from JSON file database, if this one is empty.
+        Imported file is renamed, so it won't be imported again
+        :param json_path: Path to JSON database
+        :return: `True` if data was imported
+        """
+        if not os.path.isfile(json_path) or not self.is_empty():
+            return False
+
+        data = JSONFileBackend(json_path).read()
+        self.write(self.prepare(data, set(), set(), True))
+        os.rename(json_path, f"{json_path}.migrated")
+        logger.info("Migrated %s owners from %s to SQLite", len(data), json_path)
+        return True
+
+    def read(self) -> dict:
+        data = {}
+        for owner, key, value in self._select("SELECT owner, key, value FROM data"):
+            data.setdefault(owner, {})[key] = json.loads(value)
+
+        return data
+
+    def read_owner(self, owner: str) -> typing.Optional[dict]:
+        rows = self._select("SELECT key, value FROM data WHERE owner = ?", str(owner))
+        return {key: json.loads(value) for key, value in rows} if rows else None
+
+    def owners(self) -> typing.List[str]:
+        return [owner for owner, in self._select("SELECT DISTINCT owner FROM data")]
+
+    def prepare(
+        self,
+        db: dict,
+        keys: typing.Set[typing.Tuple[str, str]],
+        owners: typing.Set[str],
+        wipe: bool,
+    ) -> typing.List[typing.Tuple[str, list]]:
+        payload = []
+        if wipe:
+            payload += [("DELETE FROM data", [()])]
+            owners = set(db)
+
+        upserts = []
+        deletes = []
+
+        for owner in owners:
+            payload += [("DELETE FROM data WHERE owner = ?", [(str(owner),)])]
+            upserts += [
+                (str(owner), str(key), json.dumps(value))
+                for key, value in dict.get(db, owner, {}).items()
+            ]
+
+        for owner, key in keys:
+            if owner in owners:
+                continue
+
+            values = dict.get(db, owner, {})
+            if key in values:
+                upserts += [(str(owner), str(key), json.dumps(values[key]))]
+            else:
+                deletes += [(str(owner), str(key))]
+
+        if deletes:
+            payload += [("DELETE FROM data WHERE owner = ? AND key = ?", deletes)]
+
+        if upserts:
+            payload += [
+                (
+                    "INSERT OR REPLACE INTO data (owner, key, value) VALUES (?, ?, ?)",
+                    upserts,
+                )
+            ]
+
+        return payload
+
+    def write(self, payload: typing.List[typing.Tuple[str, list]]):
+        with self._lock, self._conn:
+            for query, rows in payload:
+                self._conn.executemany(query, rows)
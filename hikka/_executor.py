@@ -0,0 +1,323 @@
+"""Bounded execution of commands, watchers and loops"""
+
+# ©️ Dan Gazizullin, 2021-2023
+# This file is a part of Hikka Userbot
+# 🌐 https://github.com/hikariatama/Hikka
+# You can redistribute it and/or modify it under the terms of the GNU AGPLv3
+# 🔑 https://www.gnu.org/licenses/agpl-3.0.html
+# Netfoll Team modifided Hikka files for Netfoll
+# 🌐 https://github.com/MXRRI/Netfoll
+
+import asyncio
+import collections
+import contextvars
+import itertools
+import logging
+import typing
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_new", "block")
+
+# Commands of owner and sudo users. They bypass the limits and the queue,
+# so user is able to mitigate floods even if all the other lanes are full
+OWNER = "owner"
+COMMANDS = "commands"
+WATCHERS = "watchers"
+LOOPS = "loops"
+
+# Share of free slots, which each queued lane gets, when they compete
+DEFAULT_WEIGHTS = {COMMANDS: 4, WATCHERS: 2, LOOPS: 1}
+
+
+class Job(typing.NamedTuple):
+    module: typing.Any
+    factory: typing.Callable[[], typing.Awaitable]
+    timeout: typing.Optional[float]
+    name: str
+    lane: str
+    context: contextvars.Context
+    # Future, which `run` caller awaits. Cancelled, if job is dropped
+    future: typing.Optional[asyncio.Future] = None
+
+
+class LaneQueue:
+    """
+    Queue of lane, split by modules, so the oldest job, which fits into the
+    limits, is found without scanning the jobs of modules at their limit
+    """
+
+    def __init__(self):
+        # Module -> its (sequence number, job) in the order of submission
+        self._modules = {}
+        self._seq = itertools.count()
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __contains__(self, job: Job) -> bool:
+        return any(queued is job for _, queued in self._modules.get(job.module, ()))
+
+    def append(self, job: Job):
+        self._modules.setdefault(job.module, collections.deque()).append(
+            (next(self._seq), job)
+        )
+        self._len += 1
+
+    def head(
+        self,
+        fits: typing.Optional[typing.Callable[[typing.Any], bool]] = None,
+    ) -> typing.Optional[Job]:
+        """
+        Get the oldest job
+        :param fits: Check of module, which job must pass
+        """
+        heads = [
+            queue[0]
+            for module, queue in self._modules.items()
+            if fits is None or fits(module)
+        ]
+        return min(heads, key=lambda item: item[0])[1] if heads else None
+
+    def remove(self, job: Job):
+        queue = self._modules[job.module]
+        if queue[0][1] is job:
+            queue.popleft()
+        else:
+            queue.remove(next(item for item in queue if item[1] is job))
+
+        if not queue:
+            del self._modules[job.module]
+
+        self._len -= 1
+
+    def pop_module(self, module: typing.Any) -> typing.List[Job]:
+        """Remove all the jobs of module"""
+        jobs = [job for _, job in self._modules.pop(module, ())]
+        self._len -= len(jobs)
+        return jobs
+
+
+class HandlerExecutor:
+    """
+    Runs handlers as tasks with global and per-module concurrency limits.
+    Handlers, which exceed the limits, wait in bounded queues, one per lane.
+    Free slots are given to lanes by weighted round-robin, so interactive
+    commands are not stuck behind the watcher backlog. When lane queue is
+    full, `overflow` policy decides, whether the oldest job is dropped, the
+    new one is dropped, or the caller waits for free space
+    """
+
+    def __init__(
+        self,
+        max_tasks: int = 100,
+        max_module_tasks: int = 20,
+        max_queue: int = 1000,
+        overflow: str = "drop_oldest",
+        weights: typing.Optional[typing.Dict[str, int]] = None,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            logger.warning("Unknown overflow policy %s, using drop_oldest", overflow)
+            overflow = "drop_oldest"
+
+        self.max_tasks = max_tasks
+        self.max_module_tasks = max_module_tasks
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+
+        self._queues = {lane: LaneQueue() for lane in self.weights}
+        # Smooth weighted round-robin state of lanes
+        self._credits = dict.fromkeys(self.weights, 0)
+        # Module -> its running tasks
+        self._tasks = collections.defaultdict(set)
+        self._running = 0
+        # Set, when lane queue has free space. Awaited with `block` policy
+        self._space = {lane: asyncio.Event() for lane in self.weights}
+        for event in self._space.values():
+            event.set()
+
+    def _fits(self, module: typing.Any) -> bool:
+        return (
+            self._running < self.max_tasks
+            and len(self._tasks.get(module, ())) < self.max_module_tasks
+        )
+
+    def _start(self, job: Job):
+        # Task inherits context of the code, which submitted the job, rather
+        # than the one of the task, which freed the slot
+        task = job.context.run(asyncio.ensure_future, self._run(job))
+        self._running += 1
+        self._tasks[job.module].add(task)
+        task.add_done_callback(lambda _: self._finish(job.module, task))
+
+    def _finish(self, module: typing.Any, task: asyncio.Task):
+        self._running -= 1
+        self._tasks[module].discard(task)
+        if not self._tasks[module]:
+            del self._tasks[module]
+
+        self._pump()
+
+    @staticmethod
+    async def _run(job: Job):
+        try:
+            if job.timeout:
+                await asyncio.wait_for(job.factory(), job.timeout)
+            else:
+                await job.factory()
+        except asyncio.TimeoutError:
+            logger.warning("%s timed out after %ss", job.name, job.timeout)
+
+    def _next_job(self) -> typing.Optional[Job]:
+        """Pick the next job to start, respecting lane weights"""
+        candidates = {}
+        for lane, queue in self._queues.items():
+            if (job := queue.head(self._fits)) is not None:
+                candidates[lane] = job
+
+        if not candidates:
+            return None
+
+        for lane in candidates:
+            self._credits[lane] += self.weights[lane]
+
+        lane = max(candidates, key=self._credits.__getitem__)
+        self._credits[lane] -= sum(self.weights[lane] for lane in candidates)
+        self._queues[lane].remove(candidates[lane])
+        return candidates[lane]
+
+    @staticmethod
+    def _drop(job: Job):
+        """Forget queued job, notifying `run` caller, if there is any"""
+        if job.future is not None and not job.future.done():
+            job.future.cancel()
+
+    def _pump(self):
+        """Start queued jobs, which fit into the limits"""
+        while self._running < self.max_tasks and (job := self._next_job()):
+            self._start(job)
+
+        for lane, queue in self._queues.items():
+            if len(queue) < self.max_queue:
+                self._space[lane].set()
+
+    async def submit(
+        self,
+        module: typing.Any,
+        factory: typing.Callable[[], typing.Awaitable],
+        timeout: typing.Optional[float] = None,
+        name: str = "Handler",
+        lane: str = WATCHERS,
+    ) -> bool:
+        """
+        Run handler as soon as the limits allow it
+        :param module: Module, which handler belongs to
+        :param factory: Function, which returns coroutine to run
+        :param timeout: Time in seconds, after which handler is cancelled
+        :param name: Name of handler to use in logs
+        :param lane: Lane of handler
+        :return: `False` if job was dropped due to queue overflow
+        """
+        job = Job(module, factory, timeout, name, lane, contextvars.copy_context())
+        if lane == OWNER:
+            self._start(job)
+            return True
+
+        queue = self._queues[lane]
+        if not queue and self._fits(module):
+            self._start(job)
+            return True
+
+        while len(queue) >= self.max_queue:
+            if self.overflow == "drop_new":
+                logger.debug("Dropped %s, because %s queue is full", name, lane)
+                return False
+
+            if self.overflow == "drop_oldest":
+                oldest = queue.head()
+                logger.debug("Dropped %s, because %s queue is full", oldest.name, lane)
+                queue.remove(oldest)
+                self._drop(oldest)
+                break
+
+            self._space[lane].clear()
+            await self._space[lane].wait()
+
+        queue.append(job)
+        self._pump()
+        return True
+
+    async def run(
+        self,
+        module: typing.Any,
+        factory: typing.Callable[[], typing.Awaitable],
+        name: str = "Loop",
+        lane: str = LOOPS,
+    ) -> typing.Any:
+        """
+        Run handler, when the limits allow it, and wait for its result.
+        Unlike `submit`, job is never dropped
+        """
+        future = asyncio.get_event_loop().create_future()
+        task = None
+
+        async def wrapper():
+            nonlocal task
+            task = asyncio.current_task()
+            try:
+                result = await factory()
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+        job = Job(module, wrapper, None, name, lane, contextvars.copy_context(), future)
+        if not self._queues[lane] and self._fits(module):
+            self._start(job)
+        else:
+            self._queues[lane].append(job)
+            self._pump()
+
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if job in self._queues[lane]:
+                self._queues[lane].remove(job)
+            elif task is not None:
+                task.cancel()
+
+            raise
+
+    def cancel(self, module: typing.Any) -> int:
+        """
+        Cancel running and queued handlers of module, e.g. when it's unloaded.
+        Task, which requested the cancellation, is not cancelled
+        :return: Number of cancelled handlers
+        """
+        queued = 0
+        for queue in self._queues.values():
+            for job in queue.pop_module(module):
+                self._drop(job)
+                queued += 1
+
+        current = asyncio.current_task()
+        tasks = [task for task in self._tasks.get(module, ()) if task is not current]
+        for task in tasks:
+            task.cancel()
+
+        self._pump()
+        return queued + len(tasks)
+
+    @property
+    def stats(self) -> typing.Dict[str, int]:
+        return {
+            "running": self._running,
+            **{f"queued_{lane}": len(queue) for lane, queue in self._queues.items()},
+        }
@@ -8,11 +8,87 @@
 
 import asyncio
 import atexit
+import contextlib
+import contextvars
+import functools
+import inspect
 import logging
 import os
 import random
 import signal
 import sys
+import typing
+
+# Telegram ID of client, on behalf of which current code is running. Set by
+# dispatcher, loader and main loop, read by logging handler to determine,
+# which client caused logging messages. Propagated to spawned tasks
+client_id_tag = contextvars.ContextVar("client_id_tag", default=None)
+
+# Module instance, on behalf of which current code is running. Set when
+# commands, watchers, loops and inline callbacks are dispatched
+current_module = contextvars.ContextVar("current_module", default=None)
+
+
+@contextlib.contextmanager
+def module_context(func: typing.Callable):
+    """
+    Run code inside on behalf of the module, which `func` is bound to.
+    If `func` is not a bound method, current module is kept
+    """
+    token = current_module.set(getattr(func, "__self__", current_module.get()))
+    try:
+        yield
+    finally:
+        current_module.reset(token)
+
+
+@contextlib.contextmanager
+def client_context(tg_id: typing.Optional[int]):
+    """
+    Run code inside on behalf of the client with given id.
+    If id is `None`, current client is kept
+    """
+    if tg_id is None:
+        yield
+        return
+
+    token = client_id_tag.set(tg_id)
+    try:
+        yield
+    finally:
+        client_id_tag.reset(token)
+
+
+def tag_client(get_id: typing.Callable[[typing.Any], int]) -> typing.Callable:
+    """
+    Decorate method to run on behalf of the client, which id is returned by
+    `get_id` for the instance. Previous client is restored, when it returns
+    """
+
+    def resolve(instance: typing.Any) -> typing.Optional[int]:
+        try:
+            return get_id(instance)
+        except AttributeError:
+            return None
+
+    def decorator(func: typing.Callable) -> typing.Callable:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(self, *args, **kwargs):
+                with client_context(resolve(self)):
+                    return await func(self, *args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with client_context(resolve(self)):
+                return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
 
 
 async def fw_protect():
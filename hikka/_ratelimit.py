@@ -0,0 +1,68 @@
+"""Rate limiting of commands and inline callbacks of untrusted users"""
+
+# ©️ Dan Gazizullin, 2021-2023
+# This file is a part of Hikka Userbot
+# 🌐 https://github.com/hikariatama/Hikka
+# You can redistribute it and/or modify it under the terms of the GNU AGPLv3
+# 🔑 https://www.gnu.org/licenses/agpl-3.0.html
+# Netfoll Team modifided Hikka files for Netfoll
+# 🌐 https://github.com/MXRRI/Netfoll
+
+import time
+import typing
+
+
+class RateLimiter:
+    """
+    Leaky bucket per key. Each hit adds its cost to the bucket, which drains
+    at constant rate. Draining is computed on access from the time of the
+    last hit, so no timers are scheduled. Drained buckets are evicted
+    """
+
+    def __init__(self, capacity: float, rate: float):
+        """
+        :param capacity: Level of bucket, above which hits are rejected
+        :param rate: Units, drained from bucket per second
+        :raises ValueError: If rate is not positive
+        """
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive, got {rate}")
+
+        self.capacity = capacity
+        self.rate = rate
+        # Key -> (level, time of the last hit)
+        self._buckets = {}
+        self._next_sweep = 0
+
+    def level(self, key: typing.Hashable, now: typing.Optional[float] = None) -> float:
+        """Get current level of bucket"""
+        if key not in self._buckets:
+            return 0
+
+        level, last = self._buckets[key]
+        return max(0, level - ((now or time.monotonic()) - last) * self.rate)
+
+    def hit(self, key: typing.Hashable, cost: float = 1) -> bool:
+        """
+        Add cost to the bucket
+        :return: `False` if bucket overflowed and the hit must be rejected
+        """
+        now = time.monotonic()
+        self._sweep(now)
+
+        level = self.level(key, now) + cost
+        self._buckets[key] = (level, now)
+        return level <= self.capacity
+
+    def _sweep(self, now: float):
+        # Full bucket drains in `capacity / rate` seconds, so there is no point
+        # in looking for drained ones more often
+        if now < self._next_sweep:
+            return
+
+        self._next_sweep = now + self.capacity / self.rate
+        for key in [key for key in self._buckets if not self.level(key, now)]:
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
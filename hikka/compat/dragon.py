@@ -83,13 +83,13 @@ class DragonDb:
         return self.db.set(f"dragon.{module}", variable, value)
 
     def get_collection(self, module: str) -> typing.Dict[str, JSONSerializable]:
-        return dict.get(self.db, f"dragon.{module}", {})
+        try:
+            return self.db[f"dragon.{module}"]
+        except KeyError:
+            return {}
 
     def remove(self, module: str, variable: str) -> JSONSerializable:
-        if f"dragon.{module}" not in self.db:
-            return None
-
-        return self.db[f"dragon.{module}"].pop(variable, None)
+        return self.db.remove(f"dragon.{module}", variable)
 
     def close(self):
         pass
@@ -7,25 +7,24 @@
 # 🌐 https://github.com/MXRRI/Netfoll
 
 import asyncio
+import atexit
 import collections
-import json
+import contextlib
 import logging
 import os
 import time
-
-try:
-    import redis
-except ImportError as e:
-    if "RAILWAY" in os.environ:
-        raise e
-
-
 import typing
 
 from telethon.errors.rpcerrorlist import ChannelsTooMuchError
 from telethon.tl.types import Message
 
 from . import main, utils
+from ._db_backends import (
+    JSONFileBackend,
+    RedisBackend,
+    SQLiteBackend,
+    StorageBackend,
+)
 from .pointers import PointerDict, PointerList
 from .tl_cache import CustomTelegramClient
 from .types import JSONSerializable
@@ -48,61 +47,112 @@ class Database(dict):
     _revisions = []
     _assets = None
     _me = None
-    _redis = None
+    _backend = None
     _saving_task = None
+    _save_delay = 1
 
     def __init__(self, client: CustomTelegramClient):
         super().__init__()
         self._client = client
+        self._owner_revisions = collections.defaultdict(int)
+        # Changed (owner, key) pairs
+        self._dirty = set()
+        # Owners, which must be rewritten completely
+        self._dirty_owners = set()
+        self._wiped = False
+        # Owners, which are known to be absent in lazy backend
+        self._absent_owners = set()
+        self._save_lock = asyncio.Lock()
 
     def __repr__(self):
         return object.__repr__(self)
 
-    def _redis_save_sync(self):
-        with self._redis.pipeline() as pipe:
-            pipe.set(
-                str(self._client.tg_id),
-                json.dumps(self, ensure_ascii=True),
-            )
-            pipe.execute()
+    def __missing__(self, owner: str) -> dict:
+        if not self._backend or not self._backend.lazy or owner in self._absent_owners:
+            raise KeyError(owner)
 
-    async def remote_force_save(self) -> bool:
-        """Force save database to remote endpoint without waiting"""
-        if not self._redis:
-            return False
+        if (value := self._backend.read_owner(owner)) is None:
+            self._absent_owners.add(owner)
+            raise KeyError(owner)
 
-        await utils.run_sync(self._redis_save_sync)
-        logger.debug("Published db to Redis")
-        return True
+        super().__setitem__(owner, value)
+        return value
 
-    async def _redis_save(self) -> bool:
-        """Save database to redis"""
-        if not self._redis:
-            return False
+    def __delitem__(self, owner: str):
+        super().__delitem__(owner)
+        self._dirty_owners.add(owner)
+        self._absent_owners.add(owner)
+        self._owner_revisions[owner] += 1
 
-        await asyncio.sleep(5)
+    def clear(self):
+        super().clear()
+        self._wiped = True
+        # Stored owners will be removed on next save, so they must not be loaded
+        self._absent_owners = set(self._backend.owners()) if self._backend else set()
 
-        await utils.run_sync(self._redis_save_sync)
+        for owner in self._owner_revisions:
+            self._owner_revisions[owner] += 1
 
-        logger.debug("Published db to Redis")
-
-        self._saving_task = None
-        return True
+    def _on_remote_change(self, owner: str, value: typing.Optional[dict]):
+        """Apply change of owner, made by another process"""
+        if owner in self._dirty_owners or any(o == owner for o, _ in self._dirty):
+            # Local changes are not saved yet and will overwrite the remote ones
+            return
 
-    async def redis_init(self) -> bool:
-        """Init redis database"""
-        if REDIS_URI := os.environ.get("REDIS_URL") or main.get_config_key("redis_uri"):
-            self._redis = redis.Redis.from_url(REDIS_URI)
+        if value is None:
+            super().pop(owner, None)
+            self._absent_owners.add(owner)
         else:
+            super().__setitem__(owner, value)
+            self._absent_owners.discard(owner)
+
+        self._owner_revisions[owner] += 1
+        logger.debug("Owner %s was changed by another process", owner)
+
+    async def remote_force_save(self) -> bool:
+        """Force save database to remote endpoint without waiting"""
+        if not self._backend.remote:
             return False
 
+        return await self.flush()
+
+    def _get_backend(self) -> StorageBackend:
+        """Get storage backend, chosen in config"""
+        if redis_uri := os.environ.get("REDIS_URL") or main.get_config_key(
+            "redis_uri"
+        ):
+            backend = RedisBackend(redis_uri, self._client.tg_id)
+            backend.migrate()
+            return backend
+
+        json_path = os.path.join(DATA_DIR, f"config-{self._client.tg_id}.json")
+        if main.get_config_key("db_backend") == "sqlite":
+            backend = SQLiteBackend(
+                os.path.join(DATA_DIR, f"config-{self._client.tg_id}.db")
+            )
+            backend.migrate(json_path)
+            return backend
+
+        return JSONFileBackend(json_path)
+
     async def init(self):
         """Asynchronous initialization unit"""
-        if os.environ.get("REDIS_URL") or main.get_config_key("redis_uri"):
-            await self.redis_init()
-
-        self._db_path = os.path.join(DATA_DIR, f"config-{self._client.tg_id}.json")
+        self._backend = self._get_backend()
+        self._save_delay = main.get_config_key("db_save_delay") or (
+            5 if self._backend.remote else 1
+        )
         self.read()
+        atexit.register(self._flush_sync)
+
+        if main.get_config_key("redis_notifications"):
+            loop = asyncio.get_event_loop()
+            self._backend.subscribe(
+                lambda owner, value: loop.call_soon_threadsafe(
+                    self._on_remote_change,
+                    owner,
+                    value,
+                )
+            )
 
         try:
             self._assets, _ = await utils.asset_channel(
@@ -124,30 +174,43 @@ class Database(dict):
 
     def read(self):
         """Read database and stores it in self"""
-        if self._redis:
-            try:
-                self.update(
-                    **json.loads(
-                        self._redis.get(
-                            str(self._client.tg_id),
-                        ).decode(),
-                    )
-                )
-            except Exception:
-                logger.exception("Error reading redis database")
-            return
+        if not self._backend.lazy:
+            self.update(**self._backend.read())
 
-        try:
-            with open(self._db_path, "r", encoding="utf-8") as f:
-                self.update(**json.load(f))
-        except (FileNotFoundError, json.decoder.JSONDecodeError):
-            logger.warning("Database read failed! Creating new one...")
+    def load_all(self):
+        """
+        Load all owners from lazy storage backend. Use it before
+        iterating over the whole database, e.g. to export it
+        """
+        for owner in self._backend.owners():
+            with contextlib.suppress(KeyError):
+                self[owner]  # skipcq: PYL-W0104
 
-    def process_db_autofix(self, db: dict) -> bool:
-        if not utils.is_serializable(db):
+    def process_db_autofix(
+        self,
+        db: dict,
+        owners: typing.Optional[typing.Iterable[str]] = None,
+    ) -> bool:
+        """
+        Drop invalid keys from database
+        :param db: Database to fix
+        :param owners: Check only these owners. If not specified, check all
+        :return: `False` if database can't be serialized, otherwise `True`
+        """
+        if owners is None:
+            if not utils.is_serializable(db):
+                return False
+
+            owners = db.copy()
+        elif not utils.is_serializable({key: db[key] for key in owners if key in db}):
             return False
 
-        for key, value in db.copy().items():
+        for key in owners:
+            if key not in db:
+                continue
+
+            value = db[key]
+
             if not isinstance(key, (str, int)):
                 logger.warning(
                     "DbAutoFix: Dropped key %s, because it is not string or int",
@@ -180,8 +243,65 @@ class Database(dict):
         return True
 
     def save(self) -> bool:
-        """Save database"""
-        if not self.process_db_autofix(self):
+        """
+        Schedule database save. Changes, made within `db_save_delay`
+        seconds are written at once. Use it after modifying the database
+        in-place. `set` calls it automatically
+        """
+        self._dirty_owners.update(self)
+        # In-place modifications are not tracked, so any owner could change
+        for owner in self:
+            self._owner_revisions[owner] += 1
+
+        self._schedule_save()
+        return True
+
+    def _schedule_save(self):
+        if not self._saving_task:
+            self._saving_task = asyncio.ensure_future(self._delayed_save())
+
+    async def _delayed_save(self):
+        await asyncio.sleep(self._save_delay)
+        # New changes, made during the write, will schedule next save
+        self._saving_task = None
+        await self._persist()
+
+    async def flush(self) -> bool:
+        """Write pending changes immediately, e.g. before shutdown"""
+        if self._saving_task:
+            self._saving_task.cancel()
+            self._saving_task = None
+
+        return await self._persist()
+
+    def _take_changes(self) -> typing.Tuple[set, set, bool]:
+        """Take pending changes, so the ones made during the write are kept"""
+        changes = self._dirty, self._dirty_owners, self._wiped
+        self._dirty, self._dirty_owners, self._wiped = set(), set(), False
+        return changes
+
+    def _requeue_changes(self, changes: typing.Tuple[set, set, bool]):
+        """Return changes, which failed to be written, and retry the save"""
+        dirty, dirty_owners, wiped = changes
+        self._dirty |= dirty
+        self._dirty_owners |= dirty_owners
+        self._wiped = self._wiped or wiped
+        self._schedule_save()
+
+    def _prepare_save(self, changes: typing.Tuple[set, set, bool]) -> typing.Any:
+        """
+        Check changed owners and serialize changes
+        :param changes: Changes, taken by `_take_changes`
+        :return: Backend payload or `None` if there is nothing to save
+        """
+        dirty, dirty_owners, wiped = changes
+        if not dirty and not dirty_owners and not wiped:
+            return None
+
+        if not self.process_db_autofix(
+            self,
+            None if wiped else {owner for owner, _ in dirty} | dirty_owners,
+        ):
             try:
                 rev = self._revisions.pop()
                 while not self.process_db_autofix(rev):
@@ -207,19 +327,39 @@ class Database(dict):
         while len(self._revisions) > 15:
             self._revisions.pop()
 
-        if self._redis:
-            if not self._saving_task:
-                self._saving_task = asyncio.ensure_future(self._redis_save())
-            return True
+        return self._backend.prepare(self, dirty, dirty_owners, wiped)
+
+    async def _persist(self) -> bool:
+        """Save changed database off the event loop"""
+        async with self._save_lock:
+            changes = self._take_changes()
+            try:
+                payload = self._prepare_save(changes)
+            except RuntimeError:
+                logger.exception("Database save failed!")
+                return False
+
+            if payload is None:
+                return True
+
+            try:
+                await utils.run_sync(self._backend.write, payload)
+                logger.debug("Saved db via %s", type(self._backend).__name__)
+            except Exception:
+                logger.exception("Database save failed! Retrying later")
+                self._requeue_changes(changes)
+                return False
+
+        return True
 
+    def _flush_sync(self):
+        """Write pending changes synchronously. Used on interpreter exit"""
         try:
-            with open(self._db_path, "w", encoding="utf-8") as f:
-                json.dump(self, f, indent=4)
+            payload = self._prepare_save(self._take_changes())
+            if payload is not None:
+                self._backend.write(payload)
         except Exception:
             logger.exception("Database save failed!")
-            return False
-
-        return True
 
     async def store_asset(self, message: Message) -> int:
         """
@@ -287,8 +427,38 @@ class Database(dict):
                 "JSON-serializable value which will cause errors"
             )
 
+        with contextlib.suppress(KeyError):
+            self[owner]  # skipcq: PYL-W0104  # Load owner from lazy backend
+
         super().setdefault(owner, {})[key] = value
-        return self.save()
+        self._owner_revisions[owner] += 1
+        self._dirty.add((owner, key))
+        self._schedule_save()
+        return True
+
+    def remove(
+        self,
+        owner: str,
+        key: str,
+        default: typing.Optional[JSONSerializable] = None,
+    ) -> JSONSerializable:
+        """Remove database key and return its value"""
+        try:
+            value = self[owner].pop(key)
+        except KeyError:
+            return default
+
+        self._owner_revisions[owner] += 1
+        self._dirty.add((owner, key))
+        self._schedule_save()
+        return value
+
+    def revision(self, owner: str) -> int:
+        """
+        Get revision of owner's data. It is increased on each `set` call,
+        so the caches, built on top of database values, can be invalidated
+        """
+        return self._owner_revisions[owner]
 
     def pointer(
         self,
@@ -24,10 +24,8 @@
 # Netfoll Team modifided Hikka files for Netfoll
 # 🌐 https://github.com/MXRRI/Netfoll
 
-import asyncio
-import collections
 import contextlib
-import copy
+import functools
 import inspect
 import logging
 import re
@@ -40,6 +38,10 @@ from telethon.errors import FloodWaitError, RPCError
 from telethon.tl.types import Message
 
 from . import main, security, utils
+from . import _executor
+from ._executor import HandlerExecutor
+from ._internal import client_id_tag, current_module
+from ._ratelimit import RateLimiter
 from .database import Database
 from .loader import Modules
 from .tl_cache import CustomTelegramClient
@@ -49,6 +51,7 @@ logger = logging.getLogger(__name__)
 # Keys for layout switch
 ru_keys = 'ёйцукенгшщзхъфывапролджэячсмитьбю.Ё"№;%:?ЙЦУКЕНГШЩЗХЪФЫВАПРОЛДЖЭ/ЯЧСМИТЬБЮ,'
 en_keys = "`qwertyuiop[]asdfghjkl;'zxcvbnm,./~@#$%^&QWERTYUIOP{}ASDFGHJKL:\"|ZXCVBNM<>?"
+layout_change = str.maketrans(ru_keys + en_keys, en_keys + ru_keys)
 ALL_TAGS = [
     "no_commands",
     "only_commands",
@@ -77,11 +80,301 @@ ALL_TAGS = [
 ]
 
 
-def _decrement_ratelimit(delay, data, key, severity):
-    def inner():
-        data[key] = max(0, data[key] - severity)
+_MISSING = object()
+# Results of command parsing, which are handled differently by command path
+_ESCAPED = object()
+_DATACHAT = object()
+
+
+class EventContext:
+    """State of a single event, shared by all its handlers and watchers"""
+
+    __slots__ = ("command",)
+
+    def __init__(self):
+        # Result of `CommandDispatcher._parse_command`
+        self.command = _MISSING
+
+
+def get_event_context(event: typing.Any) -> EventContext:
+    """Get context of event, creating it on first access"""
+    try:
+        return event._hikka_context
+    except AttributeError:
+        context = event._hikka_context = EventContext()
+        return context
+
+
+def _event_shape(message: typing.Any) -> typing.Tuple[int, bool, bool, bool, int]:
+    """
+    Get cheap discriminators of event, which decide most of the tags:
+    direction (0 - unknown, 1 - outgoing, 2 - incoming), `is_private`,
+    `is_group` and `is_channel` flags and kind of event (0 - not a message,
+    1 - message without media, 2 - message with media)
+    """
+    out = getattr(message, "out", _MISSING)
+    return (
+        0 if out is _MISSING else 1 if out else 2,
+        bool(getattr(message, "is_private", False)),
+        bool(getattr(message, "is_group", False)),
+        bool(getattr(message, "is_channel", False)),
+        (
+            (2 if getattr(message, "media", False) else 1)
+            if isinstance(message, Message)
+            else 0
+        ),
+    )
+
+
+class TagPlan:
+    """
+    Tags of handler, compiled into checks. Checks, which depend only on
+    the shape of event, are decided once per shape, while the rest are
+    run for each event
+    """
+
+    def __init__(self, func: callable, blacklist: typing.Optional[list] = None):
+        self._tags = {tag: getattr(func, tag, False) for tag in ALL_TAGS}
+        self._blacklist = set(blacklist) if blacklist is not None else None
+        self._accepted = {}
+        # Each check returns `True` if event must be ignored
+        self.checks = []
+
+        tags = self._tags
+        if self._blacklist:
+            self.checks += [
+                lambda m: isinstance(m, Message)
+                and utils.get_chat_id(m) in self._blacklist
+            ]
+
+        if tags["editable"]:
+            self.checks += [
+                lambda m: getattr(m, "fwd_from", False)
+                or getattr(m, "sticker", False)
+                or getattr(m, "via_bot_id", False)
+            ]
+
+        for tag, mime in (
+            ("only_photos", "image/"),
+            ("only_videos", "video/"),
+            ("only_audios", "audio/"),
+        ):
+            if tags[tag]:
+                self.checks += [
+                    lambda m, mime=mime: not utils.mime_type(m).startswith(mime)
+                ]
+
+        for tag, attr in (
+            ("only_stickers", "sticker"),
+            ("only_docs", "document"),
+            ("only_inline", "via_bot_id"),
+        ):
+            if tags[tag]:
+                self.checks += [lambda m, attr=attr: not getattr(m, attr, False)]
+
+        if isinstance(tags["startswith"], str):
+            self.checks += [lambda m: not m.raw_text.startswith(tags["startswith"])]
+
+        if isinstance(tags["endswith"], str):
+            self.checks += [lambda m: not m.raw_text.endswith(tags["endswith"])]
+
+        if isinstance(tags["contains"], str):
+            self.checks += [lambda m: tags["contains"] not in m.raw_text]
+
+        if tags["filter"] and callable(tags["filter"]):
+            self.checks += [lambda m: not tags["filter"](m)]
+
+        if tags["from_id"]:
+            self.checks += [lambda m: getattr(m, "sender_id", None) != tags["from_id"]]
+
+        if tags["chat_id"]:
+            chat_id = (
+                tags["chat_id"]
+                if not str(tags["chat_id"]).startswith("-100")
+                else int(str(tags["chat_id"])[4:])
+            )
+            self.checks += [lambda m: utils.get_chat_id(m) != chat_id]
+
+        if tags["regex"]:
+            try:
+                regex = re.compile(tags["regex"])
+            except (TypeError, re.error):
+                logger.error("Invalid regex %s of %s", tags["regex"], func)
+                self.checks += [lambda _: True]
+            else:
+                self.checks += [lambda m: not regex.search(m.raw_text)]
+
+    def accepts(self, shape: typing.Tuple[int, bool, bool, bool, int]) -> bool:
+        """Check if events of given shape can pass the tags"""
+        if shape not in self._accepted:
+            direction, private, group, channel, kind = shape
+            tags = self._tags
+            bl = self._blacklist
+            self._accepted[shape] = not (
+                tags["out"]
+                and direction == 2
+                or tags["in"]
+                and direction != 2
+                or tags["only_messages"]
+                and not kind
+                or tags["editable"]
+                and direction != 1
+                or tags["no_media"]
+                and kind == 2
+                or (
+                    tags["only_media"]
+                    or tags["only_photos"]
+                    or tags["only_videos"]
+                    or tags["only_audios"]
+                )
+                and kind != 2
+                or (
+                    tags["startswith"]
+                    or tags["endswith"]
+                    or tags["contains"]
+                    or tags["regex"]
+                )
+                and not kind
+                or tags["only_channels"]
+                and (not channel and group or private)
+                or tags["only_groups"]
+                and not group
+                or tags["only_pm"]
+                and not private
+                or bl is not None
+                and kind
+                and (
+                    "*" in bl
+                    or "only_chats" in bl
+                    and private
+                    or "only_pm" in bl
+                    and not private
+                    or "out" in bl
+                    and direction != 1
+                    or "in" in bl
+                    and direction == 1
+                )
+            )
+
+        return self._accepted[shape]
+
+    async def ignores(
+        self,
+        dispatcher: "CommandDispatcher",
+        event: typing.Union[events.NewMessage, events.MessageDeleted],
+        shape: typing.Optional[typing.Tuple[int, bool, bool, bool, int]] = None,
+    ) -> bool:
+        """
+        Check if event must be ignored by handler
+        :param dispatcher: Dispatcher, which parses commands
+        :param event: Event to check
+        :param shape: Shape of event, if it's already known to be accepted
+        """
+        message = getattr(event, "message", event)
+        if shape is None and not self.accepts(_event_shape(message)):
+            return True
+
+        if (
+            self._tags["no_commands"]
+            and await dispatcher._handle_command(event, watcher=True)
+            or self._tags["only_commands"]
+            and not await dispatcher._handle_command(event, watcher=True)
+        ):
+            return True
+
+        return any(check(message) for check in self.checks)
+
+
+class RoutingSnapshot:
+    """
+    Precompiled data, required to route incoming message to a command.
+    Built once and reused until `hikka.main` keys or registered commands change
+    """
+
+    def __init__(self, db: Database, modules: Modules):
+        self.db_revision = db.revision(main.__name__)
+        self.modules_revision = modules.revision
+
+        self.prefix = db.get(main.__name__, "command_prefix", False) or "."
+        self.translated_prefix = str.translate(self.prefix, layout_change)
+        self.double_prefix = self.prefix * 2
+        self.translated_double_prefix = str.translate(self.double_prefix, layout_change)
+
+        self.blacklist_chats = frozenset(db.get(main.__name__, "blacklist_chats", []))
+        self.whitelist_chats = frozenset(db.get(main.__name__, "whitelist_chats", []))
+        self.whitelist_modules = frozenset(
+            db.get(main.__name__, "whitelist_modules", [])
+        )
+        self.no_nickname = db.get(main.__name__, "no_nickname", False)
+        self.nonickcmds = frozenset(db.get(main.__name__, "nonickcmds", []))
+        self.nonickusers = frozenset(db.get(main.__name__, "nonickusers", []))
+        self.nonickchats = frozenset(db.get(main.__name__, "nonickchats", []))
+        self.grep = db.get(main.__name__, "grep", False)
+
+        # Lowercased command or alias -> (command name, handler). Command name
+        # is `None` for commands themselves, so the name is kept as typed
+        self.routes = {name: (None, func) for name, func in modules.commands.items()}
+
+        for alias, cmd in modules.aliases.items():
+            if cmd and cmd.lower() in modules.commands:
+                self.routes.setdefault(alias, (cmd, modules.commands[cmd.lower()]))
+
+        for alias in modules._alias_index:
+            if (name := modules.find_alias(alias)) and name in modules.commands:
+                self.routes.setdefault(alias, (name, modules.commands[name]))
+
+        disabled_watchers = db.get(main.__name__, "disabled_watchers", {})
+        self._watchers = []
+        for func in modules.watchers:
+            modname = str(func.__self__.__class__.strings["name"])
+            self._watchers += [
+                (func, TagPlan(func, disabled_watchers.get(modname)), modname)
+            ]
+
+        # Event shape -> watchers, which can match events of this shape
+        self._watcher_buckets = {}
+        self._tag_plans = {}
+
+    def is_actual(self, db: Database, modules: Modules) -> bool:
+        return (
+            self.db_revision == db.revision(main.__name__)
+            and self.modules_revision == modules.revision
+        )
+
+    def is_chat_allowed(self, chat_id: int) -> bool:
+        return chat_id not in self.blacklist_chats and (
+            not self.whitelist_chats or chat_id in self.whitelist_chats
+        )
+
+    def is_module_allowed(self, chat_id: int, module: str) -> bool:
+        key = f"{chat_id}.{module}"
+        return key not in self.blacklist_chats and (
+            not self.whitelist_modules or key in self.whitelist_modules
+        )
+
+    def watchers(
+        self,
+        shape: typing.Tuple[int, bool, bool, bool, int],
+    ) -> typing.List[typing.Tuple[callable, TagPlan, str]]:
+        """Get watchers, which can match event of given shape"""
+        if shape not in self._watcher_buckets:
+            self._watcher_buckets[shape] = [
+                watcher for watcher in self._watchers if watcher[1].accepts(shape)
+            ]
+
+        return self._watcher_buckets[shape]
 
-    asyncio.get_event_loop().call_later(delay, inner)
+    def tag_plan(self, func: callable) -> TagPlan:
+        """Get compiled tags of command"""
+        if func not in self._tag_plans:
+            self._tag_plans[func] = TagPlan(func)
+
+        return self._tag_plans[func]
+
+    def dispatch(self, command: str) -> typing.Tuple[str, typing.Optional[callable]]:
+        """Same as `Modules.dispatch`, but with a single dict lookup"""
+        txt, func = self.routes.get(command.lower(), (None, None))
+        return (txt or command), func
 
 
 class CommandDispatcher:
@@ -96,10 +389,35 @@ class CommandDispatcher:
         self.client = client
         self._db = db
 
-        self._ratelimit_storage_user = collections.defaultdict(int)
-        self._ratelimit_storage_chat = collections.defaultdict(int)
-        self._ratelimit_max_user = db.get(__name__, "ratelimit_max_user", 30)
-        self._ratelimit_max_chat = db.get(__name__, "ratelimit_max_chat", 100)
+        # Buckets drain by `ratelimit_decay` units per second, so a regular
+        # command (severity 2) is forgotten in 4 seconds, while full user
+        # bucket drains in a minute
+        ratelimit_decay = db.get(__name__, "ratelimit_decay", 0.5)
+        if not isinstance(ratelimit_decay, (int, float)) or ratelimit_decay <= 0:
+            logger.warning("Invalid ratelimit_decay %s, using 0.5", ratelimit_decay)
+            ratelimit_decay = 0.5
+
+        self._ratelimit_user = RateLimiter(
+            db.get(__name__, "ratelimit_max_user", 30),
+            ratelimit_decay,
+        )
+        self._ratelimit_chat = RateLimiter(
+            db.get(__name__, "ratelimit_max_chat", 100),
+            ratelimit_decay,
+        )
+
+        self.executor = HandlerExecutor(
+            max_tasks=db.get(__name__, "max_tasks", 100),
+            max_module_tasks=db.get(__name__, "max_module_tasks", 20),
+            max_queue=db.get(__name__, "max_queue", 1000),
+            overflow=db.get(__name__, "overflow", "drop_oldest"),
+        )
+        self._handler_timeout = self._validate_timeout(
+            db.get(__name__, "handler_timeout", None),
+            "handler_timeout",
+        )
+        # Handlers with invalid `timeout` tag, which are already reported
+        self._invalid_timeouts = set()
 
         self.security = security.SecurityManager(client, db)
 
@@ -118,6 +436,15 @@ class CommandDispatcher:
         )
 
         self.raw_handlers = []
+        self._routing = None
+
+    @property
+    def routing(self) -> RoutingSnapshot:
+        """Get actual routing snapshot, rebuilding it if it's outdated"""
+        if not self._routing or not self._routing.is_actual(self._db, self._modules):
+            self._routing = RoutingSnapshot(self._db, self._modules)
+
+        return self._routing
 
     async def _handle_ratelimit(self, message: Message, func: callable) -> bool:
         if await self.security.check(
@@ -127,45 +454,38 @@ class CommandDispatcher:
             return True
 
         func = getattr(func, "__func__", func)
-        ret = True
-        chat = self._ratelimit_storage_chat[message.chat_id]
-
-        if message.sender_id:
-            user = self._ratelimit_storage_user[message.sender_id]
-            severity = (5 if getattr(func, "ratelimit", False) else 2) * (
-                (user + chat) // 30 + 1
-            )
-            user += severity
-            self._ratelimit_storage_user[message.sender_id] = user
-            if user > self._ratelimit_max_user:
-                ret = False
-            else:
-                self._ratelimit_storage_chat[message.chat_id] = chat
-
-            _decrement_ratelimit(
-                self._ratelimit_max_user * severity,
-                self._ratelimit_storage_user,
-                message.sender_id,
-                severity,
-            )
-        else:
-            severity = (5 if getattr(func, "ratelimit", False) else 2) * (
-                chat // 15 + 1
-            )
-
-        chat += severity
-
-        if chat > self._ratelimit_max_chat:
-            ret = False
-
-        _decrement_ratelimit(
-            self._ratelimit_max_chat * severity,
-            self._ratelimit_storage_chat,
+        return self.ratelimit(
+            message.sender_id,
             message.chat_id,
-            severity,
+            getattr(func, "ratelimit", False),
         )
 
-        return ret
+    def ratelimit(
+        self,
+        user_id: typing.Optional[int],
+        chat_id: typing.Optional[int],
+        strict: bool = False,
+    ) -> bool:
+        """
+        Account request of user in chat. Shared by commands and inline callbacks
+        :param user_id: Sender of request, if known
+        :param chat_id: Chat, where request was made, if any
+        :param strict: Whether request is costly, e.g. command is marked with
+                       `@loader.ratelimit`
+        :return: `False` if request must be rejected
+        """
+        base = 5 if strict else 2
+        chat = self._ratelimit_chat.level(chat_id) if chat_id is not None else 0
+
+        if user_id:
+            user = self._ratelimit_user.level(user_id)
+            severity = base * ((user + chat) // 30 + 1)
+            if not self._ratelimit_user.hit(user_id, severity):
+                return False
+        else:
+            severity = base * (chat // 15 + 1)
+
+        return chat_id is None or self._ratelimit_chat.hit(chat_id, severity)
 
     def _handle_grep(self, message: Message) -> Message:
         # Allow escaping grep with double stick
@@ -257,44 +577,82 @@ class CommandDispatcher:
         event: typing.Union[events.NewMessage, events.MessageDeleted],
         watcher: bool = False,
     ) -> typing.Union[bool, typing.Tuple[Message, str, str, callable]]:
-        if not hasattr(event, "message") or not hasattr(event.message, "message"):
+        """
+        Get command, which event invokes. Event is parsed only once, and the
+        result is shared by the command handler and all the watchers
+        :param event: Event to parse
+        :param watcher: Whether the result is requested by watcher tags
+        :return: Message, prefix, command name and handler or `False`
+        """
+        context = get_event_context(event)
+        if context.command is _MISSING:
+            context.command = await self._parse_command(event)
+
+        result = context.command
+        if result is _ESCAPED:
+            if not watcher:
+                message = event.message
+                await message.edit(
+                    message.message[1:],
+                    parse_mode=lambda s: (
+                        s,
+                        utils.relocate_entities(message.entities, -1, message.message)
+                        or (),
+                    ),
+                )
+
             return False
 
-        prefix = self._db.get(main.__name__, "command_prefix", False) or "."
-        change = str.maketrans(ru_keys + en_keys, en_keys + ru_keys)
-        message = utils.censor(event.message)
+        if result is _DATACHAT:
+            if not watcher:
+                logger.warning("Ignoring message in datachat \\ logging chat")
+
+            return False
+
+        if result and self.routing.grep and not watcher:
+            message, prefix, txt, func = result
+            return self._handle_grep(message), prefix, txt, func
+
+        return result
+
+    async def _parse_command(
+        self,
+        event: typing.Union[events.NewMessage, events.MessageDeleted],
+    ) -> typing.Any:
+        if not hasattr(event, "message") or not hasattr(event.message, "message"):
+            return False
 
         if not event.message.message:
             return False
 
+        routing = self.routing
+        prefix = routing.prefix
+
+        # Cheap rejection of non-command messages before any other processing
+        if not event.message.message.startswith((prefix, routing.translated_prefix)):
+            return False
+
+        message = utils.censor(event.message)
+
         if (
             message.out
             and len(message.message) > 2
             and (
-                message.message.startswith(prefix * 2)
+                message.message.startswith(routing.double_prefix)
                 and any(s != prefix for s in message.message)
-                or message.message.startswith(str.translate(prefix * 2, change))
-                and any(s != str.translate(prefix, change) for s in message.message)
+                or message.message.startswith(routing.translated_double_prefix)
+                and any(s != routing.translated_prefix for s in message.message)
             )
         ):
             # Allow escaping commands using .'s
-            if not watcher:
-                await message.edit(
-                    message.message[1:],
-                    parse_mode=lambda s: (
-                        s,
-                        utils.relocate_entities(message.entities, -1, message.message)
-                        or (),
-                    ),
-                )
-            return False
+            return _ESCAPED
 
         if (
-            event.message.message.startswith(str.translate(prefix, change))
-            and str.translate(prefix, change) != prefix
+            event.message.message.startswith(routing.translated_prefix)
+            and routing.translated_prefix != prefix
         ):
-            message.message = str.translate(message.message, change)
-            message.text = str.translate(message.text, change)
+            message.message = str.translate(message.message, layout_change)
+            message.text = str.translate(message.text, layout_change)
         elif not event.message.message.startswith(prefix):
             return False
 
@@ -307,13 +665,7 @@ class CommandDispatcher:
         ):
             return False
 
-        blacklist_chats = self._db.get(main.__name__, "blacklist_chats", [])
-        whitelist_chats = self._db.get(main.__name__, "whitelist_chats", [])
-        whitelist_modules = self._db.get(main.__name__, "whitelist_modules", [])
-
-        if utils.get_chat_id(message) in blacklist_chats or (
-            whitelist_chats and utils.get_chat_id(message) not in whitelist_chats
-        ):
+        if not routing.is_chat_allowed(utils.get_chat_id(message)):
             return False
 
         if not message.message or len(message.message) == 1:
@@ -343,15 +695,14 @@ class CommandDispatcher:
             pass
         elif (
             not event.is_private
-            and not self._db.get(main.__name__, "no_nickname", False)
-            and command not in self._db.get(main.__name__, "nonickcmds", [])
-            and initiator not in self._db.get(main.__name__, "nonickusers", [])
-            and utils.get_chat_id(event)
-            not in self._db.get(main.__name__, "nonickchats", [])
+            and not routing.no_nickname
+            and command not in routing.nonickcmds
+            and initiator not in routing.nonickusers
+            and utils.get_chat_id(event) not in routing.nonickchats
         ):
             return False
 
-        txt, func = self._modules.dispatch(tag[0])
+        txt, func = routing.dispatch(tag[0])
 
         if (
             not func
@@ -379,27 +730,19 @@ class CommandDispatcher:
             and message.chat.title.startswith("netfoll-")
             and message.chat.title != "netfoll-logs"
         ):
-            if not watcher:
-                logger.warning("Ignoring message in datachat \\ logging chat")
-            return False
+            return _DATACHAT
 
         message.message = prefix + txt + message.message[len(prefix + command) :]
 
-        if (
-            f"{str(utils.get_chat_id(message))}.{func.__self__.__module__}"
-            in blacklist_chats
-            or whitelist_modules
-            and f"{utils.get_chat_id(message)}.{func.__self__.__module__}"
-            not in whitelist_modules
+        if not routing.is_module_allowed(
+            utils.get_chat_id(message),
+            func.__self__.__module__,
         ):
             return False
 
         if await self._handle_tags(event, func):
             return False
 
-        if self._db.get(main.__name__, "grep", False) and not watcher:
-            message = self._handle_grep(message)
-
         return message, prefix, txt, func
 
     async def handle_raw(self, event: events.Raw):
@@ -422,12 +765,15 @@ class CommandDispatcher:
 
         message, _, _, func = message
 
-        asyncio.ensure_future(
-            self.future_dispatcher(
-                func,
-                message,
-                self.command_exc,
-            )
+        await self._submit(
+            func,
+            message,
+            self.command_exc,
+            (
+                _executor.OWNER
+                if message.out or self.security.is_trusted(message.sender_id)
+                else _executor.COMMANDS
+            ),
         )
 
     async def command_exc(self, _, message: Message):
@@ -493,133 +839,7 @@ class CommandDispatcher:
         event: typing.Union[events.NewMessage, events.MessageDeleted],
         func: callable,
     ) -> bool:
-        message = getattr(event, "message", event)
-        return (
-            (
-                getattr(func, "no_commands", False)
-                and await self._handle_command(event, watcher=True)
-            )
-            or (
-                getattr(func, "only_commands", False)
-                and not await self._handle_command(event, watcher=True)
-            )
-            or (getattr(func, "out", False) and not getattr(message, "out", True))
-            or (getattr(func, "in", False) and getattr(message, "out", True))
-            or (
-                getattr(func, "only_messages", False)
-                and not isinstance(message, Message)
-            )
-            or (
-                getattr(func, "editable", False)
-                and (
-                    getattr(message, "fwd_from", False)
-                    or not getattr(message, "out", False)
-                    or getattr(message, "sticker", False)
-                    or getattr(message, "via_bot_id", False)
-                )
-            )
-            or (
-                getattr(func, "no_media", False)
-                and isinstance(message, Message)
-                and getattr(message, "media", False)
-            )
-            or (
-                getattr(func, "only_media", False)
-                and (
-                    not isinstance(message, Message)
-                    or not getattr(message, "media", False)
-                )
-            )
-            or (
-                getattr(func, "only_photos", False)
-                and not utils.mime_type(message).startswith("image/")
-            )
-            or (
-                getattr(func, "only_videos", False)
-                and not utils.mime_type(message).startswith("video/")
-            )
-            or (
-                getattr(func, "only_audios", False)
-                and not utils.mime_type(message).startswith("audio/")
-            )
-            or (
-                getattr(func, "only_stickers", False)
-                and not getattr(message, "sticker", False)
-            )
-            or (
-                getattr(func, "only_docs", False)
-                and not getattr(message, "document", False)
-            )
-            or (
-                getattr(func, "only_inline", False)
-                and not getattr(message, "via_bot_id", False)
-            )
-            or (
-                getattr(func, "only_channels", False)
-                and (
-                    not getattr(message, "is_channel", False)
-                    and getattr(message, "is_group", False)
-                    or getattr(message, "is_private", False)
-                )
-            )
-            or (
-                getattr(func, "only_groups", False)
-                and not getattr(message, "is_group", False)
-            )
-            or (
-                getattr(func, "only_pm", False)
-                and not getattr(message, "is_private", False)
-            )
-            or (
-                getattr(func, "startswith", False)
-                and (
-                    not isinstance(message, Message)
-                    or isinstance(func.startswith, str)
-                    and not message.raw_text.startswith(func.startswith)
-                )
-            )
-            or (
-                getattr(func, "endswith", False)
-                and (
-                    not isinstance(message, Message)
-                    or isinstance(func.endswith, str)
-                    and not message.raw_text.endswith(func.endswith)
-                )
-            )
-            or (
-                getattr(func, "contains", False)
-                and (
-                    not isinstance(message, Message)
-                    or isinstance(func.contains, str)
-                    and func.contains not in message.raw_text
-                )
-            )
-            or (
-                getattr(func, "filter", False)
-                and callable(func.filter)
-                and not func.filter(message)
-            )
-            or (
-                getattr(func, "from_id", False)
-                and getattr(message, "sender_id", None) != func.from_id
-            )
-            or (
-                getattr(func, "chat_id", False)
-                and utils.get_chat_id(message)
-                != (
-                    func.chat_id
-                    if not str(func.chat_id).startswith("-100")
-                    else int(str(func.chat_id)[4:])
-                )
-            )
-            or (
-                getattr(func, "regex", False)
-                and (
-                    not isinstance(message, Message)
-                    or not re.search(func.regex, message.raw_text)
-                )
-            )
-        )
+        return await self.routing.tag_plan(func).ignores(self, event)
 
     async def handle_incoming(
         self,
@@ -627,43 +847,19 @@ class CommandDispatcher:
     ):
         """Handle all incoming messages"""
         message = utils.censor(getattr(event, "message", event))
+        routing = self.routing
 
-        blacklist_chats = self._db.get(main.__name__, "blacklist_chats", [])
-        whitelist_chats = self._db.get(main.__name__, "whitelist_chats", [])
-        whitelist_modules = self._db.get(main.__name__, "whitelist_modules", [])
-
-        if utils.get_chat_id(message) in blacklist_chats or (
-            whitelist_chats and utils.get_chat_id(message) not in whitelist_chats
-        ):
+        chat_id = utils.get_chat_id(message)
+        if not routing.is_chat_allowed(chat_id):
             logger.debug("Message is blacklisted")
             return
 
-        for func in self._modules.watchers:
-            bl = self._db.get(main.__name__, "disabled_watchers", {})
-            modname = str(func.__self__.__class__.strings["name"])
-
-            if (
-                modname in bl
-                and isinstance(message, Message)
-                and (
-                    "*" in bl[modname]
-                    or utils.get_chat_id(message) in bl[modname]
-                    or "only_chats" in bl[modname]
-                    and message.is_private
-                    or "only_pm" in bl[modname]
-                    and not message.is_private
-                    or "out" in bl[modname]
-                    and not message.out
-                    or "in" in bl[modname]
-                    and message.out
-                )
-                or f"{str(utils.get_chat_id(message))}.{func.__self__.__module__}"
-                in blacklist_chats
-                or whitelist_modules
-                and f"{str(utils.get_chat_id(message))}.{func.__self__.__module__}"
-                not in whitelist_modules
-                or await self._handle_tags(event, func)
-            ):
+        shape = _event_shape(message)
+        for func, plan, modname in routing.watchers(shape):
+            if not routing.is_module_allowed(
+                chat_id,
+                func.__self__.__module__,
+            ) or await plan.ignores(self, event, shape):
                 logger.debug("Ignored watcher of module %s", modname)
                 continue
 
@@ -673,15 +869,60 @@ class CommandDispatcher:
                 with contextlib.suppress(UnicodeDecodeError):
                     if not hasattr(message, placeholder):
                         setattr(message, placeholder, "")
-            # Run watcher via ensure_future so in case user has a lot
+            # Run watcher as a separate task so in case user has a lot
             # of watchers with long actions, they can run simultaneously
-            asyncio.ensure_future(
-                self.future_dispatcher(
-                    func,
-                    message,
-                    self.watcher_exc,
-                )
+            await self._submit(func, message, self.watcher_exc, _executor.WATCHERS)
+
+    async def _submit(
+        self,
+        func: callable,
+        message: Message,
+        exception_handler: callable,
+        lane: str,
+    ) -> bool:
+        """Run handler via executor, which bounds the number of running handlers"""
+        return await self.executor.submit(
+            getattr(func, "__self__", None),
+            functools.partial(self.future_dispatcher, func, message, exception_handler),
+            self._timeout(func),
+            getattr(func, "__qualname__", repr(func)),
+            lane,
+        )
+
+    @staticmethod
+    def _validate_timeout(timeout: typing.Any, name: str) -> typing.Optional[float]:
+        if timeout is None:
+            return None
+
+        if (
+            isinstance(timeout, bool)
+            or not isinstance(timeout, (int, float))
+            or timeout <= 0
+        ):
+            logger.warning(
+                "Ignoring invalid %s %r, it must be positive number",
+                name,
+                timeout,
             )
+            return None
+
+        return timeout
+
+    def _timeout(self, func: callable) -> typing.Optional[float]:
+        """Get timeout of handler from its `timeout` tag or the default one"""
+        timeout = getattr(func, "timeout", None)
+        if timeout is None:
+            return self._handler_timeout
+
+        name = getattr(func, "__qualname__", repr(func))
+        if name in self._invalid_timeouts:
+            return self._handler_timeout
+
+        if self._validate_timeout(timeout, f"timeout of {name}") is None:
+            self._invalid_timeouts.add(name)
+            return self._handler_timeout
+
+        return timeout
 
     async def future_dispatcher(
         self,
@@ -691,8 +932,8 @@ class CommandDispatcher:
         *args,
     ):
         # Will be used to determine, which client caused logging messages
-        # parsed via inspect.stack()
-        _hikka_client_id_logging_tag = copy.copy(self.client.tg_id)  # skipcq
+        client_id_tag.set(self.client.tg_id)
+        current_module.set(getattr(func, "__self__", None))
         try:
             await func(message)
         except Exception as e:
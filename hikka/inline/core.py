@@ -9,17 +9,24 @@
 # 🌐 https://github.com/MXRRI/Netfoll
 
 import asyncio
+import collections
+import contextlib
+import heapq
 import logging
+import os
 import time
+import typing
 
 from aiogram import Bot, Dispatcher
-from aiogram.types import ParseMode
+from aiogram.types import ParseMode, Update
 from aiogram.utils.exceptions import TerminatedByOtherGetUpdates, Unauthorized
 from telethon.errors.rpcerrorlist import InputUserDeactivatedError, YouBlockedUserError
 from telethon.tl.functions.contacts import UnblockRequest
 from telethon.utils import get_display_name
 
-from ..database import Database
+from .. import main, utils
+from .._internal import client_context
+from ..database import DATA_DIR, Database
 from ..tl_cache import CustomTelegramClient
 from .bot_pm import BotPM
 from .events import Events
@@ -27,12 +34,126 @@ from .form import Form
 from .gallery import Gallery
 from .list import List
 from .query_gallery import QueryGallery
+from .store import UnitStore
 from .token_obtainment import TokenObtainment
 from .utils import Utils
 
 logger = logging.getLogger(__name__)
 
 
+class UnitRegistry(collections.OrderedDict):
+    """
+    Storage of inline units, which tracks their expiration. Units with `ttl`
+    are queued in min-heap by expiration time. When there are more than
+    `max_units` units, least recently used ones without `ttl` are evicted.
+    `on_remove` is called with `evicted=True` for them
+    """
+
+    def __init__(
+        self,
+        max_units: int,
+        on_remove: typing.Callable[[str, dict, bool], None],
+    ):
+        super().__init__()
+        self._max_units = max_units
+        self._on_remove = on_remove
+        # (ttl, unit_id). Entries of removed units are skipped, when popped
+        self._heap = []
+        # Set, when unit expiring earlier than all the others is added
+        self.wakeup = asyncio.Event()
+
+    def __setitem__(self, unit_id: str, unit: dict):
+        super().__setitem__(unit_id, unit)
+        self.move_to_end(unit_id)
+        if unit.get("ttl"):
+            self._schedule(unit_id, unit["ttl"])
+
+        while len(self) > self._max_units:
+            self._evict(unit_id)
+
+    def __delitem__(self, unit_id: str):
+        unit = super().__getitem__(unit_id)
+        super().__delitem__(unit_id)
+        self._on_remove(unit_id, unit, False)
+
+    def pop(self, unit_id: str, *default) -> typing.Any:
+        if unit_id not in self:
+            if default:
+                return default[0]
+
+            raise KeyError(unit_id)
+
+        unit = super().__getitem__(unit_id)
+        del self[unit_id]
+        return unit
+
+    def clear(self):
+        for unit_id in list(self):
+            del self[unit_id]
+
+    def copy(self) -> dict:
+        return dict(self)
+
+    def _schedule(self, unit_id: str, ttl: float):
+        if not self._heap or ttl < self._heap[0][0]:
+            self.wakeup.set()
+
+        heapq.heappush(self._heap, (ttl, unit_id))
+
+    def _evict(self, keep: str):
+        """
+        Remove the least recently used unit without `ttl`, or just the least
+        recently used one, if all of them have it
+        :param keep: Unit, which is being inserted and must not be evicted
+        """
+        unit_id = next(
+            (
+                unit_id
+                for unit_id, unit in self.items()
+                if unit_id != keep and not unit.get("ttl")
+            ),
+            next(unit_id for unit_id in self if unit_id != keep),
+        )
+        logger.debug("Evicting inline unit %s, because limit is reached", unit_id)
+        unit = super().__getitem__(unit_id)
+        super().__delitem__(unit_id)
+        self._on_remove(unit_id, unit, True)
+
+    def touch(self, unit_id: str):
+        """Mark unit as recently used, so it's evicted last"""
+        if unit_id in self:
+            self.move_to_end(unit_id)
+
+    @property
+    def next_expiry(self) -> typing.Optional[float]:
+        """Time, when the next unit expires"""
+        return self._heap[0][0] if self._heap else None
+
+    def pop_expired(self, now: float) -> typing.List[str]:
+        """
+        Remove units, which ttl is due
+        :param now: Current time
+        :return: Ids of removed units
+        """
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            ttl, unit_id = heapq.heappop(self._heap)
+            if unit_id not in self:
+                continue
+
+            if (actual_ttl := super().__getitem__(unit_id).get("ttl")) != ttl:
+                # Ttl was changed after unit had been added
+                if actual_ttl:
+                    self._schedule(unit_id, actual_ttl)
+
+                continue
+
+            del self[unit_id]
+            expired += [unit_id]
+
+        return expired
+
+
 class InlineManager(
     Utils,
     Events,
@@ -54,24 +175,56 @@ class InlineManager(
         self._db = db
         self._allmodules = allmodules
 
-        self._units = {}
+        # Only recently used units are kept in memory, the rest are restored
+        # from `_store` on demand
+        self._units = UnitRegistry(1000, self._on_unit_removed)
+        self._store = None
+        # Last scheduled write to `_store`. Each write waits for the previous one
+        self._store_write_task = None
         self._custom_map = {}
+        # callback_data -> (unit_id, button) of live units' buttons
+        self._callback_index = {}
+        # _switch_query -> (unit_id, button) of live units' input buttons
+        self._switch_query_index = {}
+        # unit_id -> (callback_data, _switch_query) of its indexed buttons and
+        # callback data of custom map entries, registered by its last render
+        self._unit_index_keys = {}
+        self._owners_cache = (None, frozenset())
         self.fsm = {}
         self._web_auth_tokens = []
 
-        self._markup_ttl = 60 * 60 * 24
         self.init_complete = False
 
         self._token = db.get("hikka.inline", "bot_token", False)
 
     async def _cleaner(self):
-        """Cleans outdated inline units"""
+        """Unloads inline units, when their ttl is due"""
         while True:
-            for unit_id, unit in self._units.copy().items():
-                if (unit.get("ttl") or (time.time() + self._markup_ttl)) < time.time():
-                    del self._units[unit_id]
-
-            await asyncio.sleep(5)
+            self._units.wakeup.clear()
+            if expired := self._units.pop_expired(time.time()):
+                logger.debug("Unloaded %s expired inline units", len(expired))
+
+            timeout = (
+                max(self._units.next_expiry - time.time(), 0)
+                if self._units.next_expiry is not None
+                else None
+            )
+
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._units.wakeup.wait(), timeout)
+
+    def _on_unit_removed(self, unit_id: str, unit: dict, evicted: bool):
+        """
+        Free indexes and callbacks of removed unit. Evicted units are saved
+        to the store, while the others are removed from it
+        """
+        if evicted:
+            self._persist_unit(unit_id, unit=unit)
+        elif self._store is not None:
+            self._store_write(self._store.delete, unit_id)
+
+        self._unindex_unit(unit_id)
+        self._custom_map.pop(unit.get("btn_call_data"), None)
 
     async def register_manager(
         self,
@@ -93,6 +246,11 @@ class InlineManager(
         # We successfully asserted token, so set `init_complete` to `True`
         self.init_complete = True
 
+        if self._store is None:
+            self._store = UnitStore(os.path.join(DATA_DIR, f"inline-{self._me}.db"))
+            if purged := await utils.run_sync(self._store.purge):
+                logger.debug("Removed %s stale inline units from store", purged)
+
         # Create bot instance and dispatcher
         self.bot = Bot(token=self._token, parse_mode=ParseMode.HTML)
         Bot.set_current(self.bot)
@@ -177,12 +335,58 @@ class InlineManager(
         # Start polling as the separate task, just in case we will need
         # to force stop this coro. It should be cancelled only by `stop`
         # because it stops the bot from getting updates
-        self._task = asyncio.ensure_future(self._dp.start_polling())
+        self._task = (
+            None
+            if await self._set_webhook()
+            else asyncio.ensure_future(self._dp.start_polling())
+        )
         self._cleaner_task = asyncio.ensure_future(self._cleaner())
 
+    async def _set_webhook(self) -> bool:
+        """
+        Subscribe the bot to updates via webhook of the web server, if its
+        public url is configured. Otherwise remove webhook, set earlier
+        :return: `True` if webhook is set, and updates must not be polled
+        """
+        web = getattr(main.hikka, "web", None)
+        if web and (webhook := web.add_webhook(self)):
+            url, secret = webhook
+            try:
+                # aiogram 2.19 doesn't support `secret_token` in `set_webhook`
+                await self.bot.request(
+                    "setWebhook",
+                    {"url": url, "secret_token": secret},
+                )
+            except Exception:
+                logger.exception("Can't set webhook, falling back to polling")
+                web.remove_webhook(self)
+            else:
+                self._db.set("hikka.inline", "webhook", True)
+                return True
+
+        if self._db.get("hikka.inline", "webhook", False):
+            await self.bot.delete_webhook()
+            self._db.set("hikka.inline", "webhook", False)
+
+        return False
+
+    async def feed_update(self, update: dict):
+        """Process update of the bot, received via webhook"""
+        Bot.set_current(self.bot)
+        Dispatcher.set_current(self._dp)
+        with client_context(self._me):
+            try:
+                await self._dp.process_update(Update(**update))
+            except Exception:
+                logger.exception("Error while processing webhook update")
+
     async def _stop(self):
-        self._task.cancel()
-        self._dp.stop_polling()
+        if self._task is not None:
+            self._task.cancel()
+            self._dp.stop_polling()
+        elif web := getattr(main.hikka, "web", None):
+            web.remove_webhook(self)
+
         self._cleaner_task.cancel()
 
     def pop_web_auth_token(self, token) -> bool:
@@ -25,6 +25,7 @@ from aiogram.types import (
 from aiogram.types import Message as AiogramMessage
 
 from .. import utils
+from .._internal import module_context
 from .types import BotInlineCall, InlineCall, InlineQuery, InlineUnit
 
 logger = logging.getLogger(__name__)
@@ -71,7 +72,8 @@ class Events(InlineUnit):
             instance = InlineQuery(inline_query)
 
             try:
-                result = await self._allmodules.inline_handlers[cmd](instance)
+                with module_context(self._allmodules.inline_handlers[cmd]):
+                    result = await self._allmodules.inline_handlers[cmd](instance)
             except Exception:
                 logger.exception("Error on running inline watcher!")
                 return
@@ -209,17 +211,32 @@ class Events(InlineUnit):
             self._web_auth_tokens += [re.search(r"authorize_web_(.{8})", call.data)[1]]
             return
 
+        dispatcher = self._client.dispatcher
+        if (
+            call.from_user.id != self._me
+            and not dispatcher.security.is_trusted(call.from_user.id)
+            and not dispatcher.ratelimit(
+                call.from_user.id,
+                call.message.chat.id if call.message else None,
+            )
+        ):
+            await call.answer(
+                self._client.loader.lookup("translations").strings("button429")
+            )
+            return
+
         # First, dispatch all registered callback handlers
         for func in self._allmodules.callback_handlers.values():
             if await self.check_inline_security(func=func, user=call.from_user.id):
                 try:
-                    await func(
-                        (
-                            BotInlineCall
-                            if getattr(getattr(call, "message", None), "chat", None)
-                            else InlineCall
-                        )(call, self, None)
-                    )
+                    with module_context(func):
+                        await func(
+                            (
+                                BotInlineCall
+                                if getattr(getattr(call, "message", None), "chat", None)
+                                else InlineCall
+                            )(call, self, None)
+                        )
                 except Exception:
                     logger.exception("Error on running callback watcher!")
                     await call.answer(
@@ -228,69 +245,60 @@ class Events(InlineUnit):
                     )
                     continue
 
-        for unit_id, unit in self._units.copy().items():
-            for button in utils.array_sum(unit.get("buttons", [])):
-                if not isinstance(button, dict):
-                    logger.warning(
-                        "Can't process update, because of corrupted button: %s",
-                        button,
-                    )
-                    continue
+        if call.data not in self._callback_index and call.data not in self._custom_map:
+            self._rehydrate(call.data)
 
-                if button.get("_callback_data") == call.data:
-                    if (
-                        button.get("disable_security", False)
-                        or unit.get("disable_security", False)
-                        or (
-                            unit.get("force_me", False)
-                            and call.from_user.id == self._me
-                        )
-                        or not unit.get("force_me", False)
-                        and (
-                            await self.check_inline_security(
-                                func=unit.get(
-                                    "perms_map",
-                                    lambda: self._client.dispatcher.security._default,
-                                )(),  # we call it so we can get reloaded rights in runtime
-                                user=call.from_user.id,
-                            )
-                            if "message" in unit
-                            else False
-                        )
-                    ):
-                        pass
-                    elif call.from_user.id not in (
-                        self._client.dispatcher.security._owner
-                        + unit.get("always_allow", [])
-                        + button.get("always_allow", [])
-                    ):
-                        await call.answer(
-                            self._client.loader.lookup("translations").strings(
-                                "button403"
-                            )
-                        )
-                        return
+        if call.data in self._callback_index:
+            unit_id, button = self._callback_index[call.data]
+            unit = self._units[unit_id]
+            self._units.touch(unit_id)
 
-                    try:
-                        result = await button["callback"](
-                            (
-                                BotInlineCall
-                                if getattr(getattr(call, "message", None), "chat", None)
-                                else InlineCall
-                            )(call, self, unit_id),
-                            *button.get("args", []),
-                            **button.get("kwargs", {}),
-                        )
-                    except Exception:
-                        logger.exception("Error on running callback watcher!")
-                        await call.answer(
-                            "Error occurred while processing request. More info in"
-                            " logs",
-                            show_alert=True,
-                        )
-                        return
+            if (
+                button.get("disable_security", False)
+                or unit.get("disable_security", False)
+                or (unit.get("force_me", False) and call.from_user.id == self._me)
+                or not unit.get("force_me", False)
+                and (
+                    await self.check_inline_security(
+                        func=unit.get(
+                            "perms_map",
+                            lambda: self._client.dispatcher.security._default,
+                        )(),  # we call it so we can get reloaded rights in runtime
+                        user=call.from_user.id,
+                    )
+                    if "message" in unit
+                    else False
+                )
+            ):
+                pass
+            elif (
+                call.from_user.id not in self._client.dispatcher.security._owner
+                and call.from_user.id not in unit.get("always_allow", [])
+                and call.from_user.id not in button.get("always_allow", [])
+            ):
+                await call.answer(
+                    self._client.loader.lookup("translations").strings("button403")
+                )
+                return
 
-                    return result
+            try:
+                with module_context(button["callback"]):
+                    return await button["callback"](
+                        (
+                            BotInlineCall
+                            if getattr(getattr(call, "message", None), "chat", None)
+                            else InlineCall
+                        )(call, self, unit_id),
+                        *button.get("args", []),
+                        **button.get("kwargs", {}),
+                    )
+            except Exception:
+                logger.exception("Error on running callback watcher!")
+                await call.answer(
+                    "Error occurred while processing request. More info in logs",
+                    show_alert=True,
+                )
+                return
 
         if call.data in self._custom_map:
             if (
@@ -323,15 +331,16 @@ class Events(InlineUnit):
                 )
                 return
 
-            await self._custom_map[call.data]["handler"](
-                (
-                    BotInlineCall
-                    if getattr(getattr(call, "message", None), "chat", None)
-                    else InlineCall
-                )(call, self, None),
-                *self._custom_map[call.data].get("args", []),
-                **self._custom_map[call.data].get("kwargs", {}),
-            )
+            with module_context(self._custom_map[call.data]["handler"]):
+                await self._custom_map[call.data]["handler"](
+                    (
+                        BotInlineCall
+                        if getattr(getattr(call, "message", None), "chat", None)
+                        else InlineCall
+                    )(call, self, None),
+                    *self._custom_map[call.data].get("args", []),
+                    **self._custom_map[call.data].get("kwargs", {}),
+                )
             return
 
     async def _chosen_inline_handler(
@@ -353,31 +362,29 @@ class Events(InlineUnit):
                 unit["future"].set()
                 return
 
-        for unit_id, unit in self._units.copy().items():
-            for button in utils.array_sum(unit.get("buttons", [])):
-                if (
-                    "_switch_query" in button
-                    and "input" in button
-                    and button["_switch_query"] == query.split()[0]
-                    and chosen_inline_query.from_user.id
-                    in [self._me]
-                    + self._client.dispatcher.security._owner
-                    + unit.get("always_allow", [])
-                ):
-                    query = query.split(maxsplit=1)[1] if len(query.split()) > 1 else ""
-
-                    try:
+        if query.split()[0] not in self._switch_query_index:
+            self._rehydrate(query.split()[0])
+
+        if query.split()[0] in self._switch_query_index:
+            unit_id, button = self._switch_query_index[query.split()[0]]
+            if (
+                chosen_inline_query.from_user.id in self._owners
+                or chosen_inline_query.from_user.id
+                in self._units[unit_id].get("always_allow", [])
+            ):
+                query = query.split(maxsplit=1)[1] if len(query.split()) > 1 else ""
+
+                try:
+                    with module_context(button["handler"]):
                         return await button["handler"](
                             InlineCall(chosen_inline_query, self, unit_id),
                             query,
                             *button.get("args", []),
                             **button.get("kwargs", {}),
                         )
-                    except Exception:
-                        logger.exception(
-                            "Exception while running chosen query watcher!"
-                        )
-                        return
+                except Exception:
+                    logger.exception("Exception while running chosen query watcher!")
+                    return
 
     async def _query_help(self, inline_query: InlineQuery):
         _help = []
@@ -6,7 +6,6 @@
 # Netfoll Team modifided Hikka files for Netfoll
 # 🌐 https://github.com/MXRRI/Netfoll
 
-import contextlib
 import copy
 import logging
 import os
@@ -34,6 +33,7 @@ from telethon.extensions.html import CUSTOM_EMOJIS
 from telethon.tl.types import Message
 
 from .. import main, utils
+from .._internal import tag_client
 from ..types import HikkaReplyMarkup
 from .types import InlineMessage, InlineUnit
 
@@ -60,6 +60,7 @@ class Placeholder:
 
 
 class Form(InlineUnit):
+    @tag_client(lambda self: self._client.tg_id)
     async def form(
         self,
         text: str,
@@ -110,9 +111,6 @@ class Form(InlineUnit):
         :param silent: Whether the form must be sent silently (w/o "Opening form..." message)
         :return: If form is sent, returns :obj:`InlineMessage`, otherwise returns `False`
         """
-        with contextlib.suppress(AttributeError):
-            _hikka_client_id_logging_tag = copy.copy(self._client.tg_id)
-
         if reply_markup is None:
             reply_markup = []
 
@@ -381,6 +379,7 @@ class Form(InlineUnit):
 
         self._units[unit_id]["chat"] = utils.get_chat_id(m)
         self._units[unit_id]["message_id"] = m.id
+        self._persist_unit(unit_id)
 
         logger.debug(
             f"{type(message)} == Message: {isinstance(message, Message)} ... {message.out=} ... {status_message=}"
@@ -407,37 +406,36 @@ class Form(InlineUnit):
         except IndexError:
             return
 
-        for unit in self._units.copy().values():
-            for button in utils.array_sum(unit.get("buttons", [])):
-                if (
-                    "_switch_query" in button
-                    and "input" in button
-                    and button["_switch_query"] == query
-                    and inline_query.from_user.id
-                    in [self._me]
-                    + self._client.dispatcher.security._owner
-                    + unit.get("always_allow", [])
-                ):
-                    await inline_query.answer(
-                        [
-                            InlineQueryResultArticle(
-                                id=utils.rand(20),
-                                title=button["input"],
-                                description=(
-                                    self._client.loader.lookup("translations")
-                                    .strings("keep_id")
-                                    .format(random.choice(VERIFICATION_EMOJIES))
-                                ),
-                                input_message_content=InputTextMessageContent(
-                                    "🔄 <b>Сохраняю!</b>",
-                                    "HTML",
-                                    disable_web_page_preview=True,
-                                ),
-                            )
-                        ],
-                        cache_time=60,
-                    )
-                    return
+        if query not in self._switch_query_index:
+            self._rehydrate(query)
+
+        if query in self._switch_query_index:
+            unit_id, button = self._switch_query_index[query]
+            if (
+                inline_query.from_user.id in self._owners
+                or inline_query.from_user.id
+                in self._units[unit_id].get("always_allow", [])
+            ):
+                await inline_query.answer(
+                    [
+                        InlineQueryResultArticle(
+                            id=utils.rand(20),
+                            title=button["input"],
+                            description=(
+                                self._client.loader.lookup("translations")
+                                .strings("keep_id")
+                                .format(random.choice(VERIFICATION_EMOJIES))
+                            ),
+                            input_message_content=InputTextMessageContent(
+                                "🔄 <b>Сохраняю!</b>",
+                                "HTML",
+                                disable_web_page_preview=True,
+                            ),
+                        )
+                    ],
+                    cache_time=60,
+                )
+                return
 
         if (
             inline_query.query not in self._units
@@ -7,8 +7,6 @@
 # 🌐 https://github.com/MXRRI/Netfoll
 
 import asyncio
-import contextlib
-import copy
 import functools
 import logging
 import os
@@ -32,6 +30,7 @@ from telethon.extensions.html import CUSTOM_EMOJIS
 from telethon.tl.types import Message
 
 from .. import main, utils
+from .._internal import tag_client
 from ..types import HikkaReplyMarkup
 from .types import InlineMessage, InlineUnit
 
@@ -52,6 +51,7 @@ class ListGalleryHelper:
 
 
 class Gallery(InlineUnit):
+    @tag_client(lambda self: self._client.tg_id)
     async def gallery(
         self,
         message: typing.Union[Message, int],
@@ -95,9 +95,6 @@ class Gallery(InlineUnit):
         :param silent: Whether the gallery must be sent silently (w/o "Opening gallery..." message)
         :return: If gallery is sent, returns :obj:`InlineMessage`, otherwise returns `False`
         """
-        with contextlib.suppress(AttributeError):
-            _hikka_client_id_logging_tag = copy.copy(self._client.tg_id)
-
         custom_buttons = self._validate_markup(custom_buttons)
 
         if not (
@@ -329,6 +326,7 @@ class Gallery(InlineUnit):
 
         self._units[unit_id]["chat"] = utils.get_chat_id(m)
         self._units[unit_id]["message_id"] = m.id
+        self._persist_unit(unit_id)
 
         if isinstance(message, Message) and message.out:
             await message.delete()
@@ -669,7 +667,8 @@ class Gallery(InlineUnit):
                     ]
                 )
                 + [[{"text": "🔻 Close", "callback": callback, "args": ("close",)}]]
-            )
+            ),
+            unit_id,
         )
 
     async def _gallery_inline_handler(self, inline_query: InlineQuery):
@@ -7,8 +7,6 @@
 # 🌐 https://github.com/MXRRI/Netfoll
 
 import asyncio
-import contextlib
-import copy
 import functools
 import logging
 import time
@@ -28,6 +26,7 @@ from telethon.extensions.html import CUSTOM_EMOJIS
 from telethon.tl.types import Message
 
 from .. import main, utils
+from .._internal import tag_client
 from ..types import HikkaReplyMarkup
 from .types import InlineMessage, InlineUnit
 
@@ -35,6 +34,7 @@ logger = logging.getLogger(__name__)
 
 
 class List(InlineUnit):
+    @tag_client(lambda self: self._client.tg_id)
     async def list(
         self,
         message: typing.Union[Message, int],
@@ -68,9 +68,6 @@ class List(InlineUnit):
         :param custom_buttons: Custom buttons to add above native ones
         :return: If list is sent, returns :obj:`InlineMessage`, otherwise returns `False`
         """
-        with contextlib.suppress(AttributeError):
-            _hikka_client_id_logging_tag = copy.copy(self._client.tg_id)
-
         custom_buttons = self._validate_markup(custom_buttons)
 
         if not isinstance(manual_security, bool):
@@ -140,6 +137,7 @@ class List(InlineUnit):
         unit_id = utils.rand(16)
 
         perms_map = None if manual_security else self._find_caller_sec_map()
+        btn_call_data = utils.rand(10)
 
         self._units[unit_id] = {
             "type": "list",
@@ -150,6 +148,7 @@ class List(InlineUnit):
             "uid": unit_id,
             "current_index": 0,
             "strings": strings,
+            "btn_call_data": btn_call_data,
             "future": asyncio.Event(),
             **({"ttl": round(time.time()) + ttl} if ttl else {}),
             **({"force_me": force_me} if force_me else {}),
@@ -161,8 +160,6 @@ class List(InlineUnit):
             **({"custom_buttons": custom_buttons} if custom_buttons else {}),
         }
 
-        btn_call_data = utils.rand(10)
-
         self._custom_map[btn_call_data] = {
             "handler": asyncio.coroutine(
                 functools.partial(
@@ -250,6 +247,7 @@ class List(InlineUnit):
 
         self._units[unit_id]["chat"] = utils.get_chat_id(m)
         self._units[unit_id]["message_id"] = m.id
+        self._persist_unit(unit_id)
 
         if isinstance(message, Message) and message.out:
             await message.delete()
@@ -309,6 +307,7 @@ class List(InlineUnit):
                 unit_id=unit_id,
             )
             + [[{"text": "🔻 Close", "callback": callback, "args": ("close",)}]],
+            unit_id,
         )
 
     async def _list_inline_handler(self, inline_query: InlineQuery):
@@ -0,0 +1,273 @@
+"""Persistent storage of inline units, which makes them survive restarts"""
+
+# ©️ Dan Gazizullin, 2021-2023
+# This file is a part of Hikka Userbot
+# 🌐 https://github.com/hikariatama/Hikka
+# You can redistribute it and/or modify it under the terms of the GNU AGPLv3
+# 🔑 https://www.gnu.org/licenses/agpl-3.0.html
+# Netfoll Team modifided Hikka files for Netfoll
+# 🌐 https://github.com/MXRRI/Netfoll
+
+import functools
+import json
+import logging
+import sqlite3
+import threading
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+# Unit fields, which only make sense in the current process
+TRANSIENT_FIELDS = {
+    "caller",
+    "message",
+    "future",
+    "perms_map",
+    "on_unload",
+    "slideshow",
+}
+
+
+# Units without ttl are kept in store until they are too old or too many
+MAX_AGE = 30 * 24 * 60 * 60
+MAX_UNITS = 10000
+
+
+class NotSerializable(TypeError):
+    """Raised when unit contains value, which can't be saved"""
+
+
+def serialize(
+    value: typing.Any,
+    manager: "InlineManager",  # type: ignore
+) -> typing.Any:
+    """
+    Convert value to JSON-compatible form. Callables are saved as references
+    to methods of modules (by qualified name) or of inline manager itself
+    :param value: Value to convert
+    :param manager: Inline manager, which owns the unit
+    :return: JSON-compatible value
+    :raises NotSerializable: If value can't be converted
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+
+    if isinstance(value, (list, tuple)):
+        return [serialize(item, manager) for item in value]
+
+    if isinstance(value, dict):
+        if not all(isinstance(key, str) for key in value):
+            raise NotSerializable(f"Dict with non-string keys: {value!r}")
+
+        return {key: serialize(item, manager) for key, item in value.items()}
+
+    if isinstance(value, functools.partial):
+        return {
+            "__partial__": serialize(value.func, manager),
+            "args": serialize(value.args, manager),
+            "kwargs": serialize(value.keywords, manager),
+        }
+
+    owner = getattr(value, "__self__", None)
+    if owner is manager:
+        return {"__callable__": "inline", "name": value.__name__}
+
+    # Imported on demand, so store doesn't depend on Telegram libraries
+    from ..types import Module
+    from .gallery import ListGalleryHelper
+
+    if isinstance(value, ListGalleryHelper):
+        return {"__gallery_list__": value.lst}
+
+    if isinstance(owner, Module):
+        return {
+            "__callable__": "module",
+            "qualname": f"{owner.__class__.__name__}.{value.__name__}",
+        }
+
+    if (wrapped := getattr(value, "__wrapped__", None)) is not None:
+        return serialize(wrapped, manager)
+
+    raise NotSerializable(f"Can't serialize {value!r}")
+
+
+def deserialize(
+    value: typing.Any,
+    manager: "InlineManager",  # type: ignore
+) -> typing.Any:
+    """
+    Restore value, converted by `serialize`
+    :raises NotSerializable: If referenced module or method is not loaded
+    """
+    if isinstance(value, list):
+        return [deserialize(item, manager) for item in value]
+
+    if not isinstance(value, dict):
+        return value
+
+    if "__gallery_list__" in value:
+        from .gallery import ListGalleryHelper
+
+        return ListGalleryHelper(value["__gallery_list__"])
+
+    if "__partial__" in value:
+        return functools.partial(
+            deserialize(value["__partial__"], manager),
+            *deserialize(value["args"], manager),
+            **deserialize(value["kwargs"], manager),
+        )
+
+    if value.get("__callable__") == "inline":
+        return getattr(manager, value["name"])
+
+    if value.get("__callable__") == "module":
+        class_name, method = value["qualname"].rsplit(".", 1)
+        module = next(
+            (
+                module
+                for module in manager._allmodules.modules
+                if module.__class__.__name__ == class_name
+            ),
+            None,
+        )
+        if module is None or not hasattr(module, method):
+            raise NotSerializable(f"{value['qualname']} is not loaded")
+
+        return getattr(module, method)
+
+    return {key: deserialize(item, manager) for key, item in value.items()}
+
+
+class UnitStore:
+    """
+    Stores inline units and callbacks, which lead to them, in SQLite
+    database, so units can be unloaded from memory and restored on demand
+    """
+
+    def __init__(self, path: str):
+        # Writes are made from worker threads, while reads are made on loop
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS units (unit_id TEXT PRIMARY KEY, data TEXT"
+            " NOT NULL, ttl REAL, saved REAL NOT NULL DEFAULT 0)"
+        )
+        if "saved" not in {
+            row[1] for row in self._conn.execute("PRAGMA table_info(units)")
+        }:
+            self._conn.execute(
+                "ALTER TABLE units ADD COLUMN saved REAL NOT NULL DEFAULT 0"
+            )
+
+        # Callback data and switch queries of units. `entry` is set for
+        # callbacks, which are routed via custom map rather than unit buttons
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, unit_id TEXT NOT"
+            " NULL, entry TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS keys_unit ON keys (unit_id)")
+        self._conn.commit()
+
+    def save(
+        self,
+        unit_id: str,
+        data: dict,
+        ttl: typing.Optional[float],
+        keys: typing.Iterable[str],
+        entries: typing.Dict[str, dict],
+    ):
+        """
+        Save unit
+        :param unit_id: Unit id
+        :param data: Serialized unit
+        :param ttl: Time, when unit expires
+        :param keys: Callback data and switch queries of unit buttons
+        :param entries: Serialized custom map entries, which belong to unit
+        """
+        with self._lock, self._conn:
+            # Buttons and callbacks of the previous render are replaced
+            self._conn.execute("DELETE FROM keys WHERE unit_id = ?", (unit_id,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO units (unit_id, data, ttl, saved) VALUES (?,"
+                " ?, ?, ?)",
+                (unit_id, json.dumps(data), ttl, time.time()),
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO keys (key, unit_id, entry) VALUES (?, ?, ?)",
+                [(key, unit_id, None) for key in keys if key not in entries]
+                + [
+                    (key, unit_id, json.dumps(entry))
+                    for key, entry in entries.items()
+                ],
+            )
+
+    def find(
+        self,
+        key: str,
+    ) -> typing.Optional[typing.Tuple[str, typing.Optional[dict]]]:
+        """
+        Find unit by callback data or switch query
+        :return: Unit id and custom map entry, if it is saved for this key
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT unit_id, entry FROM keys WHERE key = ?", (key,)
+            ).fetchone()
+
+        if not row:
+            return None
+
+        return row[0], json.loads(row[1]) if row[1] else None
+
+    def entries(self, unit_id: str) -> typing.Dict[str, dict]:
+        """Get serialized custom map entries of unit"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, entry FROM keys WHERE unit_id = ? AND entry IS NOT NULL",
+                (unit_id,),
+            ).fetchall()
+
+        return {key: json.loads(entry) for key, entry in rows}
+
+    def load(self, unit_id: str) -> typing.Optional[dict]:
+        """Load serialized unit, if it is saved and not expired"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, ttl FROM units WHERE unit_id = ?", (unit_id,)
+            ).fetchone()
+
+        if not row or row[1] and row[1] < time.time():
+            return None
+
+        return json.loads(row[0])
+
+    def delete(self, unit_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM units WHERE unit_id = ?", (unit_id,))
+            self._conn.execute("DELETE FROM keys WHERE unit_id = ?", (unit_id,))
+
+    def purge(self, max_age: float = MAX_AGE, max_units: int = MAX_UNITS) -> int:
+        """
+        Remove expired units, units saved more than `max_age` seconds ago
+        and the oldest ones above `max_units`
+        :return: Number of removed units
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            removed = self._conn.execute(
+                "DELETE FROM units WHERE ttl IS NOT NULL AND ttl < ? OR saved < ?",
+                (now, now - max_age),
+            ).rowcount
+            removed += self._conn.execute(
+                "DELETE FROM units WHERE unit_id NOT IN (SELECT unit_id FROM units"
+                " ORDER BY saved DESC LIMIT ?)",
+                (max_units,),
+            ).rowcount
+            self._conn.execute(
+                "DELETE FROM keys WHERE unit_id NOT IN (SELECT unit_id FROM units)"
+            )
+
+        return removed
@@ -13,6 +13,7 @@ import io
 import logging
 import os
 import re
+import sqlite3
 import typing
 from copy import deepcopy
 from urllib.parse import urlparse
@@ -38,17 +39,28 @@ from telethon.utils import resolve_inline_message_id
 
 from .. import utils
 from ..types import HikkaReplyMarkup
+from . import store
 from .types import InlineCall, InlineUnit
 
 logger = logging.getLogger(__name__)
 
+# Callback data and switch queries, generated for unit buttons by `utils.rand`.
+# Other data can't lead to stored unit, so store lookup is skipped for it
+_STORED_KEY = re.compile(r"[a-z0-9]{10}|[a-z0-9]{30}")
+
 
 class Utils(InlineUnit):
     def _generate_markup(
         self,
         markup_obj: typing.Optional[typing.Union[HikkaReplyMarkup, str]],
+        unit_id: typing.Optional[str] = None,
     ) -> typing.Optional[InlineKeyboardMarkup]:
-        """Generate markup for form or list of `dict`s"""
+        """
+        Generate markup for form or list of `dict`s
+        :param markup_obj: Markup itself or id of unit to generate markup of
+        :param unit_id: Unit, which markup belongs to. Its buttons are indexed
+                        for callback queries
+        """
         if not markup_obj:
             return None
 
@@ -66,6 +78,7 @@ class Utils(InlineUnit):
         map_ = self._normalize_markup(map_)
 
         setup_callbacks = False
+        registered = []
 
         for row in map_:
             for button in row:
@@ -105,6 +118,12 @@ class Utils(InlineUnit):
                 if "input" in button and "_switch_query" not in button:
                     button["_switch_query"] = utils.rand(10)
 
+        if isinstance(markup_obj, str):
+            unit_id = markup_obj
+
+        if unit_id is not None:
+            self._index_unit(unit_id)
+
         for row in map_:
             line = []
             for button in row:
@@ -131,6 +150,7 @@ class Utils(InlineUnit):
                             )
                         ]
                         if setup_callbacks:
+                            registered += [button["_callback_data"]]
                             self._custom_map[button["_callback_data"]] = {
                                 "handler": button["callback"],
                                 **(
@@ -209,10 +229,180 @@ class Utils(InlineUnit):
 
             markup.row(*line)
 
+        if unit_id is not None:
+            if unit_id in self._unit_index_keys:
+                self._unit_index_keys[unit_id][2].update(registered)
+
+            self._persist_unit(unit_id)
+
         return markup
 
     generate_markup = _generate_markup
 
+    @property
+    def _owners(self) -> typing.FrozenSet[int]:
+        """
+        Userbot itself and its owners, who can interact with any unit.
+        Rebuilt only when security settings change
+        """
+        from .. import security
+
+        revision = self._db.revision(security.__name__)
+        if self._owners_cache[0] != revision:
+            self._owners_cache = (
+                revision,
+                frozenset([self._me, *self._client.dispatcher.security._owner]),
+            )
+
+        return self._owners_cache[1]
+
+    def _index_unit(self, unit_id: str):
+        """
+        Index callback data and switch queries of unit buttons, so button
+        presses and inline queries are routed via lookup. Callbacks, which
+        were registered by the previous render of unit, are dropped
+        """
+        self._unindex_unit(unit_id)
+        if unit_id not in self._units:
+            return
+
+        callbacks, switch_queries = set(), set()
+        for button in utils.array_sum(self._units[unit_id].get("buttons", [])):
+            if not isinstance(button, dict):
+                continue
+
+            if "_callback_data" in button:
+                self._callback_index[button["_callback_data"]] = (unit_id, button)
+                callbacks.add(button["_callback_data"])
+
+            if "_switch_query" in button and "input" in button:
+                self._switch_query_index[button["_switch_query"]] = (unit_id, button)
+                switch_queries.add(button["_switch_query"])
+
+        self._unit_index_keys[unit_id] = (callbacks, switch_queries, set())
+
+    def _unindex_unit(self, unit_id: str):
+        """Remove unit buttons from indexes along with their callbacks"""
+        callbacks, switch_queries, registered = self._unit_index_keys.pop(
+            unit_id,
+            ((), (), ()),
+        )
+        for callback_data in {*callbacks, *registered}:
+            self._custom_map.pop(callback_data, None)
+
+        for index, keys in (
+            (self._callback_index, callbacks),
+            (self._switch_query_index, switch_queries),
+        ):
+            for key in keys:
+                if index.get(key, (None,))[0] == unit_id:
+                    del index[key]
+
+    def _persist_unit(self, unit_id: str, unit: typing.Optional[dict] = None):
+        """
+        Save unit to the store, so it can be restored after it's unloaded from
+        memory. Units, which refer to anything but methods of modules and
+        inline manager, are kept in memory only
+        :param unit_id: Unit id
+        :param unit: Unit itself, if it's already removed from `_units`
+        """
+        if unit is None:
+            unit = self._units.get(unit_id)
+
+        if self._store is None or unit is None:
+            return
+
+        callbacks, switch_queries, registered = self._unit_index_keys.get(
+            unit_id,
+            ((), (), ()),
+        )
+        keys = {*callbacks, *switch_queries}
+
+        def _strip(value: dict) -> dict:
+            return {
+                key: item
+                for key, item in value.items()
+                if key not in store.TRANSIENT_FIELDS
+            }
+
+        try:
+            data = store.serialize(_strip(unit), self)
+            entries = {
+                callback_data: store.serialize(
+                    _strip(self._custom_map[callback_data]),
+                    self,
+                )
+                for callback_data in {*registered, unit.get("btn_call_data")}
+                if callback_data in self._custom_map and callback_data not in keys
+            }
+        except store.NotSerializable as e:
+            logger.debug("Inline unit %s is kept in memory only: %s", unit_id, e)
+            return
+
+        self._store_write(
+            self._store.save,
+            unit_id,
+            data,
+            unit.get("ttl"),
+            keys,
+            entries,
+        )
+
+    def _store_write(self, func: typing.Callable, *args):
+        """Run write to the store off the event loop, keeping the order of writes"""
+        previous = self._store_write_task
+
+        async def write():
+            if previous is not None:
+                await asyncio.wait([previous])
+
+            try:
+                await utils.run_sync(func, *args)
+            except sqlite3.Error:
+                logger.exception("Can't write inline unit to store")
+
+        self._store_write_task = asyncio.ensure_future(write())
+
+    def _rehydrate(self, key: str) -> bool:
+        """
+        Restore unit, which owns callback data or switch query `key`, from
+        the store
+        :return: `True` if unit was restored
+        """
+        if (
+            self._store is None
+            or not _STORED_KEY.fullmatch(key)
+            or not (found := self._store.find(key))
+        ):
+            return False
+
+        unit_id, entry = found
+        try:
+            if unit_id not in self._units:
+                if (data := self._store.load(unit_id)) is None:
+                    return False
+
+                unit = store.deserialize(data, self)
+                self._units[unit_id] = unit
+                self._index_unit(unit_id)
+                for entry_key, entry in self._store.entries(unit_id).items():
+                    self._custom_map[entry_key] = store.deserialize(entry, self)
+                    if entry_key != unit.get("btn_call_data"):
+                        self._unit_index_keys[unit_id][2].add(entry_key)
+
+                logger.debug("Restored inline unit %s from store", unit_id)
+            elif entry is not None:
+                self._custom_map[key] = store.deserialize(entry, self)
+                if unit_id in self._unit_index_keys and key != self._units[
+                    unit_id
+                ].get("btn_call_data"):
+                    self._unit_index_keys[unit_id][2].add(key)
+        except store.NotSerializable as e:
+            logger.debug("Can't restore inline unit %s: %s", unit_id, e)
+            return False
+
+        return True
+
     async def _close_unit_handler(self, call: InlineCall):
         await call.delete()
 
@@ -344,6 +534,8 @@ class Utils(InlineUnit):
             unit = self._units[unit_id]
 
             unit["buttons"] = reply_markup
+            # Buttons are indexed again, when new markup is generated
+            self._unindex_unit(unit_id)
 
             if isinstance(force_me, bool):
                 unit["force_me"] = force_me
@@ -428,7 +620,7 @@ class Utils(InlineUnit):
                         if inline_message_id
                         else {"chat_id": chat_id, "message_id": message_id}
                     ),
-                    reply_markup=self.generate_markup(reply_markup),
+                    reply_markup=self.generate_markup(reply_markup, unit_id),
                 )
             except Exception:
                 return False
@@ -452,7 +644,8 @@ class Utils(InlineUnit):
                     reply_markup=self.generate_markup(
                         reply_markup
                         if isinstance(reply_markup, list)
-                        else unit.get("buttons", [])
+                        else unit.get("buttons", []),
+                        unit_id,
                     ),
                 )
             except MessageNotModified:
@@ -487,7 +680,8 @@ class Utils(InlineUnit):
                         reply_markup=self.generate_markup(
                             reply_markup
                             if isinstance(reply_markup, list)
-                            else unit.get("buttons", [])
+                            else unit.get("buttons", []),
+                            unit_id,
                         ),
                     )
                 except Exception:
@@ -508,7 +702,8 @@ class Utils(InlineUnit):
                 reply_markup=self.generate_markup(
                     reply_markup
                     if isinstance(reply_markup, list)
-                    else unit.get("buttons", [])
+                    else unit.get("buttons", []),
+                    unit_id,
                 ),
             )
         except RetryAfter as e:
@@ -10,7 +10,6 @@
 
 import asyncio
 import contextlib
-import copy
 import importlib
 import importlib.machinery
 import importlib.util
@@ -20,13 +19,14 @@ import os
 import re
 import sys
 import typing
-from functools import wraps
+from functools import partial, wraps
 from types import FunctionType, ModuleType
 from uuid import uuid4
 
 from telethon.tl.tlobject import TLObject
 
 from . import security, utils, validators, version  # skipcq
+from ._internal import current_module, module_context, tag_client
 from .database import Database
 from .inline.core import InlineManager
 from .translations import Strings, Translator
@@ -110,12 +110,8 @@ class InfiniteLoop:
     def _stop(self, *args, **kwargs):
         self._wait_for_stop.set()
 
+    @tag_client(lambda self: self.module_instance.allmodules.client.tg_id)
     def stop(self, *args, **kwargs):
-        with contextlib.suppress(AttributeError):
-            _hikka_client_id_logging_tag = copy.copy(
-                self.module_instance.allmodules.client.tg_id
-            )
-
         if self._task:
             logger.debug("Stopped loop for method %s", self.func)
             self._wait_for_stop = asyncio.Event()
@@ -127,12 +123,8 @@ class InfiniteLoop:
         logger.debug("Loop is not running")
         return asyncio.ensure_future(stop_placeholder())
 
+    @tag_client(lambda self: self.module_instance.allmodules.client.tg_id)
     def start(self, *args, **kwargs):
-        with contextlib.suppress(AttributeError):
-            _hikka_client_id_logging_tag = copy.copy(
-                self.module_instance.allmodules.client.tg_id
-            )
-
         if not self._task:
             logger.debug("Started loop for method %s", self.func)
             self._task = asyncio.ensure_future(self.actual_loop(*args, **kwargs))
@@ -144,6 +136,8 @@ class InfiniteLoop:
         while not self.module_instance:
             await asyncio.sleep(0.01)
 
+        current_module.set(self.module_instance)
+
         if isinstance(self._stop_clause, str) and self._stop_clause:
             self.module_instance.set(self._stop_clause, True)
 
@@ -161,7 +155,7 @@ class InfiniteLoop:
                 break
 
             try:
-                await self.func(self.module_instance, *args, **kwargs)
+                await self._iteration(*args, **kwargs)
             except StopLoop:
                 break
             except Exception:
@@ -174,6 +168,22 @@ class InfiniteLoop:
 
         self.status = False
 
+    async def _iteration(self, *args, **kwargs):
+        """Run loop iteration in the loops lane of dispatcher, if it's ready"""
+        executor = getattr(
+            getattr(self.module_instance.allmodules.client, "dispatcher", None),
+            "executor",
+            None,
+        )
+        if executor is None:
+            return await self.func(self.module_instance, *args, **kwargs)
+
+        return await executor.run(
+            self.module_instance,
+            partial(self.func, self.module_instance, *args, **kwargs),
+            self.func.__qualname__,
+        )
+
     def __del__(self):
         self.stop()
 
@@ -309,6 +319,7 @@ def tag(*tags, **kwarg_tags):
         • `filter` - Capture only messages that pass given function
         • `from_id` - Capture only messages from given user
         • `chat_id` - Capture only messages from given chat
+        • `timeout` - Cancel handler, if it runs longer than given seconds
         • `thumb_url` - Works for inline command handlers. Will be shown in help
         • `alias` - Set single alias for a command
         • `aliases` - Set multiple aliases for a command
@@ -408,6 +419,16 @@ def raw_handler(*updates: TLObject):
     return inner
 
 
+def get_command_aliases(func: Command) -> typing.List[str]:
+    """Get aliases, set for command via `alias` or `aliases` tags"""
+    if getattr(func, "alias", None) and not (
+        aliases := getattr(func, "aliases", None)
+    ):
+        aliases = [func.alias]
+
+    return aliases or []
+
+
 class Modules:
     """Stores all registered modules"""
 
@@ -428,8 +449,12 @@ class Modules:
         self.libraries = []
         self.watchers = []
         self._log_handlers = []
-        self._core_commands = []
+        self._core_commands = set()
+        # Lowercased alias from command tags -> command name
+        self._alias_index = {}
         self.__approve = []
+        # Increased each time commands, aliases or watchers are changed
+        self.revision = 0
         self.allclients = allclients
         self.client = client
         self._db = db
@@ -460,6 +485,7 @@ class Modules:
             self.inline_handlers = inline_handlers
             self.callback_handlers = callback_handlers
             self.watchers = watchers
+            self._rebuild_alias_index()
 
             logger.debug(
                 "Reloaded %s commands,"
@@ -514,14 +540,12 @@ class Modules:
 
         return loaded
 
+    @tag_client(lambda self: self.client.tg_id)
     async def _register_modules(
         self,
         modules: list,
         origin: str = "<core>",
     ) -> typing.List[Module]:
-        with contextlib.suppress(AttributeError):
-            _hikka_client_id_logging_tag = copy.copy(self.client.tg_id)
-
         loaded = []
 
         for mod in modules:
@@ -587,6 +611,7 @@ class Modules:
 
         return False
 
+    @tag_client(lambda self: self.client.tg_id)
     async def register_module(
         self,
         spec: importlib.machinery.ModuleSpec,
@@ -596,9 +621,6 @@ class Modules:
         is_dragon: bool = False,
     ) -> typing.Union[Module, typing.Tuple[ModuleType, DragonModule]]:
         """Register single module from importlib spec"""
-        with contextlib.suppress(AttributeError):
-            _hikka_client_id_logging_tag = copy.copy(self.client.tg_id)
-
         module = importlib.util.module_from_spec(spec)
         sys.modules[module_name] = module
         spec.loader.exec_module(module)
@@ -647,6 +669,7 @@ class Modules:
     def add_aliases(self, aliases: dict):
         """Saves aliases and applies them to <core>/<file> modules"""
         self.aliases.update(aliases)
+        self.revision += 1
         for alias, cmd in aliases.items():
             self.add_alias(alias, cmd)
 
@@ -662,15 +685,11 @@ class Modules:
                     handler.id,
                 )
 
+    @tag_client(lambda self: self.client.tg_id)
     def register_commands(self, instance: Module):
         """Register commands from instance"""
-        with contextlib.suppress(AttributeError):
-            _hikka_client_id_logging_tag = copy.copy(self.client.tg_id)
-
         if instance.__origin__.startswith("<core"):
-            self._core_commands += list(
-                map(lambda x: x.lower(), list(instance.hikka_commands))
-            )
+            self._core_commands |= {x.lower() for x in instance.hikka_commands}
 
         for _command, cmd in instance.hikka_commands.items():
             # Restrict overwriting core modules' commands
@@ -686,6 +705,11 @@ class Modules:
 
             self.commands.update({_command.lower(): cmd})
 
+            for alias in get_command_aliases(cmd):
+                self._alias_index.setdefault(alias.lower(), _command.lower())
+
+        self.revision += 1
+
         for alias, cmd in self.aliases.copy().items():
             if cmd in instance.hikka_commands:
                 self.add_alias(alias, cmd)
@@ -763,11 +787,9 @@ class Modules:
                     purpose,
                 )
 
+    @tag_client(lambda self: self.client.tg_id)
     def register_watchers(self, instance: Module):
         """Register watcher from instance"""
-        with contextlib.suppress(AttributeError):
-            _hikka_client_id_logging_tag = copy.copy(self.client.tg_id)
-
         for _watcher in self.watchers:
             if _watcher.__self__.__class__.__name__ == instance.__class__.__name__:
                 logger.debug("Removing watcher %s for update", _watcher)
@@ -776,6 +798,8 @@ class Modules:
         for _watcher in instance.hikka_watchers.values():
             self.watchers += [_watcher]
 
+        self.revision += 1
+
     def lookup(
         self,
         modname: str,
@@ -824,11 +848,9 @@ class Modules:
 
         return self._db.get(key, "command_prefix", default)
 
+    @tag_client(lambda self: self.client.tg_id)
     async def complete_registration(self, instance: Module):
         """Complete registration of instance"""
-        with contextlib.suppress(AttributeError):
-            _hikka_client_id_logging_tag = copy.copy(self.client.tg_id)
-
         instance.allmodules = self
         instance.internal_init()
 
@@ -857,6 +879,15 @@ class Modules:
 
         self.modules += [instance]
 
+    def _rebuild_alias_index(self):
+        """Rebuild alias index from scratch, e.g. after commands were removed"""
+        self._alias_index = {}
+        for command_name, _command in self.commands.items():
+            for alias in get_command_aliases(_command):
+                self._alias_index.setdefault(alias.lower(), command_name)
+
+        self.revision += 1
+
     def find_alias(
         self,
         alias: str,
@@ -865,22 +896,9 @@ class Modules:
         if not alias:
             return None
 
-        for command_name, _command in self.commands.items():
-            aliases = []
-            if getattr(_command, "alias", None) and not (
-                aliases := getattr(_command, "aliases", None)
-            ):
-                aliases = [_command.alias]
-
-            if not aliases:
-                continue
-
-            if any(
-                alias.lower() == _alias.lower()
-                and alias.lower() not in self._core_commands
-                for _alias in aliases
-            ):
-                return command_name
+        lowered = alias.lower()
+        if lowered in self._alias_index and lowered not in self._core_commands:
+            return self._alias_index[lowered]
 
         if alias in self.aliases and include_legacy:
             return self.aliases[alias]
@@ -889,30 +907,24 @@ class Modules:
 
     def dispatch(self, _command: str) -> typing.Tuple[str, typing.Optional[str]]:
         """Dispatch command to appropriate module"""
+        lowered = _command.lower()
+        if lowered in self.commands:
+            return _command, self.commands[lowered]
 
-        return next(
-            (
-                (cmd, self.commands[cmd.lower()])
-                for cmd in [
-                    _command,
-                    self.aliases.get(_command.lower()),
-                    self.find_alias(_command),
-                ]
-                if cmd and cmd.lower() in self.commands
-            ),
-            (_command, None),
-        )
+        for cmd in (self.aliases.get(lowered), self.find_alias(_command)):
+            if cmd and cmd.lower() in self.commands:
+                return cmd, self.commands[cmd.lower()]
+
+        return _command, None
 
     def send_config(self, skip_hook: bool = False):
         """Configure modules"""
         for mod in self.modules:
             self.send_config_one(mod, skip_hook)
 
+    @tag_client(lambda self: self.client.tg_id)
     def send_config_one(self, mod: Module, skip_hook: bool = False):
         """Send config to single instance"""
-        with contextlib.suppress(AttributeError):
-            _hikka_client_id_logging_tag = copy.copy(self.client.tg_id)
-
         if hasattr(mod, "config"):
             modcfg = self._db.get(
                 mod.__class__.__name__,
@@ -964,29 +976,29 @@ class Modules:
         except Exception as e:
             logger.exception("Failed to send mod init complete signal due to %s", e)
 
+    @tag_client(lambda self: self.client.tg_id)
     async def send_ready_one(
         self,
         mod: Module,
         no_self_unload: bool = False,
         from_dlmod: bool = False,
     ):
-        with contextlib.suppress(AttributeError):
-            _hikka_client_id_logging_tag = copy.copy(self.client.tg_id)
-
         if from_dlmod:
             try:
-                if len(inspect.signature(mod.on_dlmod).parameters) == 2:
-                    await mod.on_dlmod(self.client, self._db)
-                else:
-                    await mod.on_dlmod()
+                with module_context(mod.on_dlmod):
+                    if len(inspect.signature(mod.on_dlmod).parameters) == 2:
+                        await mod.on_dlmod(self.client, self._db)
+                    else:
+                        await mod.on_dlmod()
             except Exception:
                 logger.info("Can't process `on_dlmod` hook", exc_info=True)
 
         try:
-            if len(inspect.signature(mod.client_ready).parameters) == 2:
-                await mod.client_ready(self.client, self._db)
-            else:
-                await mod.client_ready()
+            with module_context(mod.client_ready):
+                if len(inspect.signature(mod.client_ready).parameters) == 2:
+                    await mod.client_ready(self.client, self._db)
+                else:
+                    await mod.client_ready()
         except SelfUnload as e:
             if no_self_unload:
                 raise e
@@ -1035,13 +1047,11 @@ class Modules:
             name,
         )
 
+    @tag_client(lambda self: self.client.tg_id)
     async def unload_module(self, classname: str) -> typing.List[str]:
         """Remove module and all stuff from it"""
         worked = []
 
-        with contextlib.suppress(AttributeError):
-            _hikka_client_id_logging_tag = copy.copy(self.client.tg_id)
-
         for module in self.modules:
             if classname.lower() in (
                 module.name.lower(),
@@ -1074,6 +1084,7 @@ class Modules:
                 self.unregister_commands(module, "unload")
                 self.unregister_watchers(module, "unload")
                 self.unregister_inline_stuff(module, "unload")
+                self.client.dispatcher.executor.cancel(module)
 
         logger.debug("Worked: %s", worked)
         return worked
@@ -1090,6 +1101,7 @@ class Modules:
                 method.stop()
 
     def unregister_commands(self, instance: Module, purpose: str):
+        removed = False
         for name, cmd in self.commands.copy().items():
             if cmd.__self__.__class__.__name__ == instance.__class__.__name__:
                 logger.debug(
@@ -1103,6 +1115,11 @@ class Modules:
                     if _command == name:
                         del self.aliases[alias]
 
+                removed = True
+
+        if removed:
+            self._rebuild_alias_index()
+
     def unregister_watchers(self, instance: Module, purpose: str):
         for _watcher in self.watchers.copy():
             if _watcher.__self__.__class__.__name__ == instance.__class__.__name__:
@@ -1114,6 +1131,8 @@ class Modules:
                 )
                 self.watchers.remove(_watcher)
 
+        self.revision += 1
+
     def unregister_raw_handlers(self, instance: Module, purpose: str):
         """Unregister event handlers for a module"""
         for handler in self.client.dispatcher.raw_handlers:
@@ -1132,10 +1151,12 @@ class Modules:
             return False
 
         self.aliases[alias.lower().strip()] = cmd
+        self.revision += 1
         return True
 
     def remove_alias(self, alias: str) -> bool:
         """Remove an alias"""
+        self.revision += 1
         return bool(self.aliases.pop(alias.lower().strip(), None))
 
     async def log(self, *args, **kwargs):
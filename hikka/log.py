@@ -26,6 +26,7 @@ import telethon
 from aiogram.utils.exceptions import NetworkError
 
 from . import utils
+from ._internal import client_id_tag
 from .tl_cache import CustomTelegramClient
 from .types import BotInlineCall, Module
 from .web.debugger import WebDebugger
@@ -409,24 +410,8 @@ class TelegramLogsHandler(logging.Handler):
                         )
 
     def emit(self, record: logging.LogRecord):
-        try:
-            caller = next(
-                (
-                    frame_info.frame.f_locals["_hikka_client_id_logging_tag"]
-                    for frame_info in inspect.stack()
-                    if isinstance(
-                        getattr(getattr(frame_info, "frame", None), "f_locals", {}).get(
-                            "_hikka_client_id_logging_tag"
-                        ),
-                        int,
-                    )
-                ),
-                False,
-            )
-
-            if not isinstance(caller, int):
-                caller = None
-        except Exception:
+        caller = client_id_tag.get()
+        if not isinstance(caller, int):
             caller = None
 
         record.hikka_caller = caller
@@ -54,6 +54,7 @@ from telethon.network.connection import (
 from telethon.sessions import MemorySession, SQLiteSession
 
 from . import database, loader, utils, version
+from ._internal import client_id_tag
 from .dispatcher import CommandDispatcher
 from .tl_cache import CustomTelegramClient
 from .translations import Translator
@@ -223,6 +224,16 @@ def parse_arguments() -> dict:
         default=False,
         help="Open proxy pass tunnel on start (not needed on setup)",
     )
+    parser.add_argument(
+        "--webhook-url",
+        dest="webhook_url",
+        action="store",
+        help=(
+            "Public HTTPS url of web server. If set, inline bots receive updates"
+            " via webhook instead of polling. Secret token of webhook can be fixed"
+            " with WEBHOOK_SECRET environment variable"
+        ),
+    )
     arguments = parser.parse_args()
     logging.debug(arguments)
     if sys.platform == "win32":
@@ -362,6 +373,7 @@ class Hikka:
             api_token=self.api_token,
             proxy=self.proxy,
             connection=self.conn,
+            webhook_url=self.arguments.webhook_url,
         )
 
     def _get_token(self):
@@ -634,6 +646,9 @@ class Hikka:
 
     async def amain(self, first: bool, client: CustomTelegramClient):
         """Entrypoint for async init, run once for each user"""
+        # Will be used to determine, which client caused logging messages.
+        # Inherited by all the tasks, spawned during initialization
+        client_id_tag.set(client.tg_id)
         client.parse_mode = "HTML"
         await client.start()
 
@@ -669,6 +684,7 @@ class Hikka:
             await self._badge(client)
 
         await client.run_until_disconnected()
+        await db.flush()
 
     def main(self):
         """Main entrypoint"""
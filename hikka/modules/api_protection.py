@@ -5,17 +5,20 @@
 # 🔑 https://www.gnu.org/licenses/agpl-3.0.html
 
 import asyncio
+import collections
 import io
 import json
 import logging
 import random
 import time
+import typing
 
 from telethon.tl import functions
 from telethon.tl.tlobject import TLRequest
 from telethon.tl.types import Message
 
 from .. import loader, utils
+from .._internal import current_module
 from ..inline.types import InlineCall
 from ..web.debugger import WebDebugger
 
@@ -59,6 +62,122 @@ CONSTRUCTORS = {
 }
 
 
+class TokenBucket:
+    """
+    Token bucket, which allows `capacity` requests per `period` seconds.
+    Tokens can be reserved in advance, so concurrent callers are queued
+    one after another
+    """
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.perf_counter()
+
+    def reserve(self, now: float) -> float:
+        """
+        Take one token
+        :param now: Current `time.perf_counter()`
+        :return: Time in seconds to wait before the token becomes available
+        """
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.updated) * self.rate,
+        )
+        self.updated = now
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0
+
+
+class FloodLimiter:
+    """
+    Accounts requests in sliding window and decides, how long each request
+    must wait. Requests, which exceed the limit of their method or module,
+    are delayed, while the others are passed immediately
+    """
+
+    def __init__(
+        self,
+        time_sample: int,
+        threshold: int,
+        method_threshold: int,
+        module_threshold: int,
+    ):
+        self.time_sample = time_sample
+        self.threshold = threshold
+        self.method_threshold = method_threshold
+        self.module_threshold = module_threshold
+        # (timestamp, method) of each request in the window
+        self.window = collections.deque()
+        self._counts = collections.Counter()
+        self._buckets = {}
+        self._frozen = {}
+
+    def _bucket(self, key: tuple, capacity: int) -> TokenBucket:
+        if (bucket := self._buckets.get(key)) is None:
+            bucket = self._buckets[key] = TokenBucket(capacity, self.time_sample)
+
+        return bucket
+
+    def acquire(
+        self,
+        method: str,
+        module: typing.Optional[str] = None,
+        exempt: bool = False,
+    ) -> typing.Tuple[float, typing.Optional[str]]:
+        """
+        Account request
+        :param method: Name of request
+        :param module: Name of module, which made the request, if known
+        :param exempt: Whether request is not limited by `method_threshold` and
+                       `module_threshold`, e.g. it is made by core module
+        :return: Time in seconds to wait before sending the request and the
+                 name of method, which got frozen because of this request
+        """
+        now = time.perf_counter()
+        self.window.append((now, method))
+        self._counts[method] += 1
+
+        while self.window and now - self.window[0][0] >= self.time_sample:
+            _, expired = self.window.popleft()
+            self._counts[expired] -= 1
+            if not self._counts[expired]:
+                del self._counts[expired]
+
+        frozen = None
+        if len(self.window) > self.threshold:
+            frozen = self._counts.most_common(1)[0][0]
+            if self._frozen.get(frozen, 0) > now:
+                frozen = None
+
+        delay = max(
+            self._frozen.get(method, 0) - now,
+            (
+                self._bucket(("method", method), self.method_threshold).reserve(now)
+                if not exempt
+                else 0
+            ),
+            (
+                self._bucket(("module", module), self.module_threshold).reserve(now)
+                if module and not exempt
+                else 0
+            ),
+            0,
+        )
+
+        if self._frozen and self._frozen.get(method, 0) <= now:
+            self._frozen.pop(method, None)
+
+        return delay, frozen
+
+    def freeze(self, method: str, duration: float):
+        """Delay all requests of `method` for `duration` seconds"""
+        self._frozen[method] = time.perf_counter() + duration
+
+
 @loader.tds
 class APIRatelimiterMod(loader.Module):
     """Helps userbot avoid spamming Telegram API"""
@@ -68,13 +187,13 @@ class APIRatelimiterMod(loader.Module):
         "warning": (
             "<emoji document_id=5312383351217201533>⚠️</emoji>"
             " <b>WARNING!</b>\n\nYour account exceeded the limit of requests, specified"
-            " in config. In order to prevent Telegram API Flood, userbot has been"
-            " <b>fully frozen</b> for {} seconds. Further info is provided in attached"
-            " file. \n\nIt is recommended to get help in <code>{prefix}support</code>"
-            " group!\n\nIf you think, that it is an intended behavior, then wait until"
-            " userbot gets unlocked and next time, when you will be going to perform"
-            " such an operation, use <code>{prefix}suspend_api_protect</code> &lt;time"
-            " in seconds&gt;"
+            " in config. In order to prevent Telegram API Flood, <code>{1}</code>"
+            " requests have been <b>frozen</b> for {0} seconds. Further info is provided"
+            " in attached file. \n\nIt is recommended to get help in"
+            " <code>{prefix}support</code> group!\n\nIf you think, that it is an"
+            " intended behavior, then wait until requests get unlocked and next time,"
+            " when you will be going to perform such an operation, use"
+            " <code>{prefix}suspend_api_protect</code> &lt;time in seconds&gt;"
         ),
         "args_invalid": (
             "<emoji document_id=5312526098750252863>🚫</emoji> <b>Invalid arguments</b>"
@@ -94,8 +213,18 @@ class APIRatelimiterMod(loader.Module):
         "_cfg_time_sample": "Time sample through which the bot will count requests",
         "_cfg_threshold": "Threshold of requests to trigger protection",
         "_cfg_local_floodwait": (
-            "Freeze userbot for this amount of time, if request limit exceeds"
+            "Freeze requests of the most used method for this amount of time, if"
+            " request limit exceeds"
+        ),
+        "_cfg_method_threshold": (
+            "Maximum number of requests of single method within time sample. Excess"
+            " requests of this method are delayed"
         ),
+        "_cfg_module_threshold": (
+            "Maximum number of requests of single module within time sample. Excess"
+            " requests of this module are delayed"
+        ),
+        "_cfg_jitter": "Add random 10-50 ms delay before each request",
         "_cfg_forbidden_methods": (
             "Forbid specified methods from being executed throughout external modules"
         ),
@@ -118,11 +247,11 @@ class APIRatelimiterMod(loader.Module):
         "warning": (
             "<emoji document_id=5312383351217201533>⚠️</emoji>"
             " <b>ВНИМАНИЕ!</b>\n\nАккаунт вышел за лимиты запросов, указанные в"
-            " конфиге. С целью предотвращения флуда Telegram API, юзербот был"
-            " <b>полностью заморожен</b> на {} секунд. Дополнительная информация"
-            " прикреплена в файле ниже. \n\nРекомендуется обратиться за помощью в"
-            " <code>{prefix}support</code> группу!\n\nЕсли ты считаешь, что это"
-            " запланированное поведение юзербота, просто подожди, пока закончится"
+            " конфиге. С целью предотвращения флуда Telegram API, запросы"
+            " <code>{1}</code> были <b>заморожены</b> на {0} секунд. Дополнительная"
+            " информация прикреплена в файле ниже. \n\nРекомендуется обратиться за"
+            " помощью в <code>{prefix}support</code> группу!\n\nЕсли ты считаешь, что"
+            " это запланированное поведение юзербота, просто подожди, пока закончится"
             " таймер и в следующий раз, когда запланируешь выполнять такую"
             " ресурсозатратную операцию, используй"
             " <code>{prefix}suspend_api_protect</code> &lt;время в секундах&gt;"
@@ -144,8 +273,18 @@ class APIRatelimiterMod(loader.Module):
         ),
         "_cfg_threshold": "Порог запросов, при котором будет срабатывать защита",
         "_cfg_local_floodwait": (
-            "Заморозить юзербота на это количество секунд, если лимит запросов превышен"
+            "Заморозить запросы самого частого метода на это количество секунд, если"
+            " лимит запросов превышен"
+        ),
+        "_cfg_method_threshold": (
+            "Максимальное количество запросов одного метода за временной промежуток."
+            " Лишние запросы этого метода будут отложены"
+        ),
+        "_cfg_module_threshold": (
+            "Максимальное количество запросов одного модуля за временной промежуток."
+            " Лишние запросы этого модуля будут отложены"
         ),
+        "_cfg_jitter": "Добавлять случайную задержку 10-50 мс перед каждым запросом",
         "_cfg_forbidden_methods": (
             "Запретить выполнение указанных методов во всех внешних модулях"
         ),
@@ -169,15 +308,14 @@ class APIRatelimiterMod(loader.Module):
             "<emoji document_id=5312383351217201533>⚠️</emoji>"
             " <b>ATTENTION!</b>\n\nLe compte a dépassé les limites de requêtes"
             " spécifiées dans la configuration. En vue de prévenir le flood de"
-            " l'API Telegram, le userbot a été <b>complètement gelé</b> pendant {}"
-            " secondes. Des informations supplémentaires sont ajoutées dans le"
-            " fichier ci-dessous.\n\nIl est recommandé de contacter le groupe"
+            " l'API Telegram, les requêtes <code>{1}</code> ont été <b>gelées</b>"
+            " pendant {0} secondes. Des informations supplémentaires sont ajoutées"
+            " dans le fichier ci-dessous.\n\nIl est recommandé de contacter le groupe"
             " <code>{prefix}support</code> pour obtenir de l'aide!\n\nSi vous"
-            " pensez que le comportement du userbot a été planifié, attendez"
-            " simplement que le minuteur se termine et, la prochaine fois que"
-            " vous prévoyez d'exécuter une opération aussi coûteuse en ressources,"
-            " utilisez <code>{prefix}suspend_api_protect</code> &lt;temps en"
-            " secondes&gt;"
+            " pensez que ce comportement est prévu, attendez simplement que les"
+            " requêtes soient débloquées et, la prochaine fois que vous prévoyez"
+            " d'exécuter une opération aussi coûteuse en ressources, utilisez"
+            " <code>{prefix}suspend_api_protect</code> &lt;temps en secondes&gt;"
         ),
         "args_invalid": (
             "<emoji document_id=5312526098750252863>🚫</emoji> <b>Arguments"
@@ -202,9 +340,18 @@ class APIRatelimiterMod(loader.Module):
         ),
         "_cfg_threshold": "Seuil de demandes auquel la protection sera déclenchée",
         "_cfg_local_floodwait": (
-            "Geler le userbot pendant cette durée de secondes si la limite de"
-            " requêtes est dépassée"
+            "Geler les requêtes de la méthode la plus utilisée pendant cette durée, si"
+            " la limite de requêtes est dépassée"
         ),
+        "_cfg_method_threshold": (
+            "Nombre maximal de requêtes d'une seule méthode dans l'intervalle de temps."
+            " Les requêtes en excès de cette méthode sont retardées"
+        ),
+        "_cfg_module_threshold": (
+            "Nombre maximal de requêtes d'un seul module dans l'intervalle de temps."
+            " Les requêtes en excès de ce module sont retardées"
+        ),
+        "_cfg_jitter": "Ajouter un délai aléatoire de 10 à 50 ms avant chaque requête",
         "_cfg_forbidden_methods": (
             "Interdire l'exécution des méthodes spécifiées dans tous les modules"
             " externes"
@@ -228,14 +375,14 @@ class APIRatelimiterMod(loader.Module):
         "warning": (
             "<emoji document_id=5312383351217201533>⚠️</emoji> <b>ATTENZIONE!</b>\n\nIl"
             " tuo account è uscito dai limiti di richieste impostati nel file config."
-            " Per evitare flood di richieste, il bot è stato <b>completamente"
-            " sospeso</b> per {} secondi. Ulteriori informazioni sono disponibili nel"
-            " file allegato. \n\nTi consigliamo di unirti al gruppo"
+            " Per evitare flood di richieste, le richieste <code>{1}</code> sono state"
+            " <b>sospese</b> per {0} secondi. Ulteriori informazioni sono disponibili"
+            " nel file allegato. \n\nTi consigliamo di unirti al gruppo"
             " <code>{prefix}support</code> per ulteriore assistenza!\n\nSe ritieni che"
-            " questo sia un comportamento programmato del bot, puoi semplicemente"
-            " aspettare che il timer finisca e, in seguito, quando pianifichi di"
-            " eseguire operazioni così pesanti, usa"
-            " <code>{prefix}suspend_api_protect</code> &lt;tempo in secondi&gt;"
+            " questo sia un comportamento previsto, puoi semplicemente aspettare che le"
+            " richieste vengano sbloccate e, in seguito, quando pianifichi di eseguire"
+            " operazioni così pesanti, usa <code>{prefix}suspend_api_protect</code>"
+            " &lt;tempo in secondi&gt;"
         ),
         "args_invalid": (
             "<emoji document_id=5312526098750252863>🚫</emoji> <b>Argomenti non"
@@ -264,8 +411,19 @@ class APIRatelimiterMod(loader.Module):
             " il sistema di protezione"
         ),
         "_cfg_local_floodwait": (
-            "Il bot verrà sospeso per questo numero di secondi se il limite delle"
-            " richieste viene superato"
+            "Sospendi le richieste del metodo più usato per questo numero di secondi,"
+            " se il limite delle richieste viene superato"
+        ),
+        "_cfg_method_threshold": (
+            "Numero massimo di richieste di un singolo metodo nell'intervallo di tempo."
+            " Le richieste in eccesso di questo metodo vengono ritardate"
+        ),
+        "_cfg_module_threshold": (
+            "Numero massimo di richieste di un singolo modulo nell'intervallo di tempo."
+            " Le richieste in eccesso di questo modulo vengono ritardate"
+        ),
+        "_cfg_jitter": (
+            "Aggiungi un ritardo casuale di 10-50 ms prima di ogni richiesta"
         ),
         "_cfg_forbidden_methods": (
             "Vieta l'esecuzione di questi metodi in tutti i moduli esterni"
@@ -290,14 +448,14 @@ class APIRatelimiterMod(loader.Module):
             "<emoji document_id=5312383351217201533>⚠️</emoji>"
             " <b>Achtung!</b>\n\nDas Konto hat die in der Konfiguration angegebenen"
             " Grenzwerte für Anfragen überschritten. Um Telegram API-Flooding zu"
-            " verhindern, wurde der <b>ganze Userbot</b> für {} Sekunden"
-            " eingefroren. Weitere Informationen finden Sie im unten angefügten"
-            " Datei.\n\nWir empfehlen Ihnen, sich mit Hilfe der <code>{prefix}"
-            "support</code> Gruppe zu helfen!\n\nWenn du denkst, dass dies"
-            " geplantes Verhalten des Userbots ist, dann warte einfach, bis der"
-            " Timer abläuft und versuche beim nächsten Mal, eine so ressourcen"
-            " intensive Operation wie <code>{prefix}suspend_api_protect</code>"
-            " &lt;Zeit in Sekunden&gt; zu planen."
+            " verhindern, wurden <code>{1}</code>-Anfragen für {0} Sekunden"
+            " <b>eingefroren</b>. Weitere Informationen finden Sie in der unten"
+            " angefügten Datei.\n\nWir empfehlen Ihnen, sich Hilfe in der"
+            " <code>{prefix}support</code> Gruppe zu holen!\n\nWenn du denkst, dass"
+            " dies geplantes Verhalten ist, warte einfach, bis die Anfragen wieder"
+            " freigegeben werden, und verwende beim nächsten Mal vor einer so"
+            " ressourcenintensiven Operation <code>{prefix}suspend_api_protect</code>"
+            " &lt;Zeit in Sekunden&gt;"
         ),
         "args_invalid": (
             "<emoji document_id=5312526098750252863>🚫</emoji> <b>Ungültige"
@@ -319,8 +477,19 @@ class APIRatelimiterMod(loader.Module):
             "Schwellenwert für Anfragen, ab dem der Schutz aktiviert wird"
         ),
         "_cfg_local_floodwait": (
-            "Einfrieren des Userbots für diese Anzahl von Sekunden, wenn der Grenzwert"
-            " überschritten wird"
+            "Anfragen der meistgenutzten Methode für diese Anzahl von Sekunden"
+            " einfrieren, wenn der Grenzwert überschritten wird"
+        ),
+        "_cfg_method_threshold": (
+            "Maximale Anzahl von Anfragen einer einzelnen Methode im Zeitintervall."
+            " Überschüssige Anfragen dieser Methode werden verzögert"
+        ),
+        "_cfg_module_threshold": (
+            "Maximale Anzahl von Anfragen eines einzelnen Moduls im Zeitintervall."
+            " Überschüssige Anfragen dieses Moduls werden verzögert"
+        ),
+        "_cfg_jitter": (
+            "Vor jeder Anfrage eine zufällige Verzögerung von 10-50 ms einfügen"
         ),
         "_cfg_forbidden_methods": "Verbotene Methoden in allen externen Modulen",
         "btn_no": "🚫 Nein",
@@ -341,14 +510,15 @@ class APIRatelimiterMod(loader.Module):
     strings_tr = {
         "warning": (
             "<emoji document_id=5312383351217201533>⚠️</emoji> <b>Dikkat!</b>\n\nHesap"
-            " yapılandırmasında belirtilen sınır değerlerini aştı. Telegram API"
-            " sızmalarını önlemek için <b>tüm Userbot</b> {} sanie donduruldu. Daha"
-            " fazla bilgi için aşağıya eklenen dosyaya bakın.\n\nLütfen"
-            " <code>{prefix}support</code> grubu ile yardım almak için destek"
-            " olun!\n\nEğer bu, Userbot'un planlanmış davranışı olduğunu"
-            " düşünüyorsanız, zamanlayıcı bittiğinde ve"
+            " yapılandırmasında belirtilen istek sınırlarını aştı. Telegram API"
+            " floodunu önlemek için <code>{1}</code> istekleri {0} saniye boyunca"
+            " <b>donduruldu</b>. Daha fazla bilgi için aşağıya eklenen dosyaya"
+            " bakın.\n\nYardım için <code>{prefix}support</code> grubuna"
+            " başvurmanız önerilir!\n\nBunun planlanmış bir davranış olduğunu"
+            " düşünüyorsanız, isteklerin kilidinin açılmasını bekleyin ve bir dahaki"
+            " sefere böyle kaynak tüketen bir işlemden önce"
             " <code>{prefix}suspend_api_protect</code> &lt;saniye cinsinden süre&gt;"
-            " gibi kaynak tüketen bir işlemi planladığınızda yeniden deneyin."
+            " komutunu kullanın"
         ),
         "args_invalid": (
             "<emoji document_id=5312526098750252863>🚫</emoji> <b>Geçersiz"
@@ -370,8 +540,18 @@ class APIRatelimiterMod(loader.Module):
         "_cfg_time_sample": "Saniyede sayılan isteklerin zaman aralığı",
         "_cfg_threshold": "Korumanın etkinleşeceği sınır değeri",
         "_cfg_local_floodwait": (
-            "Telegram API sınır değeri aşıldığında kullanıcı botu bir süre durdurulur"
+            "İstek sınırı aşıldığında en çok kullanılan metodun isteklerini bu süre"
+            " boyunca dondur"
+        ),
+        "_cfg_method_threshold": (
+            "Zaman aralığında tek bir metodun en fazla istek sayısı. Bu metodun fazla"
+            " istekleri geciktirilir"
         ),
+        "_cfg_module_threshold": (
+            "Zaman aralığında tek bir modülün en fazla istek sayısı. Bu modülün fazla"
+            " istekleri geciktirilir"
+        ),
+        "_cfg_jitter": "Her istekten önce 10-50 ms rastgele gecikme ekle",
         "_cfg_forbidden_methods": (
             "Belirtili metodların harici modüller tarafından çalıştırılmasını yasakla"
         ),
@@ -393,14 +573,15 @@ class APIRatelimiterMod(loader.Module):
     strings_uz = {
         "warning": (
             "<emoji document_id=5312383351217201533>⚠️</emoji>"
-            " <b>Ogohlantirish!</b>\n\nBu hisob uchun konfiguratsiyada ko'rsatilgan"
-            " chegaralar chegarani o'zgartirgan.\n\nTelegram API Flood"
-            " to'xtatish uchun, bu <b>hammasi userbot</b> uchun {} sekundni"
-            " blokirovka qilindi. Batafsil ma'lumot uchun pastdagi faylni o'qing.\n\n"
-            "Yordam uchun <code>{prefix}support</code> guruhidan foydalaning!\n\nAgar"
-            " siz hisobni botning yordamchisi bo'lishi kerak bo'lgan amalni bajarishga"
-            " imkoniyat berishga o'xshaysiz, unda faqat blokirovkani to'xtatish uchun"
-            " <code>{prefix}suspend_api_protect</code> &lt;sekund&gt; dan foydalaning."
+            " <b>Ogohlantirish!</b>\n\nHisob konfiguratsiyada ko'rsatilgan so'rovlar"
+            " chegarasidan oshib ketdi. Telegram API Flood oldini olish uchun"
+            " <code>{1}</code> so'rovlari {0} soniyaga <b>muzlatildi</b>. Batafsil"
+            " ma'lumot uchun pastdagi faylni o'qing.\n\nYordam uchun"
+            " <code>{prefix}support</code> guruhiga murojaat qilish tavsiya"
+            " etiladi!\n\nAgar bu rejalashtirilgan xatti-harakat deb hisoblasangiz,"
+            " so'rovlar blokdan chiqarilishini kuting va keyingi safar bunday og'ir"
+            " amalni bajarishdan oldin <code>{prefix}suspend_api_protect</code>"
+            " &lt;soniya&gt; dan foydalaning"
         ),
         "args_invalid": (
             "<emoji document_id=5312526098750252863>🚫</emoji> <b>Noto'g'ri argument</b>"
@@ -417,9 +598,18 @@ class APIRatelimiterMod(loader.Module):
         "_cfg_time_sample": "Sekundda qabul qilinadigan so'rovlar soni chegarasi",
         "_cfg_threshold": "Himoya yoqish uchun qiymatni chegaralash",
         "_cfg_local_floodwait": (
-            "Foydalanuvchi botni ushbu soniya davomida blokirovka qiladi, agar"
-            " chegaralar qiymati oshsa"
+            "So'rovlar chegarasi oshsa, eng ko'p ishlatilgan metod so'rovlarini"
+            " ushbu soniya davomida muzlatish"
+        ),
+        "_cfg_method_threshold": (
+            "Vaqt oralig'ida bitta metodning eng ko'p so'rovlari soni. Bu metodning"
+            " ortiqcha so'rovlari kechiktiriladi"
+        ),
+        "_cfg_module_threshold": (
+            "Vaqt oralig'ida bitta modulning eng ko'p so'rovlari soni. Bu modulning"
+            " ortiqcha so'rovlari kechiktiriladi"
         ),
+        "_cfg_jitter": "Har bir so'rovdan oldin 10-50 ms tasodifiy kechikish qo'shish",
         "_cfg_forbidden_methods": "Barcha tashqi modullarda taqiqlangan usullar",
         "btn_no": "🚫 Yo'q",
         "btn_yes": "✅ Ha",
@@ -439,13 +629,15 @@ class APIRatelimiterMod(loader.Module):
     strings_es = {
         "warning": (
             "<emoji document_id=5312383351217201533>⚠️</emoji>"
-            " <b>¡Advertencia!</b>\n\nDe acuerdo con la configuración de esta cuenta,"
-            " las siguientes limitaciones serán aplicadas.\n\nSe bloqueará <b>a todos"
-            " los bots de los usuarios</b> por {} segundos para evitar el exceso de las"
-            " limitaciones de Telegram API. Para más información, consulta el archivo"
-            " siguiente.\n\nPara obtener ayuda, use el grupo"
-            " <code>{prefix}support</code>!\n\nPara permitir que la cuenta funcione,"
-            " use <code>{prefix}suspend_api_protect</code> para desbloquear."
+            " <b>¡Advertencia!</b>\n\nLa cuenta ha superado los límites de solicitudes"
+            " especificados en la configuración. Para evitar el flood de Telegram API,"
+            " las solicitudes <code>{1}</code> han sido <b>congeladas</b> durante {0}"
+            " segundos. Para más información, consulta el archivo adjunto.\n\nSe"
+            " recomienda pedir ayuda en el grupo <code>{prefix}support</code>!\n\nSi"
+            " crees que es un comportamiento previsto, espera a que las solicitudes se"
+            " desbloqueen y, la próxima vez que vayas a realizar una operación tan"
+            " costosa, usa <code>{prefix}suspend_api_protect</code> &lt;tiempo en"
+            " segundos&gt;"
         ),
         "args_invalid": (
             "<emoji document_id=5312526098750252863>🚫</emoji> <b>Argumentos"
@@ -469,7 +661,19 @@ class APIRatelimiterMod(loader.Module):
         ),
         "_cfg_threshold": "El valor por encima del cual se exceden las limitaciones",
         "_cfg_local_floodwait": (
-            "El tiempo en segundos durante el cual se bloquea al usuario para el bot"
+            "Congelar las solicitudes del método más usado durante este tiempo, si se"
+            " supera el límite de solicitudes"
+        ),
+        "_cfg_method_threshold": (
+            "Número máximo de solicitudes de un solo método en el intervalo de tiempo."
+            " Las solicitudes excedentes de este método se retrasan"
+        ),
+        "_cfg_module_threshold": (
+            "Número máximo de solicitudes de un solo módulo en el intervalo de tiempo."
+            " Las solicitudes excedentes de este módulo se retrasan"
+        ),
+        "_cfg_jitter": (
+            "Añadir un retraso aleatorio de 10-50 ms antes de cada solicitud"
         ),
         "_cfg_forbidden_methods": (
             "Los comandos prohibidos por todas las extensiones externas"
@@ -492,13 +696,14 @@ class APIRatelimiterMod(loader.Module):
     strings_kk = {
         "warning": (
             "<emoji document_id=5312383351217201533>⚠️</emoji>"
-            " <b>Ескерту!</b>\n\nБұл есептің конфигурациясына сәйкес, келесі"
-            " шектелген шарттар қолданылады.\n\nTelegram API үлеслерінен қорғалмасы"
-            " үшін, <b>барлық пайдаланушылардың боттары</b> {} секунд құлыпталады."
-            " Көбірек ақпарат үшін келесі файлды қараңыз.\n\nАнықтама үшін"
-            " <code>{prefix}support</code> топын пайдаланыңыз!\n\nЕгер сізге"
-            " бұл есептің боттың көмекшісі болуы керек болса, құлыпталуын өшіру үшін"
-            " <code>{prefix}suspend_api_protect</code> &lt;секунд&gt; пайдаланыңыз."
+            " <b>Ескерту!</b>\n\nАккаунт конфигурацияда көрсетілген сұраулар"
+            " шегінен асып кетті. Telegram API флудының алдын алу үшін"
+            " <code>{1}</code> сұраулары {0} секундқа <b>тоқтатылды</b>. Көбірек"
+            " ақпарат үшін келесі файлды қараңыз.\n\nАнықтама үшін"
+            " <code>{prefix}support</code> тобына жүгіну ұсынылады!\n\nЕгер бұл"
+            " жоспарланған әрекет деп ойласаңыз, сұраулардың құлпы ашылғанша күтіңіз"
+            " және келесі жолы мұндай ауыр операция алдында"
+            " <code>{prefix}suspend_api_protect</code> &lt;секунд&gt; пайдаланыңыз"
         ),
         "args_invalid": (
             "<emoji document_id=5312526098750252863>🚫</emoji> <b>Жарамсыз"
@@ -515,7 +720,19 @@ class APIRatelimiterMod(loader.Module):
         "u_sure": "⚠️ <b>Сіз әлімдісіз бе?</b>",
         "_cfg_time_sample": "API үлеслерінен қорғалуы үшін көрсетілген уақыт (секунд)",
         "_cfg_threshold": "API үлеслерінен қорғалуы үшін көрсетілген қаншалық",
-        "_cfg_local_floodwait": "Бот үшін пайдаланушыны құлыпталу уақыты (секунд)",
+        "_cfg_local_floodwait": (
+            "Сұраулар шегі асқанда ең көп қолданылған әдістің сұрауларын осы уақытқа"
+            " (секунд) тоқтату"
+        ),
+        "_cfg_method_threshold": (
+            "Уақыт аралығында бір әдістің сұрауларының ең көп саны. Бұл әдістің"
+            " артық сұраулары кешіктіріледі"
+        ),
+        "_cfg_module_threshold": (
+            "Уақыт аралығында бір модульдің сұрауларының ең көп саны. Бұл модульдің"
+            " артық сұраулары кешіктіріледі"
+        ),
+        "_cfg_jitter": "Әр сұрау алдында 10-50 мс кездейсоқ кідіріс қосу",
         "_cfg_forbidden_methods": (
             "Барлық сыртқы қосымшалардың қолданылуының тыйым салынған командалары"
         ),
@@ -534,9 +751,8 @@ class APIRatelimiterMod(loader.Module):
         ),
     }
 
-    _ratelimiter = []
+    _limiter = None
     _suspend_until = 0
-    _lock = False
 
     def __init__(self):
         self.config = loader.ModuleConfig(
@@ -545,12 +761,14 @@ class APIRatelimiterMod(loader.Module):
                 15,
                 lambda: self.strings("_cfg_time_sample"),
                 validator=loader.validators.Integer(minimum=1),
+                on_change=self._reset_limiter,
             ),
             loader.ConfigValue(
                 "threshold",
                 100,
                 lambda: self.strings("_cfg_threshold"),
                 validator=loader.validators.Integer(minimum=10),
+                on_change=self._reset_limiter,
             ),
             loader.ConfigValue(
                 "local_floodwait",
@@ -558,6 +776,26 @@ class APIRatelimiterMod(loader.Module):
                 lambda: self.strings("_cfg_local_floodwait"),
                 validator=loader.validators.Integer(minimum=10, maximum=3600),
             ),
+            loader.ConfigValue(
+                "method_threshold",
+                50,
+                lambda: self.strings("_cfg_method_threshold"),
+                validator=loader.validators.Integer(minimum=5),
+                on_change=self._reset_limiter,
+            ),
+            loader.ConfigValue(
+                "module_threshold",
+                50,
+                lambda: self.strings("_cfg_module_threshold"),
+                validator=loader.validators.Integer(minimum=5),
+                on_change=self._reset_limiter,
+            ),
+            loader.ConfigValue(
+                "jitter",
+                False,
+                lambda: self.strings("_cfg_jitter"),
+                validator=loader.validators.Boolean(),
+            ),
             loader.ConfigValue(
                 "forbidden_methods",
                 ["joinChannel", "importChatInvite"],
@@ -593,47 +831,29 @@ class APIRatelimiterMod(loader.Module):
             ordered: bool = False,
             flood_sleep_threshold: int = None,
         ):
-            await asyncio.sleep(random.randint(1, 5) / 100)
+            if self.config["jitter"]:
+                await asyncio.sleep(random.randint(1, 5) / 100)
+
             if time.perf_counter() > self._suspend_until and not self.get(
                 "disable_protection",
                 True,
             ):
-                request_name = type(request).__name__
-                self._ratelimiter += [[request_name, time.perf_counter()]]
-
-                self._ratelimiter = list(
-                    filter(
-                        lambda x: time.perf_counter() - x[1]
-                        < int(self.config["time_sample"]),
-                        self._ratelimiter,
-                    )
+                limiter = self._get_limiter()
+                module = current_module.get()
+                delay, frozen = limiter.acquire(
+                    type(request).__name__,
+                    module.__class__.__name__ if module is not None else None,
+                    getattr(module, "__origin__", "").startswith("<core"),
                 )
 
-                if (
-                    len(self._ratelimiter) > int(self.config["threshold"])
-                    and not self._lock
-                ):
-                    self._lock = True
-                    report = io.BytesIO(
-                        json.dumps(
-                            self._ratelimiter,
-                            indent=4,
-                        ).encode("utf-8")
-                    )
-                    report.name = "local_fw_report.json"
-
-                    await self.inline.bot.send_document(
-                        self.tg_id,
-                        report,
-                        caption=self.strings("warning").format(
-                            self.config["local_floodwait"],
-                            prefix=self.get_prefix(),
-                        ),
-                    )
+                if frozen:
+                    limiter.freeze(frozen, int(self.config["local_floodwait"]))
+                    asyncio.ensure_future(self._report(frozen))
 
-                    # It is intented to use time.sleep instead of asyncio.sleep
-                    time.sleep(int(self.config["local_floodwait"]))
-                    self._lock = False
+                if delay:
+                    # Only the caller, which exceeded the limit, waits here.
+                    # Other requests are sent as usual
+                    await asyncio.sleep(delay)
 
             return await old_call(sender, request, ordered, flood_sleep_threshold)
 
@@ -642,6 +862,36 @@ class APIRatelimiterMod(loader.Module):
         self._client._call._hikka_overwritten = True
         logger.debug("Successfully installed ratelimiter")
 
+    def _get_limiter(self) -> FloodLimiter:
+        if self._limiter is None:
+            self._limiter = FloodLimiter(
+                int(self.config["time_sample"]),
+                int(self.config["threshold"]),
+                int(self.config["method_threshold"]),
+                int(self.config["module_threshold"]),
+            )
+
+        return self._limiter
+
+    def _reset_limiter(self):
+        self._limiter = None
+
+    async def _report(self, method: str):
+        report = io.BytesIO(
+            json.dumps(list(self._get_limiter().window), indent=4).encode("utf-8")
+        )
+        report.name = "local_fw_report.json"
+
+        await self.inline.bot.send_document(
+            self.tg_id,
+            report,
+            caption=self.strings("warning").format(
+                self.config["local_floodwait"],
+                method,
+                prefix=self.get_prefix(),
+            ),
+        )
+
     async def on_unload(self):
         if hasattr(self._client, "_old_call_rewritten"):
             self._client._call = self._client._old_call_rewritten
@@ -80,14 +80,7 @@ class HelpMod(loader.Module):
 
     def find_aliases(self, command: str) -> list:
         """Find aliases for command"""
-        aliases = []
-        _command = self.allmodules.commands[command]
-        if getattr(_command, "alias", None) and not (
-            aliases := getattr(_command, "aliases", None)
-        ):
-            aliases = [_command.alias]
-
-        return aliases or []
+        return loader.get_command_aliases(self.allmodules.commands[command])
 
     async def modhelp(self, message: Message, args: str):
         module = self.lookup(args, include_dragon=True)
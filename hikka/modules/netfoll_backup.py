@@ -184,6 +184,7 @@ class NetfollBackupMod(loader.Module):
                 self.get("last_backup") + self.get("period") - time.time()
             )
 
+            self._db.load_all()
             backup = io.BytesIO(json.dumps(self._db).encode("utf-8"))
             backup.name = f'netfoll-db-backup-{getattr(datetime, "datetime", datetime).now().strftime("%d-%m-%Y-%H-%M")}.json'
 
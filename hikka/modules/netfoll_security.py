@@ -747,13 +747,16 @@ class NetfollSecurityMod(loader.Module):
         await utils.answer(message, m)
 
     async def _list_group(self, message: Message, group: str):
-        _resolved_users = []
-        for user in set(
-            getattr(self._client.dispatcher.security, group)
-            + ([self.tg_id] if group == "owner" else [])
-        ):
-            with contextlib.suppress(Exception):
-                _resolved_users += [await self._client.get_entity(user)]
+        _resolved_users = [
+            user
+            for user in await self._client.get_entities(
+                set(
+                    getattr(self._client.dispatcher.security, group)
+                    + ([self.tg_id] if group == "owner" else [])
+                )
+            )
+            if user
+        ]
 
         if _resolved_users:
             await utils.answer(
@@ -699,10 +699,11 @@ class NetfollSettingsMod(loader.Module):
     async def nonickusers(self, message: Message):
         """Returns the list of NoNick users"""
         users = []
-        for user_id in self._db.get(main.__name__, "nonickusers", []).copy():
-            try:
-                user = await self._client.get_entity(user_id)
-            except Exception:
+        user_ids = self._db.get(main.__name__, "nonickusers", []).copy()
+        # Transient errors are raised by `get_entities`, so only users, which
+        # can't be resolved at all, are removed
+        for user_id, user in zip(user_ids, await self._client.get_entities(user_ids)):
+            if not user:
                 self._db.set(
                     main.__name__,
                     "nonickusers",
@@ -734,10 +735,13 @@ class NetfollSettingsMod(loader.Module):
     async def nonickchats(self, message: Message):
         """Returns the list of NoNick chats"""
         chats = []
-        for chat in self._db.get(main.__name__, "nonickchats", []):
-            try:
-                chat_entity = await self._client.get_entity(int(chat))
-            except Exception:
+        nonickchats = self._db.get(main.__name__, "nonickchats", []).copy()
+        for chat, chat_entity in zip(
+            nonickchats,
+            await self._client.get_entities(map(int, nonickchats)),
+        ):
+            # Chats, which can't be fetched now, raise instead of being `None`
+            if not chat_entity:
                 self._db.set(
                     main.__name__,
                     "nonickchats",
@@ -1140,21 +1144,21 @@ class NetfollSettingsMod(loader.Module):
                 result = (
                     f"Dropped {len(self._client._hikka_entity_cache)} cache records"
                 )
-                self._client._hikka_entity_cache = {}
+                self._client._hikka_entity_cache.clear()
             elif method == "clear_fulluser_cache":
                 result = (
                     f"Dropped {len(self._client._hikka_fulluser_cache)} cache records"
                 )
-                self._client._hikka_fulluser_cache = {}
+                self._client._hikka_fulluser_cache.clear()
             elif method == "clear_fullchannel_cache":
                 result = (
                     f"Dropped {len(self._client._hikka_fullchannel_cache)} cache"
                     " records"
                 )
-                self._client._hikka_fullchannel_cache = {}
+                self._client._hikka_fullchannel_cache.clear()
             elif method == "clear_perms_cache":
                 result = f"Dropped {len(self._client._hikka_perms_cache)} cache records"
-                self._client._hikka_perms_cache = {}
+                self._client._hikka_perms_cache.clear()
             elif method == "clear_cache":
                 result = (
                     f"Dropped {len(self._client._hikka_entity_cache)} entity cache"
@@ -1164,9 +1168,9 @@ class NetfollSettingsMod(loader.Module):
                     f" {len(self._client._hikka_fullchannel_cache)} fullchannel cache"
                     " records"
                 )
-                self._client._hikka_entity_cache = {}
-                self._client._hikka_fulluser_cache = {}
-                self._client._hikka_fullchannel_cache = {}
+                self._client._hikka_entity_cache.clear()
+                self._client._hikka_fulluser_cache.clear()
+                self._client._hikka_fullchannel_cache.clear()
                 self._client.hikka_me = await self._client.get_me()
             elif method == "reload_core":
                 core_quantity = await self.lookup("loader").reload_core()
@@ -72,6 +72,7 @@ class Translations(loader.Module):
         "command_msg": "<b>🌘 Command «{}»</b>\n\n<i>{}</i>",
         "command": "🌘 Command «{}»",
         "button403": "You are not allowed to press this button!",
+        "button429": "Too many requests, try again later",
         "keep_id": "⚠️ Do not remove ID! {}",
         "choose_language": "🗽 <b>Choose language</b>",
         "not_official": (
@@ -139,6 +140,7 @@ class Translations(loader.Module):
         "command_msg": "<b>🌘 Команда «{}»</b>\n\n<i>{}</i>",
         "command": "🌘 Команда «{}»",
         "button403": "Вы не можете нажать на эту кнопку!",
+        "button429": "Слишком много запросов, попробуйте позже",
         "keep_id": "⚠️ Не удаляйте ID! {}",
         "choose_language": "🗽 <b>Выберите язык</b>",
         "not_official": (
@@ -205,6 +207,7 @@ class Translations(loader.Module):
         "command_msg": "<b>🌘 Команда «{}»</b>\n\n<i>{}</i>",
         "command": "🌘 Команда «{}»",
         "button403": "Ви не можете натиснути на цю кнопку!",
+        "button429": "Забагато запитів, спробуйте пізніше",
         "keep_id": "⚠️ Не видаляйте ID! {}",
         "choose_language": "🗽 <b>Виберіть мову</b>",
         "not_official": (
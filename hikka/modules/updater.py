@@ -278,7 +278,7 @@ class UpdaterMod(loader.Module):
 
         self.set("restart_ts", time.time())
 
-        await self._db.remote_force_save()
+        await self._db.flush()
 
         if "LAVHOST" in os.environ:
             os.system("lavhost restart")
@@ -259,6 +259,13 @@ class SecurityManager:
 
         return any_
 
+    def is_trusted(self, user_id: int) -> bool:
+        """
+        Checks if user is owner or sudo, so their commands can be
+        prioritized over the other handlers
+        """
+        return user_id in self._owner or user_id in self._sudo
+
     def get_flags(self, func: typing.Union[Command, int]) -> int:
         """
         Gets the security flags for the given function
@@ -6,29 +6,52 @@
 # Netfoll Team modifided Hikka files for Netfoll
 # 🌐 https://github.com/MXRRI/Netfoll
 
+import asyncio
+import collections
+import contextlib
 import copy
 import inspect
+import itertools
 import logging
+import sys
 import time
 import typing
 
 from telethon import TelegramClient
-from telethon.errors.rpcerrorlist import TopicDeletedError
+from telethon.errors.rpcerrorlist import (
+    ChannelInvalidError,
+    ChannelPrivateError,
+    ChatIdInvalidError,
+    PeerIdInvalidError,
+    TopicDeletedError,
+    UserIdInvalidError,
+    UsernameInvalidError,
+    UsernameNotOccupiedError,
+)
 from telethon.hints import EntityLike
 from telethon.network import MTProtoSender
-from telethon.tl.functions.channels import GetFullChannelRequest
-from telethon.tl.functions.users import GetFullUserRequest
-from telethon.tl.tlobject import TLRequest
+from telethon.tl.functions.channels import GetChannelsRequest, GetFullChannelRequest
+from telethon.tl.functions.messages import GetChatsRequest
+from telethon.tl.functions.users import GetFullUserRequest, GetUsersRequest
+from telethon.tl.tlobject import TLObject, TLRequest
 from telethon.tl.types import (
     ChannelFull,
+    InputPeerChannel,
+    InputPeerChannelFromMessage,
+    InputPeerChat,
+    InputPeerSelf,
+    InputPeerUser,
+    InputPeerUserFromMessage,
     Message,
     Updates,
     UpdatesCombined,
     UpdateShort,
+    UserEmpty,
     UserFull,
 )
-from telethon.utils import is_list_like
+from telethon.utils import get_input_channel, get_input_user, get_peer_id, is_list_like
 
+from ._internal import current_module, tag_client
 from .types import (
     CacheRecordEntity,
     CacheRecordFullChannel,
@@ -39,6 +62,20 @@ from .types import (
 
 logger = logging.getLogger(__name__)
 
+# Errors, which mean that entity can't be resolved at all, as opposed to
+# transient ones (e.g. flood wait), after which it can be resolved again
+_UNRESOLVABLE = (
+    ValueError,
+    TypeError,
+    ChannelInvalidError,
+    ChannelPrivateError,
+    ChatIdInvalidError,
+    PeerIdInvalidError,
+    UserIdInvalidError,
+    UsernameInvalidError,
+    UsernameNotOccupiedError,
+)
+
 
 def hashable(value: typing.Any) -> bool:
     """
@@ -55,26 +92,175 @@ def hashable(value: typing.Any) -> bool:
     return True
 
 
+# Rough size of TL object, held by cache record. Serializing objects to
+# measure them costs more than the cache saves, so the size is fixed
+TL_OBJECT_SIZE = 2048
+
+
+def _estimate_size(record: typing.Any) -> int:
+    """Roughly estimate memory, occupied by cache record"""
+    return sys.getsizeof(record) + sum(
+        TL_OBJECT_SIZE if isinstance(value, TLObject) else sys.getsizeof(value)
+        for value in vars(record).values()
+    )
+
+
+class TLCache:
+    """
+    Bounded LRU cache for TL objects. Each record is stored once under
+    its canonical key and can also be accessed via any of its aliases
+    (e.g. id and username). Expired records are swept periodically
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        sweep_interval: int = 60,
+    ):
+        # Canonical key -> (record, aliases, size)
+        self._records = collections.OrderedDict()
+        self._aliases = {}
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._sweep_interval = sweep_interval
+        self._next_sweep = time.time() + sweep_interval
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, key: typing.Hashable) -> bool:
+        return self._aliases.get(key, key) in self._records
+
+    def get(
+        self,
+        key: typing.Hashable,
+        default: typing.Optional[typing.Any] = None,
+    ) -> typing.Any:
+        """Get record by canonical key or alias and mark it as recently used"""
+        self._maybe_sweep()
+        key = self._aliases.get(key, key)
+        if key not in self._records:
+            return default
+
+        self._records.move_to_end(key)
+        return self._records[key][0]
+
+    def set(
+        self,
+        key: typing.Hashable,
+        record: typing.Any,
+        aliases: typing.Iterable[typing.Hashable] = (),
+    ):
+        """
+        Save record to cache, evicting least recently used ones if needed
+        :param key: Canonical key of record
+        :param record: Record itself
+        :param aliases: Additional keys, which record can be accessed via
+        """
+        self.pop(key)
+        aliases = {alias for alias in aliases if alias and alias != key}
+        for alias in aliases:
+            if alias in self._records:
+                self.pop(alias)
+
+            self._aliases[alias] = key
+
+        size = _estimate_size(record)
+        self._records[key] = (record, aliases, size)
+        self.size += size
+
+        while self._records and (
+            len(self._records) > self._max_entries or self.size > self._max_bytes
+        ):
+            self.pop(next(iter(self._records)))
+
+        self._maybe_sweep()
+
+    def pop(self, key: typing.Hashable) -> typing.Any:
+        """Remove record with all its aliases"""
+        key = self._aliases.get(key, key)
+        if key not in self._records:
+            return None
+
+        record, aliases, size = self._records.pop(key)
+        self.size -= size
+        for alias in aliases:
+            if self._aliases.get(alias) == key:
+                del self._aliases[alias]
+
+        return record
+
+    def clear(self):
+        self._records.clear()
+        self._aliases.clear()
+        self.size = 0
+
+    def sweep(self) -> int:
+        """
+        Remove expired records
+        :return: Number of removed records
+        """
+        expired = [
+            key for key, (record, _, _) in self._records.items() if record.expired
+        ]
+        for key in expired:
+            self.pop(key)
+
+        return len(expired)
+
+    def _maybe_sweep(self):
+        if self._next_sweep < time.time():
+            self._next_sweep = time.time() + self._sweep_interval
+            if swept := self.sweep():
+                logger.debug("Swept %s expired cache records", swept)
+
+
 class CustomTelegramClient(TelegramClient):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._hikka_entity_cache = {}
-        self._hikka_perms_cache = {}
-        self._hikka_fullchannel_cache = {}
-        self._hikka_fulluser_cache = {}
-        self.__forbidden_constructors = []
+        self._hikka_entity_cache = TLCache(10000, 32 * 1024 * 1024)
+        self._hikka_perms_cache = TLCache(10000, 8 * 1024 * 1024)
+        self._hikka_fullchannel_cache = TLCache(1000, 32 * 1024 * 1024)
+        self._hikka_fulluser_cache = TLCache(1000, 16 * 1024 * 1024)
+        self._hikka_inflight = {}
+        self.__forbidden_constructors = set()
         self.raw_updates_processor = None  # Will be monkeypatched by pyro proxy
 
+    async def _single_flight(
+        self,
+        key: typing.Hashable,
+        factory: typing.Callable[[], typing.Awaitable[typing.Any]],
+    ) -> typing.Any:
+        """
+        Run request once for all concurrent callers with the same key.
+        Callers, which arrive while request is in progress, await the same
+        result (or exception) instead of sending a duplicate request
+        :param key: Normalized key of request
+        :param factory: Function, which returns coroutine, performing request
+        :return: Result of request
+        """
+        if (future := self._hikka_inflight.get(key)) is None:
+            future = asyncio.ensure_future(factory())
+            self._hikka_inflight[key] = future
+            future.add_done_callback(lambda _: self._hikka_inflight.pop(key, None))
+
+        # Shield the request, so cancellation of one caller doesn't affect others
+        return await asyncio.shield(future)
+
     async def force_get_entity(self, *args, **kwargs):
         """Forcefully makes a request to Telegram to get the entity."""
 
         return await self.get_entity(*args, force=True, **kwargs)
 
+    @tag_client(lambda self: self.tg_id)
     async def get_entity(
         self,
         entity: EntityLike,
         exp: int = 5 * 60,
         force: bool = False,
+        mutable: bool = False,
     ):
         """
         Gets the entity and cache it
@@ -82,13 +268,13 @@ class CustomTelegramClient(TelegramClient):
         :param entity: Entity to fetch
         :param exp: Expiration time of the cache record and maximum time of already cached record
         :param force: Whether to force refresh the cache (make API request)
+        :param mutable: Return a copy, which can be modified. Otherwise cached object
+                        can be returned. It is read-only snapshot, shared with other
+                        callers, so setting its attributes raises `AttributeError`.
+                        Object, fetched on cache miss, is frozen as well
         :return: :obj:`Entity`
         """
 
-        # Will be used to determine, which client caused logging messages
-        # parsed via inspect.stack()
-        _hikka_client_id_logging_tag = copy.copy(self.tg_id)  # skipcq
-
         if not hashable(entity):
             try:
                 hashable_entity = next(
@@ -111,46 +297,207 @@ class CustomTelegramClient(TelegramClient):
         if (
             not force
             and hashable_entity
-            and hashable_entity in self._hikka_entity_cache
-            and (
-                not exp
-                or self._hikka_entity_cache[hashable_entity].ts + exp > time.time()
-            )
+            and (record := self._hikka_entity_cache.get(hashable_entity))
+            and (not exp or record.ts + exp > time.time())
         ):
             logger.debug(
                 "Using cached entity %s (%s)",
                 entity,
-                type(self._hikka_entity_cache[hashable_entity].entity).__name__,
+                type(record.entity).__name__,
             )
-            return copy.deepcopy(self._hikka_entity_cache[hashable_entity].entity)
+            return copy.deepcopy(record.entity) if mutable else record.entity
+
+        async def resolve():
+            resolved_entity = await TelegramClient.get_entity(self, entity)
 
-        resolved_entity = await TelegramClient.get_entity(self, entity)
+            if not resolved_entity:
+                return resolved_entity
 
-        if resolved_entity:
-            cache_record = CacheRecordEntity(hashable_entity, resolved_entity, exp)
-            self._hikka_entity_cache[hashable_entity] = cache_record
+            record = CacheRecordEntity(hashable_entity, resolved_entity, exp or 5 * 60)
+            self._hikka_entity_cache.set(
+                hashable_entity,
+                record,
+                self._entity_aliases(resolved_entity),
+            )
             logger.debug("Saved hashable_entity %s to cache", hashable_entity)
+            # Result is shared by all concurrent callers, so it must be read-only
+            return record.entity
 
-            if getattr(resolved_entity, "id", None):
-                logger.debug("Saved resolved_entity id %s to cache", resolved_entity.id)
-                self._hikka_entity_cache[resolved_entity.id] = cache_record
+        resolved_entity = await self._single_flight(
+            ("entity", hashable_entity),
+            resolve,
+        )
+        return copy.deepcopy(resolved_entity) if mutable else resolved_entity
 
-            if getattr(resolved_entity, "username", None):
-                logger.debug(
-                    "Saved resolved_entity username @%s to cache",
-                    resolved_entity.username,
+    @staticmethod
+    def _entity_aliases(entity: typing.Any) -> typing.List[typing.Hashable]:
+        """Get keys, which entity can be accessed via in cache"""
+        aliases = [getattr(entity, "id", None)]
+        if username := getattr(entity, "username", None):
+            aliases += [f"@{username}", username]
+
+        return [alias for alias in aliases if alias]
+
+    async def get_entities(
+        self,
+        entities: typing.Iterable[EntityLike],
+        exp: int = 5 * 60,
+        force: bool = False,
+        mutable: bool = False,
+    ) -> typing.List[typing.Optional[typing.Any]]:
+        """
+        Gets multiple entities and cache them. Cached ones are returned
+        from cache, while the rest is fetched in as few batched requests
+        as possible
+
+        :param entities: Entities to fetch
+        :param exp: Expiration time of the cache record and maximum time of already cached record
+        :param force: Whether to force refresh the cache (make API request)
+        :param mutable: Return copies, which can be modified. Otherwise the read-only
+                        cached objects are returned
+        :return: List of entities in the same order as requested. Entities, which
+                 can't be resolved, are `None`
+        :raises RPCError: If entities can't be fetched now (e.g. flood wait), so
+                          `None` always means, that entity doesn't exist or is
+                          inaccessible
+        """
+        entities = list(entities)
+        result = [None] * len(entities)
+        # hashable_entity -> (entity, indexes of this entity in result)
+        misses = {}
+
+        for i, entity in enumerate(entities):
+            if not hashable(entity):
+                hashable_entity = next(
+                    (
+                        getattr(entity, attr)
+                        for attr in {"user_id", "channel_id", "chat_id", "id"}
+                        if getattr(entity, attr, None)
+                    ),
+                    None,
+                )
+            else:
+                hashable_entity = entity
+
+            if str(hashable_entity).isdigit() and int(hashable_entity) < 0:
+                hashable_entity = int(str(hashable_entity)[4:])
+
+            if not hashable_entity:
+                with contextlib.suppress(*_UNRESOLVABLE):
+                    result[i] = await self.get_entity(entity, exp, force, mutable)
+
+                continue
+
+            if (
+                not force
+                and (record := self._hikka_entity_cache.get(hashable_entity))
+                and (not exp or record.ts + exp > time.time())
+            ):
+                result[i] = record.entity
+                continue
+
+            misses.setdefault(hashable_entity, (entity, []))[1].append(i)
+
+        if misses:
+            # Input peers are mostly taken from session, so it doesn't cost
+            # a request, unless entity is a username
+            peers = {}
+            for hashable_entity, (entity, _) in misses.items():
+                try:
+                    peers[hashable_entity] = await self.get_input_entity(entity)
+                except _UNRESOLVABLE:
+                    logger.debug("Can't get input entity of %s", entity)
+
+            resolved = {
+                get_peer_id(entity): entity
+                for entity in await self._fetch_entities(list(peers.values()))
+            }
+
+            for hashable_entity, peer in peers.items():
+                peer_id = (
+                    self.tg_id if isinstance(peer, InputPeerSelf) else get_peer_id(peer)
+                )
+                if not (entity := resolved.get(peer_id)):
+                    continue
+
+                record = CacheRecordEntity(hashable_entity, entity, exp or 5 * 60)
+                self._hikka_entity_cache.set(
+                    hashable_entity,
+                    record,
+                    self._entity_aliases(entity),
                 )
-                self._hikka_entity_cache[f"@{resolved_entity.username}"] = cache_record
-                self._hikka_entity_cache[resolved_entity.username] = cache_record
 
-        return copy.deepcopy(resolved_entity)
+                for i in misses[hashable_entity][1]:
+                    result[i] = record.entity
 
+            logger.debug("Saved %s entities to cache", len(resolved))
+
+        return [
+            copy.deepcopy(entity) if mutable and entity is not None else entity
+            for entity in result
+        ]
+
+    async def _fetch_entities(self, peers: typing.List[typing.Any]) -> list:
+        """
+        Fetch entities of input peers with batched requests
+        :param peers: Input peers
+        :return: Fetched entities in arbitrary order
+        """
+        users, chats, channels = [], [], []
+        for peer in peers:
+            if isinstance(
+                peer,
+                (InputPeerSelf, InputPeerUser, InputPeerUserFromMessage),
+            ):
+                users += [peer]
+            elif isinstance(peer, (InputPeerChannel, InputPeerChannelFromMessage)):
+                channels += [peer]
+            elif isinstance(peer, InputPeerChat):
+                chats += [peer]
+
+        batches = [
+            *(
+                (GetUsersRequest([get_input_user(peer) for peer in batch]), batch)
+                for batch in (users[i : i + 100] for i in range(0, len(users), 100))
+            ),
+            *(
+                (GetChannelsRequest([get_input_channel(peer) for peer in batch]), batch)
+                for batch in (
+                    channels[i : i + 100] for i in range(0, len(channels), 100)
+                )
+            ),
+            *(
+                (GetChatsRequest([peer.chat_id for peer in batch]), batch)
+                for batch in (chats[i : i + 100] for i in range(0, len(chats), 100))
+            ),
+        ]
+
+        fetched = []
+        for request, batch in batches:
+            try:
+                response = await self(request)
+            except _UNRESOLVABLE:
+                # Single inaccessible entity fails the whole batch, so
+                # fetch entities of this batch one by one. Transient errors
+                # are raised, so that entities are not reported as missing
+                logger.debug("%s failed, fetching one by one", type(request).__name__)
+                response = []
+                for peer in batch:
+                    with contextlib.suppress(*_UNRESOLVABLE):
+                        response += [await TelegramClient.get_entity(self, peer)]
+
+            fetched += response if isinstance(response, list) else response.chats
+
+        return [entity for entity in fetched if not isinstance(entity, UserEmpty)]
+
+    @tag_client(lambda self: self.tg_id)
     async def get_perms_cached(
         self,
         entity: EntityLike,
         user: typing.Optional[EntityLike] = None,
         exp: int = 5 * 60,
         force: bool = False,
+        mutable: bool = False,
     ):
         """
         Gets the permissions of the user in the entity and cache it
@@ -159,13 +506,13 @@ class CustomTelegramClient(TelegramClient):
         :param user: User to fetch
         :param exp: Expiration time of the cache record and maximum time of already cached record
         :param force: Whether to force refresh the cache (make API request)
+        :param mutable: Return a copy, which can be modified. Otherwise cached object
+                        can be returned. It is read-only snapshot, shared with other
+                        callers, so setting its attributes raises `AttributeError`.
+                        Object, fetched on cache miss, is frozen as well
         :return: :obj:`ChatPermissions`
         """
 
-        # Will be used to determine, which client caused logging messages
-        # parsed via inspect.stack()
-        _hikka_client_id_logging_tag = copy.copy(self.tg_id)  # skipcq
-
         entity = await self.get_entity(entity)
         user = await self.get_entity(user) if user else None
 
@@ -209,64 +556,42 @@ class CustomTelegramClient(TelegramClient):
             not force
             and hashable_entity
             and hashable_user
-            and hashable_user in self._hikka_perms_cache.get(hashable_entity, {})
             and (
-                not exp
-                or self._hikka_perms_cache[hashable_entity][hashable_user].ts + exp
-                > time.time()
+                record := self._hikka_perms_cache.get((hashable_entity, hashable_user))
             )
+            and (not exp or record.ts + exp > time.time())
         ):
             logger.debug("Using cached perms %s (%s)", hashable_entity, hashable_user)
-            return copy.deepcopy(
-                self._hikka_perms_cache[hashable_entity][hashable_user].perms
-            )
+            return copy.deepcopy(record.perms) if mutable else record.perms
 
         resolved_perms = await self.get_permissions(entity, user)
 
         if resolved_perms:
-            cache_record = CacheRecordPerms(
+            record = CacheRecordPerms(
                 hashable_entity,
                 hashable_user,
                 resolved_perms,
-                exp,
+                exp or 5 * 60,
+            )
+            resolved_perms = record.perms
+            self._hikka_perms_cache.set(
+                (hashable_entity, hashable_user),
+                record,
+                itertools.product(
+                    [hashable_entity] + self._entity_aliases(entity),
+                    [hashable_user] + self._entity_aliases(user),
+                ),
             )
-            self._hikka_perms_cache.setdefault(hashable_entity, {})[
-                hashable_user
-            ] = cache_record
             logger.debug("Saved hashable_entity %s perms to cache", hashable_entity)
 
-            def save_user(key: typing.Union[str, int]):
-                nonlocal self, cache_record, user, hashable_user
-                if getattr(user, "id", None):
-                    self._hikka_perms_cache.setdefault(key, {})[user.id] = cache_record
-
-                if getattr(user, "username", None):
-                    self._hikka_perms_cache.setdefault(key, {})[
-                        f"@{user.username}"
-                    ] = cache_record
-                    self._hikka_perms_cache.setdefault(key, {})[
-                        user.username
-                    ] = cache_record
-
-            if getattr(entity, "id", None):
-                logger.debug("Saved resolved_entity id %s perms to cache", entity.id)
-                save_user(entity.id)
-
-            if getattr(entity, "username", None):
-                logger.debug(
-                    "Saved resolved_entity username @%s perms to cache",
-                    entity.username,
-                )
-                save_user(f"@{entity.username}")
-                save_user(entity.username)
-
-        return copy.deepcopy(resolved_perms)
+        return copy.deepcopy(resolved_perms) if mutable else resolved_perms
 
     async def get_fullchannel(
         self,
         entity: EntityLike,
         exp: int = 300,
         force: bool = False,
+        mutable: bool = False,
     ) -> ChannelFull:
         """
         Gets the FullChannelRequest and cache it
@@ -274,6 +599,10 @@ class CustomTelegramClient(TelegramClient):
         :param entity: Channel to fetch ChannelFull of
         :param exp: Expiration time of the cache record and maximum time of already cached record
         :param force: Whether to force refresh the cache (make API request)
+        :param mutable: Return a copy, which can be modified. Otherwise cached object
+                        can be returned. It is read-only snapshot, shared with other
+                        callers, so setting its attributes raises `AttributeError`.
+                        Object, fetched on cache miss, is frozen as well
         :return: :obj:`ChannelFull`
         """
         if not hashable(entity):
@@ -298,25 +627,33 @@ class CustomTelegramClient(TelegramClient):
 
         if (
             not force
-            and self._hikka_fullchannel_cache.get(hashable_entity)
-            and not self._hikka_fullchannel_cache[hashable_entity].expired
-            and self._hikka_fullchannel_cache[hashable_entity].ts + exp > time.time()
+            and (record := self._hikka_fullchannel_cache.get(hashable_entity))
+            and not record.expired
+            and record.ts + exp > time.time()
         ):
-            return self._hikka_fullchannel_cache[hashable_entity].full_channel
+            return (
+                copy.deepcopy(record.full_channel) if mutable else record.full_channel
+            )
 
-        result = await self(GetFullChannelRequest(channel=entity))
-        self._hikka_fullchannel_cache[hashable_entity] = CacheRecordFullChannel(
-            hashable_entity,
-            result,
-            exp,
-        )
-        return result
+        async def request():
+            record = CacheRecordFullChannel(
+                hashable_entity,
+                await self(GetFullChannelRequest(channel=entity)),
+                exp,
+            )
+            self._hikka_fullchannel_cache.set(hashable_entity, record)
+            # Result is shared by all concurrent callers, so it must be read-only
+            return record.full_channel
+
+        result = await self._single_flight(("fullchannel", hashable_entity), request)
+        return copy.deepcopy(result) if mutable else result
 
     async def get_fulluser(
         self,
         entity: EntityLike,
         exp: int = 300,
         force: bool = False,
+        mutable: bool = False,
     ) -> UserFull:
         """
         Gets the FullUserRequest and cache it
@@ -324,6 +661,10 @@ class CustomTelegramClient(TelegramClient):
         :param entity: User to fetch UserFull of
         :param exp: Expiration time of the cache record and maximum time of already cached record
         :param force: Whether to force refresh the cache (make API request)
+        :param mutable: Return a copy, which can be modified. Otherwise cached object
+                        can be returned. It is read-only snapshot, shared with other
+                        callers, so setting its attributes raises `AttributeError`.
+                        Object, fetched on cache miss, is frozen as well
         :return: :obj:`UserFull`
         """
         if not hashable(entity):
@@ -348,19 +689,24 @@ class CustomTelegramClient(TelegramClient):
 
         if (
             not force
-            and self._hikka_fulluser_cache.get(hashable_entity)
-            and not self._hikka_fulluser_cache[hashable_entity].expired
-            and self._hikka_fulluser_cache[hashable_entity].ts + exp > time.time()
+            and (record := self._hikka_fulluser_cache.get(hashable_entity))
+            and not record.expired
+            and record.ts + exp > time.time()
         ):
-            return self._hikka_fulluser_cache[hashable_entity].full_user
+            return copy.deepcopy(record.full_user) if mutable else record.full_user
 
-        result = await self(GetFullUserRequest(entity))
-        self._hikka_fulluser_cache[hashable_entity] = CacheRecordFullUser(
-            hashable_entity,
-            result,
-            exp,
-        )
-        return result
+        async def request():
+            record = CacheRecordFullUser(
+                hashable_entity,
+                await self(GetFullUserRequest(entity)),
+                exp,
+            )
+            self._hikka_fulluser_cache.set(hashable_entity, record)
+            # Result is shared by all concurrent callers, so it must be read-only
+            return record.full_user
+
+        result = await self._single_flight(("fulluser", hashable_entity), request)
+        return copy.deepcopy(result) if mutable else result
 
     @staticmethod
     def _find_message_obj_in_frame(
@@ -419,7 +765,6 @@ class CustomTelegramClient(TelegramClient):
     async def _topic_guesser(
         self,
         native_method: typing.Callable[..., typing.Awaitable[Message]],
-        stack: typing.List[inspect.FrameInfo],
         *args,
         **kwargs,
     ):
@@ -432,7 +777,9 @@ class CustomTelegramClient(TelegramClient):
 
             logger.debug("Topic deleted, trying to guess topic id")
 
-            topic = await self._find_topic_in_stack(args[0], stack)
+            # Caller is suspended on awaiting this coroutine, so its frames are
+            # still in the stack and can be inspected only on this error path
+            topic = await self._find_topic_in_stack(args[0], inspect.stack(0))
 
             logger.debug("Guessed topic id: %s", topic)
 
@@ -441,23 +788,13 @@ class CustomTelegramClient(TelegramClient):
 
             kwargs["reply_to"] = topic
             kwargs["_topic_no_retry"] = True
-            return await self._topic_guesser(native_method, stack, *args, **kwargs)
+            return await self._topic_guesser(native_method, *args, **kwargs)
 
     async def send_file(self, *args, **kwargs) -> Message:
-        return await self._topic_guesser(
-            TelegramClient.send_file,
-            inspect.stack(),
-            *args,
-            **kwargs,
-        )
+        return await self._topic_guesser(TelegramClient.send_file, *args, **kwargs)
 
     async def send_message(self, *args, **kwargs) -> Message:
-        return await self._topic_guesser(
-            TelegramClient.send_message,
-            inspect.stack(),
-            *args,
-            **kwargs,
-        )
+        return await self._topic_guesser(TelegramClient.send_message, *args, **kwargs)
 
     async def _call(
         self,
@@ -501,20 +838,8 @@ class CustomTelegramClient(TelegramClient):
         new_request = []
 
         for item in request:
-            if item.CONSTRUCTOR_ID in self.__forbidden_constructors and next(
-                (
-                    frame_info.frame.f_locals["self"]
-                    for frame_info in inspect.stack()
-                    if hasattr(frame_info, "frame")
-                    and hasattr(frame_info.frame, "f_locals")
-                    and isinstance(frame_info.frame.f_locals, dict)
-                    and "self" in frame_info.frame.f_locals
-                    and isinstance(frame_info.frame.f_locals["self"], Module)
-                    and not getattr(
-                        frame_info.frame.f_locals["self"], "__origin__", ""
-                    ).startswith("<core")
-                ),
-                None,
+            if item.CONSTRUCTOR_ID in self.__forbidden_constructors and (
+                self._is_external_module_call()
             ):
                 logger.debug(
                     "🎉 I protected you from unintented %s (%s)!",
@@ -536,14 +861,35 @@ class CustomTelegramClient(TelegramClient):
             flood_sleep_threshold,
         )
 
+    @staticmethod
+    def _is_external_module_call() -> bool:
+        """Whether current code is running on behalf of non-core module"""
+        if isinstance(module := current_module.get(), Module) and not getattr(
+            module, "__origin__", ""
+        ).startswith("<core"):
+            return True
+
+        # Module is unknown, if it calls client from its own event handler or
+        # task, which was not spawned by dispatcher. Core module context can
+        # run external code as well, e.g. `on_change` callbacks of config
+        # values. Fall back to stack lookup in both cases
+        return any(
+            isinstance(module := frame_info.frame.f_locals.get("self"), Module)
+            and not getattr(module, "__origin__", "").startswith("<core")
+            for frame_info in inspect.stack(0)
+            if isinstance(
+                getattr(getattr(frame_info, "frame", None), "f_locals", None),
+                dict,
+            )
+        )
+
     def forbid_constructor(self, constructor: int):
         """
         Forbids the given constructor to be called
 
         :param constructor: Constructor id to forbid
         """
-        self.__forbidden_constructors.extend([constructor])
-        self.__forbidden_constructors = list(set(self.__forbidden_constructors))
+        self.__forbidden_constructors.add(constructor)
 
     def forbid_constructors(self, constructors: list):
         """
@@ -552,7 +898,7 @@ class CustomTelegramClient(TelegramClient):
 
         :param constructors: Constructor ids to forbid
         """
-        self.__forbidden_constructors = list(set(constructors))
+        self.__forbidden_constructors = set(constructors)
 
     def _handle_update(
         self: "CustomTelegramClient",
@@ -6,62 +6,231 @@
 # Netfoll Team modifided Hikka files for Netfoll
 # 🌐 https://github.com/MXRRI/Netfoll
 
+import asyncio
+import contextlib
+import hashlib
 import json
 import logging
 import os
+import time
 import typing
+from types import MappingProxyType
 
-import requests
+import aiohttp
 
 from . import utils
-from .database import Database
+from .database import DATA_DIR, Database
 from .tl_cache import CustomTelegramClient
 from .types import Module
 
 logger = logging.getLogger(__name__)
 
 
+class LangPacks:
+    """
+    Language packs, shared by all clients of the process. Remote packs are
+    fetched concurrently and cached on disk along with their ETag, so they
+    are only downloaded again if changed. Merged packs are frozen and reused
+    by all clients with the same language setting
+    """
+
+    # How long fetched remote pack is used without revalidation
+    REVALIDATE_AFTER = 60 * 60
+
+    def __init__(self, cache_dir: str):
+        self._cache_dir = cache_dir
+        # url -> (fetched_at, sha256, data)
+        self._remote = {}
+        # path -> (mtime, data)
+        self._local = {}
+        # url -> future of running fetch
+        self._inflight = {}
+        # (lang, versions of packs) -> merged table
+        self._tables = {}
+
+    def _cache_path(self, url: str) -> str:
+        return os.path.join(
+            self._cache_dir,
+            f"{hashlib.sha256(url.encode()).hexdigest()}.json",
+        )
+
+    def _read_cache(self, url: str) -> typing.Optional[dict]:
+        try:
+            with open(self._cache_path(url), "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return None
+
+        if (
+            not isinstance(cached, dict)
+            or not isinstance(cached.get("body"), str)
+            or hashlib.sha256(cached["body"].encode()).hexdigest()
+            != cached.get("sha256")
+        ):
+            logger.debug("Cached language pack %s is corrupted", url)
+            return None
+
+        return cached
+
+    def _write_cache(self, url: str, cached: dict):
+        with contextlib.suppress(OSError):
+            os.makedirs(self._cache_dir, exist_ok=True)
+            tmp_path = f"{self._cache_path(url)}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(cached, f)
+
+            os.replace(tmp_path, self._cache_path(url))
+
+    @staticmethod
+    def _parse(url: str, body: str) -> typing.Optional[typing.Dict[str, str]]:
+        try:
+            ndata = json.loads(body)
+            data = ndata.get("data", ndata)
+        except Exception:
+            logger.exception("Unable to decode %s", url)
+            return None
+
+        if not isinstance(data, dict) or any(
+            not isinstance(i, str) for i in data.values()
+        ):
+            logger.error("Translation pack format is not valid (typecheck failed)")
+            return None
+
+        return data
+
+    async def _fetch(self, url: str):
+        cached = self._read_cache(url)
+        etag = cached.get("etag") if cached else None
+        try:
+            async with aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=15)
+            ) as session, session.get(
+                url,
+                headers=(
+                    {"If-None-Match": cached["etag"]}
+                    if cached and cached.get("etag")
+                    else {}
+                ),
+            ) as response:
+                if response.status == 304 and cached:
+                    body = cached["body"]
+                else:
+                    response.raise_for_status()
+                    body = await response.text()
+                    etag = response.headers.get("ETag")
+        except Exception:
+            if not cached:
+                logger.exception("Unable to fetch language pack %s", url)
+                return
+
+            logger.warning("Unable to fetch language pack %s, using cached one", url)
+            body = cached["body"]
+
+        sha256 = hashlib.sha256(body.encode()).hexdigest()
+        if url in self._remote and self._remote[url][1] == sha256:
+            self._remote[url] = (time.time(), *self._remote[url][1:])
+            return
+
+        if (data := self._parse(url, body)) is None:
+            return
+
+        if not cached or cached["sha256"] != sha256:
+            self._write_cache(url, {"etag": etag, "sha256": sha256, "body": body})
+
+        self._remote[url] = (time.time(), sha256, MappingProxyType(data))
+
+    async def _get_remote(self, url: str):
+        if (
+            url in self._remote
+            and time.time() - self._remote[url][0] < self.REVALIDATE_AFTER
+        ):
+            return
+
+        if url not in self._inflight:
+            self._inflight[url] = asyncio.ensure_future(self._fetch(url))
+            self._inflight[url].add_done_callback(
+                lambda _: self._inflight.pop(url, None)
+            )
+
+        await asyncio.shield(self._inflight[url])
+
+    def _get_local(self, language: str) -> typing.Optional[tuple]:
+        path = os.path.join(utils.get_base_dir(), f"langpacks/{language}.json")
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+
+        if self._local.get(path, (None,))[0] != mtime:
+            with open(path, "r") as f:
+                self._local[path] = (mtime, MappingProxyType(json.load(f)))
+
+        return self._local[path]
+
+    async def get(self, lang: str) -> typing.Mapping[str, str]:
+        """
+        Get merged translations for language setting
+        :param lang: Space-separated languages and urls of packs
+        :return: Read-only mapping of translations
+        """
+        remote, local = [], None
+        for language in lang.split(" "):
+            if utils.check_url(language):
+                remote += [language]
+            elif (local := self._get_local(language)) is not None:
+                # Local pack stops the lookup, so the next packs are not fetched
+                break
+
+        await asyncio.gather(*(self._get_remote(url) for url in set(remote)))
+
+        packs = [self._remote[url] for url in remote if url in self._remote]
+        if local is not None:
+            packs += [local]
+
+        key = (lang, tuple(pack[-2] for pack in packs))
+        if key not in self._tables:
+            data = {}
+            for pack in packs:
+                data.update(pack[-1])
+
+            self._tables = {
+                table_key: table
+                for table_key, table in self._tables.items()
+                if table_key[0] != lang
+            }
+            self._tables[key] = MappingProxyType(data)
+
+        return self._tables[key]
+
+
+langpacks = LangPacks(os.path.join(DATA_DIR, "langpacks-cache"))
+
+
 class Translator:
     def __init__(self, client: CustomTelegramClient, db: Database):
         self._client = client
         self.db = db
+        self._data = MappingProxyType({})
+        # Increased on each `init`, so `Strings` can drop resolved strings
+        self._generation = 0
 
     async def init(self) -> bool:
-        self._data = {}
+        self._generation += 1
         if not (lang := self.db.get(__name__, "lang", False)):
+            self._data = MappingProxyType({})
             return False
 
-        for language in lang.split(" "):
-            if utils.check_url(language):
-                try:
-                    ndata = (await utils.run_sync(requests.get, lang)).json()
-                except Exception:
-                    logger.exception("Unable to decode %s", lang)
-                    continue
-
-                data = ndata.get("data", ndata)
-
-                if any(not isinstance(i, str) for i in data.values()):
-                    logger.exception(
-                        "Translation pack format is not valid (typecheck failed)"
-                    )
-                    continue
-
-                self._data.update(data)
-                continue
-
-            possible_pack_path = os.path.join(
-                utils.get_base_dir(),
-                f"langpacks/{language}.json",
-            )
-
-            if os.path.isfile(possible_pack_path):
-                with open(possible_pack_path, "r") as f:
-                    self._data.update(json.load(f))
+        self._data = await langpacks.get(lang)
+        return True
 
-                return True
+    @property
+    def revision(self) -> typing.Tuple[int, int]:
+        """Changes, when translations are reloaded or language is changed"""
+        return self._generation, self.db.revision(__name__)
 
-        return True
+    @property
+    def languages(self) -> typing.List[str]:
+        return self.db.get(__name__, "lang", "en").split(" ")
 
     def getkey(self, key: str) -> typing.Any:
         return self._data.get(key, False)
@@ -79,37 +248,41 @@ class Strings:
             logger.debug("Module %s got empty translator %s", mod, translator)
 
         self._base_strings = mod.strings  # Back 'em up, bc they will get replaced
+        # Resolved strings. Dropped, when translator revision changes
+        self._cache = {}
+        self._cache_revision = None
+
+    def _resolve(self, key: str) -> typing.Any:
+        value = self._translator.getkey(f"{self._mod.__module__}.{key}")
+        if value:
+            return value
+
+        for lang in self._translator.languages:
+            strings = getattr(self._mod, f"strings_{lang}", None)
+            if isinstance(strings, dict) and key in strings:
+                return strings[key]
+
+        return self._base_strings[key]
 
     def __getitem__(self, key: str) -> str:
-        return (
-            self._translator.getkey(f"{self._mod.__module__}.{key}")
-            if self._translator is not None
-            else False
-        ) or (
-            getattr(
-                self._mod,
-                next(
-                    (
-                        f"strings_{lang}"
-                        for lang in self._translator.db.get(
-                            __name__,
-                            "lang",
-                            "en",
-                        ).split(" ")
-                        if hasattr(self._mod, f"strings_{lang}")
-                        and isinstance(getattr(self._mod, f"strings_{lang}"), dict)
-                        and key in getattr(self._mod, f"strings_{lang}")
-                    ),
-                    utils.rand(32),
-                ),
-                self._base_strings,
-            )
-            if self._translator is not None
-            else self._base_strings
-        ).get(
-            key,
-            self._base_strings.get(key, "Unknown strings"),
-        )
+        if self._translator is None:
+            return self._base_strings.get(key, "Unknown strings")
+
+        if (revision := self._translator.revision) != self._cache_revision:
+            self._cache = {}
+            self._cache_revision = revision
+
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+
+        try:
+            value = self._cache[key] = self._resolve(key)
+        except KeyError:
+            return "Unknown strings"
+
+        return value
 
     def __call__(
         self,
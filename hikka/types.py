@@ -27,6 +27,7 @@ from importlib.abc import SourceLoader
 import requests
 from telethon.hints import EntityLike
 from telethon.tl.functions.account import UpdateNotifySettingsRequest
+from telethon.tl.tlobject import TLObject
 from telethon.tl.types import (
     Channel,
     ChannelFull,
@@ -36,6 +37,7 @@ from telethon.tl.types import (
 )
 
 from . import validators, version  # skipcq: PY-W2000
+from ._internal import tag_client
 from ._reference_finder import replace_all_refs
 from .inline.types import BotInlineMessage  # skipcq: PY-W2000
 from .inline.types import (
@@ -225,6 +227,7 @@ class Module:
     def hikka_watchers(self, _):
         pass
 
+    @tag_client(lambda self: self.client.tg_id)
     async def animate(
         self,
         message: typing.Union[Message, InlineMessage],
@@ -246,9 +249,6 @@ class Module:
         """
         from . import utils
 
-        with contextlib.suppress(AttributeError):
-            _hikka_client_id_logging_tag = copy.copy(self.client.tg_id)
-
         if interval < 0.1:
             logger.warning(
                 "Resetting animation interval to 0.1s, because it may get you in"
@@ -991,6 +991,81 @@ def _get_members(
     }
 
 
+_frozen_classes = {}
+
+
+def _frozen_class(cls: type) -> type:
+    """Get read-only subclass of `cls`, which produces mutable deep copies"""
+    if cls in _frozen_classes:
+        return _frozen_classes[cls]
+
+    def __setattr__(self, *_):
+        raise AttributeError(
+            f"{cls.__name__} is a read-only cache snapshot. Pass `mutable=True` or"
+            " use `copy.deepcopy` to get a copy, which can be modified"
+        )
+
+    def __deepcopy__(self, memo: dict):
+        clone = cls.__new__(cls)
+        memo[id(self)] = clone
+        for key, value in vars(self).items():
+            object.__setattr__(clone, key, copy.deepcopy(value, memo))
+
+        return clone
+
+    def __eq__(self, other: typing.Any) -> bool:
+        # Compare as the original class, so frozen and regular objects are equal
+        # regardless of the order of operands
+        return isinstance(other, cls) and self.to_dict() == other.to_dict()
+
+    _frozen_classes[cls] = type(
+        cls.__name__,
+        (cls,),
+        {
+            "__slots__": (),
+            "__module__": cls.__module__,
+            "__setattr__": __setattr__,
+            "__delattr__": __setattr__,
+            "__deepcopy__": __deepcopy__,
+            "__eq__": __eq__,
+            "__ne__": lambda self, other: not __eq__(self, other),
+        },
+    )
+    return _frozen_classes[cls]
+
+
+def freeze(obj: typing.Any, _memo: typing.Optional[dict] = None) -> typing.Any:
+    """
+    Get read-only copy of TL object, so it can be shared between callers
+    without copying. Nested TL objects are frozen as well, other values are
+    shared with the original object, which is left untouched.
+    `copy.deepcopy` of frozen object returns regular mutable object
+    :param obj: Object to freeze
+    :return: Frozen copy or `obj` itself, if it can't be frozen
+    """
+    if _memo is None:
+        _memo = {}
+
+    if id(obj) in _memo:
+        return _memo[id(obj)]
+
+    if not isinstance(obj, TLObject) or type(obj) in _frozen_classes.values():
+        return obj
+
+    frozen = _frozen_class(type(obj)).__new__(_frozen_class(type(obj)))
+    _memo[id(obj)] = frozen
+
+    for key, value in vars(obj).items():
+        if isinstance(value, (list, tuple)):
+            value = type(value)(freeze(item, _memo) for item in value)
+        else:
+            value = freeze(value, _memo)
+
+        object.__setattr__(frozen, key, value)
+
+    return frozen
+
+
 class CacheRecordEntity:
     def __init__(
         self,
@@ -998,7 +1073,7 @@ class CacheRecordEntity:
         resolved_entity: EntityLike,
         exp: int,
     ):
-        self.entity = copy.deepcopy(resolved_entity)
+        self.entity = freeze(resolved_entity)
         self._hashable_entity = copy.deepcopy(hashable_entity)
         self._exp = round(time.time() + exp)
         self.ts = time.time()
@@ -1031,7 +1106,7 @@ class CacheRecordPerms:
         resolved_perms: EntityLike,
         exp: int,
     ):
-        self.perms = copy.deepcopy(resolved_perms)
+        self.perms = freeze(resolved_perms)
         self._hashable_entity = copy.deepcopy(hashable_entity)
         self._hashable_user = copy.deepcopy(hashable_user)
         self._exp = round(time.time() + exp)
@@ -1059,7 +1134,7 @@ class CacheRecordPerms:
 class CacheRecordFullChannel:
     def __init__(self, channel_id: int, full_channel: ChannelFull, exp: int):
         self.channel_id = channel_id
-        self.full_channel = full_channel
+        self.full_channel = freeze(full_channel)
         self._exp = round(time.time() + exp)
         self.ts = time.time()
 
@@ -1086,7 +1161,7 @@ class CacheRecordFullChannel:
 class CacheRecordFullUser:
     def __init__(self, user_id: int, full_user: UserFull, exp: int):
         self.user_id = user_id
-        self.full_user = full_user
+        self.full_user = freeze(full_user)
         self._exp = round(time.time() + exp)
         self.ts = time.time()
 
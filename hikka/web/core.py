@@ -26,10 +26,13 @@
 
 import asyncio
 import contextlib
+import hashlib
 import inspect
 import logging
 import os
+import secrets
 import subprocess
+import typing
 
 import aiohttp_jinja2
 import jinja2
@@ -50,6 +53,12 @@ class Web(root.Web):
         self.running = asyncio.Event()
         self.ready = asyncio.Event()
         self.client_data = {}
+        self.webhook_url = kwargs.pop("webhook_url", None)
+        # Hash of bot token -> inline manager, which receives updates of the bot,
+        # and secret token, which Telegram sends along with them
+        self.webhooks = {}
+        # Webhook updates, which are being processed
+        self._webhook_tasks = set()
         self.app = web.Application()
         self.proxypasser = proxypass.ProxyPasser()
         aiohttp_jinja2.setup(
@@ -61,6 +70,7 @@ class Web(root.Web):
 
         super().__init__(**kwargs)
         self.app.router.add_get("/favicon.ico", self.favicon)
+        self.app.router.add_post("/webhook/{token_hash}", self.webhook)
         self.app.router.add_static("/static/", "web-resources/static")
 
     async def start_if_ready(
@@ -131,6 +141,61 @@ class Web(root.Web):
     ):
         self.client_data[client.tg_id] = (loader, client, db)
 
+    @staticmethod
+    def _token_hash(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def add_webhook(
+        self,
+        inline: "InlineManager",  # type: ignore
+    ) -> typing.Optional[typing.Tuple[str, str]]:
+        """
+        Route updates of inline bot, posted to the web server, to its manager
+        :param inline: Inline manager of the bot
+        :return: Url to set as a webhook and secret token, which requests
+                 must carry, or `None` if webhooks are disabled. Secret is taken
+                 from `WEBHOOK_SECRET` environment variable, if it is set
+        """
+        if not self.webhook_url:
+            return None
+
+        token_hash = self._token_hash(inline._token)
+        # Fixed secret allows to post updates to the route locally for testing
+        secret = os.environ.get("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+        self.webhooks[token_hash] = (inline, secret)
+        logger.debug(
+            "Webhook route /webhook/%s expects secret token %s",
+            token_hash,
+            secret,
+        )
+        return f"{self.webhook_url.rstrip('/')}/webhook/{token_hash}", secret
+
+    def remove_webhook(self, inline: "InlineManager"):  # type: ignore
+        self.webhooks.pop(self._token_hash(inline._token), None)
+
+    async def webhook(self, request: web.Request) -> web.Response:
+        if (webhook := self.webhooks.get(request.match_info["token_hash"])) is None:
+            return web.Response(status=404)
+
+        inline, secret = webhook
+        if not secrets.compare_digest(
+            request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""),
+            secret,
+        ):
+            return web.Response(status=403)
+
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        # Telegram waits for the response before sending next update,
+        # so it's processed in background
+        task = asyncio.ensure_future(inline.feed_update(update))
+        self._webhook_tasks.add(task)
+        task.add_done_callback(self._webhook_tasks.discard)
+        return web.Response()
+
     @staticmethod
     async def favicon(_):
         return web.Response(
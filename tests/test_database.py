@@ -0,0 +1,133 @@
+import asyncio
+import fnmatch
+import json
+import types
+
+import pytest
+
+from hikka import _db_backends
+from hikka._db_backends import RedisBackend
+
+
+class FlakyRedis:
+    """Redis client, whose first pipeline execution fails"""
+
+    def __init__(self):
+        self.data = {}
+        self.failures = 1
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def exists(self, key):
+        return key in self.data
+
+    def scan_iter(self, match):
+        return [key.encode() for key in self.data if fnmatch.fnmatch(key, match)]
+
+    def pipeline(self):
+        return FlakyPipeline(self)
+
+
+class FlakyPipeline:
+    def __init__(self, redis):
+        self._redis = redis
+        self._commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        pass
+
+    def set(self, key, value):
+        self._commands += [(key, value)]
+
+    def delete(self, *keys):
+        self._commands += [(key, None) for key in keys]
+
+    def execute(self):
+        if self._redis.failures:
+            self._redis.failures -= 1
+            raise ConnectionError("Connection reset by peer")
+
+        for key, value in self._commands:
+            if value is None:
+                self._redis.data.pop(key, None)
+            else:
+                self._redis.data[key] = value.encode()
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = FlakyRedis()
+    monkeypatch.setattr(
+        _db_backends,
+        "redis",
+        types.SimpleNamespace(
+            Redis=types.SimpleNamespace(from_url=lambda uri: client),
+        ),
+        raising=False,
+    )
+    monkeypatch.setenv("REDIS_URL", "redis://localhost")
+    return client
+
+
+def make_db():
+    pytest.importorskip("telethon")
+
+    from hikka.database import Database
+
+    db = Database(types.SimpleNamespace(tg_id=1))
+    db._backend = db._get_backend()
+    return db
+
+
+def test_backend_write_can_be_repeated(redis_client):
+    backend = RedisBackend("redis://localhost", 1)
+    payload = backend.prepare(
+        {"owner": {"key": "value"}},
+        {("owner", "key")},
+        set(),
+        False,
+    )
+
+    with pytest.raises(ConnectionError):
+        backend.write(payload)
+
+    assert not redis_client.data
+
+    backend.write(payload)
+    assert backend.owners() == ["owner"]
+    assert backend.read_owner("owner") == {"key": "value"}
+
+
+def test_failed_write_is_retried(redis_client):
+    async def run():
+        db = make_db()
+        db.set("owner", "key", "value")
+
+        assert not await db.flush()
+        assert ("owner", "key") in db._dirty
+
+        db.set("other", "key", "value")
+        assert await db.flush()
+        assert not db._dirty
+
+    asyncio.run(run())
+    assert json.loads(redis_client.data["netfoll:1:owner"]) == {"key": "value"}
+    assert json.loads(redis_client.data["netfoll:1:other"]) == {"key": "value"}
+
+
+def test_save_bumps_revisions(redis_client):
+    async def run():
+        db = make_db()
+        db.set("owner", "key", [])
+        revision = db.revision("owner")
+
+        db["owner"]["key"].append("value")
+        db.save()
+        return revision, db.revision("owner")
+
+    before, after = asyncio.run(run())
+    assert after > before
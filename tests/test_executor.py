@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from hikka._executor import COMMANDS, OWNER, WATCHERS, HandlerExecutor
+
+
+async def block_slot(executor: HandlerExecutor) -> asyncio.Event:
+    """Occupy the only slot of executor until returned event is set"""
+    release = asyncio.Event()
+    await executor.submit("blocker", release.wait, lane=OWNER)
+    return release
+
+
+async def settle():
+    for _ in range(100):
+        await asyncio.sleep(0)
+
+
+def test_module_limit():
+    async def run():
+        executor = HandlerExecutor(max_tasks=10, max_module_tasks=2)
+        release = asyncio.Event()
+        for _ in range(4):
+            await executor.submit("module", release.wait)
+
+        await executor.submit("other", release.wait)
+        await settle()
+        stats = executor.stats
+
+        release.set()
+        await settle()
+        return stats, executor.stats
+
+    limited, finished = asyncio.run(run())
+    assert limited["running"] == 3
+    assert limited["queued_watchers"] == 2
+    assert finished["running"] == 0
+    assert finished["queued_watchers"] == 0
+
+
+def test_lane_weights():
+    async def run():
+        executor = HandlerExecutor(max_tasks=1)
+        release = await block_slot(executor)
+        order = []
+
+        def job(lane: str):
+            async def handler():
+                order.append(lane)
+
+            return handler
+
+        for _ in range(8):
+            await executor.submit("commands", job(COMMANDS), lane=COMMANDS)
+            await executor.submit("watchers", job(WATCHERS), lane=WATCHERS)
+
+        release.set()
+        await settle()
+        return order
+
+    order = asyncio.run(run())
+    assert len(order) == 16
+    # Commands get 4 of each 6 slots, watchers get 2
+    assert order[:6].count(COMMANDS) == 4
+    assert order[:6].count(WATCHERS) == 2
+
+
+def run_overflow(overflow: str):
+    async def run():
+        executor = HandlerExecutor(max_tasks=1, max_queue=2, overflow=overflow)
+        release = await block_slot(executor)
+        order = []
+
+        def job(i: int):
+            async def handler():
+                order.append(i)
+
+            return handler
+
+        submitted = [await executor.submit("module", job(i)) for i in range(2)]
+        last = asyncio.ensure_future(executor.submit("module", job(2)))
+        await settle()
+        blocked = not last.done()
+
+        release.set()
+        await settle()
+        return submitted + [await last], blocked, order
+
+    return asyncio.run(run())
+
+
+def test_overflow_drop_oldest():
+    submitted, blocked, order = run_overflow("drop_oldest")
+    assert submitted == [True, True, True]
+    assert not blocked
+    assert order == [1, 2]
+
+
+def test_overflow_drop_new():
+    submitted, blocked, order = run_overflow("drop_new")
+    assert submitted == [True, True, False]
+    assert not blocked
+    assert order == [0, 1]
+
+
+def test_overflow_block():
+    submitted, blocked, order = run_overflow("block")
+    assert submitted == [True, True, True]
+    assert blocked
+    assert order == [0, 1, 2]
+
+
+def test_run_after_cancel():
+    async def run():
+        executor = HandlerExecutor(max_tasks=1)
+        release = await block_slot(executor)
+        called = []
+
+        async def handler():
+            called.append(True)
+            return "result"
+
+        queued = asyncio.ensure_future(executor.run("module", handler))
+        await settle()
+        cancelled = executor.cancel("module")
+
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+
+        release.set()
+        result = await executor.run("module", handler)
+        return cancelled, called, result
+
+    cancelled, called, result = asyncio.run(run())
+    assert cancelled == 1
+    assert called == [True]
+    assert result == "result"
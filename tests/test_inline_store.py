@@ -0,0 +1,123 @@
+import functools
+import types
+
+import pytest
+
+from hikka.inline import store
+from hikka.inline.store import NotSerializable, UnitStore, deserialize, serialize
+
+
+class FakeManager:
+    def _gallery_page(self, call, unit_id: str):
+        pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(store, "time", types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def unit_store(tmp_path, clock):
+    return UnitStore(str(tmp_path / "inline.db"))
+
+
+def test_save_and_find(unit_store):
+    entry = {"handler": {"__callable__": "inline", "name": "_gallery_page"}}
+    unit_store.save("unit", {"type": "form"}, None, ["button", "query"], {"nav": entry})
+
+    assert unit_store.load("unit") == {"type": "form"}
+    assert unit_store.find("button") == ("unit", None)
+    assert unit_store.find("nav") == ("unit", entry)
+    assert unit_store.find("missing") is None
+    assert unit_store.entries("unit") == {"nav": entry}
+
+
+def test_save_replaces_previous_render(unit_store):
+    unit_store.save("unit", {}, None, ["old"], {"old_nav": {}})
+    unit_store.save("unit", {}, None, ["new"], {"new_nav": {}})
+
+    assert unit_store.find("old") is None
+    assert unit_store.find("old_nav") is None
+    assert unit_store.find("new") == ("unit", None)
+    assert unit_store.entries("unit") == {"new_nav": {}}
+
+
+def test_expired_unit_is_not_loaded(unit_store, clock):
+    unit_store.save("unit", {}, clock.now + 10, [], {})
+    assert unit_store.load("unit") == {}
+
+    clock.now += 20
+    assert unit_store.load("unit") is None
+
+
+def test_delete(unit_store):
+    unit_store.save("unit", {}, None, ["button"], {"nav": {}})
+    unit_store.delete("unit")
+
+    assert unit_store.load("unit") is None
+    assert unit_store.find("button") is None
+    assert unit_store.find("nav") is None
+
+
+def test_purge(unit_store, clock):
+    unit_store.save("expired", {}, clock.now + 10, ["expired"], {})
+    for i in range(3):
+        clock.now += 1
+        unit_store.save(f"unit{i}", {}, None, [f"button{i}"], {})
+
+    clock.now += 20
+    assert unit_store.purge(max_units=2) == 2
+    assert unit_store.load("unit0") is None
+    assert unit_store.find("button0") is None
+    assert unit_store.find("expired") is None
+    assert unit_store.load("unit1") == unit_store.load("unit2") == {}
+
+    clock.now += store.MAX_AGE
+    assert unit_store.purge() == 2
+
+
+def test_serialize_primitives():
+    manager = FakeManager()
+    value = {"text": "Hi", "count": 1, "items": [1.5, None, True], "row": ("a",)}
+
+    serialized = serialize(value, manager)
+    assert serialized == {
+        "text": "Hi",
+        "count": 1,
+        "items": [1.5, None, True],
+        "row": ["a"],
+    }
+    assert deserialize(serialized, manager) == serialized
+
+
+def test_serialize_manager_partial():
+    manager = FakeManager()
+    value = functools.partial(manager._gallery_page, unit_id="unit")
+
+    restored = deserialize(serialize(value, manager), manager)
+    assert restored.func == manager._gallery_page
+    assert restored.args == ()
+    assert restored.keywords == {"unit_id": "unit"}
+
+
+def test_serialize_non_string_keys():
+    with pytest.raises(NotSerializable):
+        serialize({1: "value"}, FakeManager())
+
+
+def test_serialize_gallery_list():
+    pytest.importorskip("aiogram")
+    pytest.importorskip("telethon")
+
+    from hikka.inline.gallery import ListGalleryHelper
+
+    manager = FakeManager()
+    restored = deserialize(serialize(ListGalleryHelper(["a", "b"]), manager), manager)
+    assert isinstance(restored, ListGalleryHelper)
+    assert restored.lst == ["a", "b"]
+
+    with pytest.raises(NotSerializable):
+        serialize(lambda: None, manager)
@@ -0,0 +1,61 @@
+import asyncio
+import types
+
+import pytest
+
+
+class FakeDb:
+    def get(self, owner, key, default=None):
+        return default
+
+    def revision(self, owner):
+        return 0
+
+
+def test_gallery_flips_dont_leak_callbacks(tmp_path):
+    pytest.importorskip("aiogram")
+    pytest.importorskip("telethon")
+
+    from hikka.inline.core import InlineManager
+    from hikka.inline.gallery import ListGalleryHelper
+    from hikka.inline.store import UnitStore
+
+    photos = [f"https://example.com/{i}.jpg" for i in range(10)]
+
+    async def run():
+        manager = InlineManager(
+            types.SimpleNamespace(tg_id=1),
+            FakeDb(),
+            types.SimpleNamespace(modules=[]),
+        )
+        manager._store = UnitStore(str(tmp_path / "inline.db"))
+        manager._units["gallery"] = {
+            "type": "gallery",
+            "uid": "gallery",
+            "photos": photos,
+            "next_handler": ListGalleryHelper(photos),
+            "current_index": 0,
+        }
+
+        sizes = []
+        for flip in range(50):
+            manager._units["gallery"]["current_index"] = flip % len(photos)
+            manager._gallery_markup("gallery")
+            await manager._store_write_task
+            (rows,) = manager._store._conn.execute(
+                "SELECT COUNT(*) FROM keys"
+            ).fetchone()
+            sizes += [(len(manager._custom_map), rows)]
+
+        del manager._units["gallery"]
+        await manager._store_write_task
+        (rows,) = manager._store._conn.execute("SELECT COUNT(*) FROM keys").fetchone()
+        return sizes, len(manager._custom_map), rows
+
+    sizes, custom_map_left, rows_left = asyncio.run(run())
+
+    # Single render has at most 5 page buttons, 3 navigation buttons and close
+    assert max(custom_map for custom_map, _ in sizes) <= 9
+    assert max(rows for _, rows in sizes) <= 9
+    assert custom_map_left == 0
+    assert rows_left == 0
@@ -0,0 +1,51 @@
+import types
+
+import pytest
+
+from hikka import _ratelimit
+from hikka._ratelimit import RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=100.0)
+    monkeypatch.setattr(
+        _ratelimit,
+        "time",
+        types.SimpleNamespace(monotonic=lambda: clock.now),
+    )
+    return clock
+
+
+def test_rejects_hits_above_capacity(clock):
+    limiter = RateLimiter(3, 1)
+    assert [limiter.hit("user") for _ in range(4)] == [True, True, True, False]
+    assert limiter.hit("other")
+
+
+def test_bucket_drains(clock):
+    limiter = RateLimiter(3, 1)
+    for _ in range(3):
+        limiter.hit("user")
+
+    clock.now += 2
+    assert limiter.level("user") == 1
+    assert limiter.hit("user")
+    assert limiter.hit("user")
+    assert not limiter.hit("user")
+
+
+def test_drained_buckets_are_evicted(clock):
+    limiter = RateLimiter(3, 1)
+    limiter.hit("user")
+    assert len(limiter) == 1
+
+    clock.now += 3
+    limiter.hit("other")
+    assert len(limiter) == 1
+    assert limiter.level("user") == 0
+
+
+def test_rate_must_be_positive():
+    with pytest.raises(ValueError):
+        RateLimiter(3, 0)